@@ -0,0 +1,24 @@
+# -*- coding: utf-8 -*-
+########################################################################
+# exsim - Exchange Simulator
+# Copyright (C) 2016-2023, zeroXone.
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see http://www.gnu.org/licenses/
+#
+########################################################################
+
+# Benchmarks for exsim.  These are not part of the installed package:
+# run them from a source tree, eg.
+#
+#     python -m benchmarks.order_path --sessions 8 --rate 20000
@@ -0,0 +1,187 @@
+# -*- coding: utf-8 -*-
+########################################################################
+# exsim - Exchange Simulator
+# Copyright (C) 2016-2023, zeroXone.
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see http://www.gnu.org/licenses/
+#
+########################################################################
+
+# Latency histogram, in the style of HdrHistogram: values are counted
+# in buckets whose width grows with the value, so every recorded value
+# is accurate to a fixed number of significant figures, with a bounded
+# number of buckets however wide the range.
+#
+# Values below 2 ** sub_bucket_bits are counted exactly.  Above that,
+# each power of two is split into 2 ** (sub_bucket_bits - 1) equal
+# sub-buckets, so the width of a bucket is never more than 1 part in
+# 2 ** (sub_bucket_bits - 1) of its value.  For three significant
+# figures, that's 1 part in 1024.
+#
+# Percentiles are reported as the highest value in the bucket, as
+# HdrHistogram does, so they never understate latency.
+
+import math
+import typing
+
+
+class Histogram:
+    """Log-linear histogram of non-negative integer values."""
+
+    def __init__(self, significant_figures: int = 3):
+        """Constructor.
+
+        :param significant_figures: Precision of recorded values, from
+            one to five decimal digits."""
+        if not 1 <= significant_figures <= 5:
+            raise ValueError("Bad significant figures: %s" %
+                             significant_figures)
+
+        self._significant_figures = significant_figures
+        self._sub_bucket_bits = \
+            math.ceil(math.log2(2 * 10 ** significant_figures))
+        self._sub_bucket_count = 1 << self._sub_bucket_bits
+        self._half_count = self._sub_bucket_count >> 1
+
+        # Map of bucket index to count.
+        self._counts: typing.Dict[int, int] = {}
+        self._total = 0
+        self._sum = 0
+        self._min = None
+        self._max = None
+        return
+
+    def significant_figures(self) -> int:
+        """Return the precision of recorded values."""
+        return self._significant_figures
+
+    def _index(self, value: int) -> int:
+        """(Internal) Return the bucket index for a value."""
+        if value < self._sub_bucket_count:
+            return value
+        shift = value.bit_length() - self._sub_bucket_bits
+        return self._sub_bucket_count + (shift - 1) * self._half_count + \
+            (value >> shift) - self._half_count
+
+    def _highest(self, index: int) -> int:
+        """(Internal) Return the highest value counted by a bucket."""
+        if index < self._sub_bucket_count:
+            return index
+        shift, offset = divmod(index - self._sub_bucket_count,
+                               self._half_count)
+        shift += 1
+        return ((offset + self._half_count) << shift) + (1 << shift) - 1
+
+    def record(self, value: int, count: int = 1):
+        """Count a value.
+
+        :param value: Non-negative integer, eg. a latency in nanoseconds.
+        :param count: Number of times to count it."""
+        if value < 0:
+            raise ValueError("Can't record negative value: %s" % value)
+
+        index = self._index(value)
+        self._counts[index] = self._counts.get(index, 0) + count
+        self._total += count
+        self._sum += value * count
+        if self._min is None or value < self._min:
+            self._min = value
+        if self._max is None or value > self._max:
+            self._max = value
+        return
+
+    def merge(self, other: "Histogram"):
+        """Add another histogram's counts to this one.
+
+        :param other: Histogram with the same precision."""
+        if other._significant_figures != self._significant_figures:
+            raise ValueError("Can't merge histograms of different precision")
+
+        for index, count in other._counts.items():
+            self._counts[index] = self._counts.get(index, 0) + count
+        self._total += other._total
+        self._sum += other._sum
+        for value in (other._min, other._max):
+            if value is not None:
+                if self._min is None or value < self._min:
+                    self._min = value
+                if self._max is None or value > self._max:
+                    self._max = value
+        return
+
+    def count(self) -> int:
+        """Return the number of values recorded."""
+        return self._total
+
+    def min(self) -> int:
+        """Return the smallest value recorded, or zero if none."""
+        return self._min or 0
+
+    def max(self) -> int:
+        """Return the largest value recorded, or zero if none."""
+        return self._max or 0
+
+    def mean(self) -> float:
+        """Return the mean of the values recorded, or zero if none."""
+        return self._sum / self._total if self._total else 0.0
+
+    def percentile(self, percentile: float) -> int:
+        """Return the value at or below which a percentage of values lie.
+
+        :param percentile: Percentage, from 0 to 100."""
+        if not self._total:
+            return 0
+
+        target = max(1, math.ceil(self._total * percentile / 100.0))
+        seen = 0
+        for index in sorted(self._counts):
+            seen += self._counts[index]
+            if seen >= target:
+                return min(self._highest(index), self._max)
+        return self._max
+
+    def summary(self, scale: float = 1.0) -> typing.Dict[str, float]:
+        """Return the usual statistics, as a dictionary.
+
+        :param scale: Divisor for reported values, eg. 1000 to report
+            nanosecond values in microseconds."""
+        summary = {"count": self._total,
+                   "min": self.min() / scale,
+                   "mean": self.mean() / scale}
+        for name, percentile in (("p50", 50.0), ("p90", 90.0),
+                                 ("p99", 99.0), ("p99.9", 99.9),
+                                 ("p99.99", 99.99)):
+            summary[name] = self.percentile(percentile) / scale
+        summary["max"] = self.max() / scale
+        return summary
+
+    def to_dict(self) -> dict:
+        """Return the histogram's state, as JSON-compatible values."""
+        return {"significant_figures": self._significant_figures,
+                "counts": sorted(self._counts.items()),
+                "sum": self._sum,
+                "min": self._min,
+                "max": self._max}
+
+    @classmethod
+    def from_dict(cls, state: dict) -> "Histogram":
+        """Return a histogram restored from to_dict()'s result."""
+        histogram = cls(state["significant_figures"])
+        for index, count in state["counts"]:
+            histogram._counts[index] = count
+            histogram._total += count
+        histogram._sum = state["sum"]
+        histogram._min = state["min"]
+        histogram._max = state["max"]
+        return histogram
@@ -0,0 +1,402 @@
+# -*- coding: utf-8 -*-
+########################################################################
+# exsim - Exchange Simulator
+# Copyright (C) 2016-2023, zeroXone.
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see http://www.gnu.org/licenses/
+#
+########################################################################
+
+# Micro-benchmarks for the hot paths of the order flow, to show which
+# component moved when the end-to-end numbers change.
+#
+# Each benchmark's setup function is given a seeded random source, and
+# returns a function to time, and the number of operations it performs
+# per call.  The runner calls the function for a warmup period, picks
+# a loop count giving samples of at least --min-time seconds, and then
+# takes --repeat samples, with the garbage collector disabled, as
+# timeit does.  Results are reported as nanoseconds per operation.
+#
+# Pin the process to a CPU (--cpu) and save results with --output, and
+# then compare two runs:
+#
+#     python -m benchmarks.micro --cpu 2 --output before.json
+#     python -m benchmarks.micro --cpu 2 --output after.json
+#     python -m benchmarks.micro --compare before.json after.json
+#
+# A change is only reported as faster or slower if it's larger than
+# the threshold, and larger than the spread of samples in either run.
+
+import argparse
+import datetime
+import gc
+import json
+import os
+import platform
+import random
+import statistics
+import sys
+import time
+import typing
+
+import exsim
+from exsim.book import Book
+from exsim.fix_encoder import FixEncoder
+from exsim.fix_protocol import FixProtocol
+from exsim.mgmt_codec import MessageReader, encode_message, validate_request
+from exsim.side import Side
+
+
+# Map of benchmark name to setup function.
+BENCHMARKS: typing.Dict[str, typing.Callable] = {}
+
+# Operations per call, for the book and parser benchmarks.
+BATCH_SIZE = 1000
+
+
+def benchmark(name: str):
+    """Decorator registering a benchmark setup function."""
+    def register(setup):
+        BENCHMARKS[name] = setup
+        return setup
+    return register
+
+
+class _NullSession:
+    """(Internal) Session for a protocol, discarding sent data."""
+
+    def send(self, data: bytes):
+        return
+
+
+def _new_order(rng: random.Random, index: int) -> bytes:
+    """(Internal) Return an encoded NewOrderSingle."""
+    body = b"11=%d\x0155=ABC\x0154=%d\x0140=2\x0138=%d\x0144=%.2f\x01" % \
+        (index, rng.choice((1, 2)), rng.randint(1, 10) * 100,
+         rng.randint(9000, 11000) / 100.0)
+    return FixEncoder("CLIENT", "EXSIM").encode(
+        b"D", index, b"20230102-13:14:15.678", body)
+
+
+@benchmark("fix_receive")
+def fix_receive(rng: random.Random):
+    """Frame and decode a buffer of NewOrderSingle messages."""
+    data = b"".join(_new_order(rng, i) for i in range(BATCH_SIZE))
+    protocol = FixProtocol(_NullSession())
+
+    def run():
+        protocol.receive(data)
+    return run, BATCH_SIZE
+
+
+def _order_report(rng: random.Random) -> dict:
+    """(Internal) Return an engine order report."""
+    quantity = rng.randint(1, 10) * 100
+    return {"type": "order_ack",
+            "order_id": rng.randint(1, 1 << 40),
+            "client_order_id": "%d" % rng.randint(1, 1 << 30),
+            "symbol": "ABC",
+            "side": Side.BUY,
+            "order_type": "limit",
+            "quantity": quantity,
+            "price": rng.randint(9000, 11000) / 100.0,
+            "leaves_quantity": quantity,
+            "cum_quantity": 0}
+
+
+@benchmark("fix_encode")
+def fix_encode(rng: random.Random):
+    """Encode a pre-formatted ExecutionReport body."""
+    protocol = FixProtocol(_NullSession())
+    body = protocol.execution_report_body(_order_report(rng), b"0", b"0",
+                                          b"R1")
+    encoder = FixEncoder("EXSIM", "CLIENT")
+    sending_time = b"20230102-13:14:15.678"
+
+    def run():
+        encoder.encode(b"8", 1234, sending_time, body)
+    return run, 1
+
+
+@benchmark("fix_execution_report")
+def fix_execution_report(rng: random.Random):
+    """Format and encode an order acknowledgement."""
+    protocol = FixProtocol(_NullSession())
+    report = _order_report(rng)
+
+    def run():
+        protocol.send_order_ack(report)
+    return run, 1
+
+
+def _orders(rng: random.Random, side: int,
+            low: int, high: int) -> typing.List[tuple]:
+    """(Internal) Return order parameters with random prices."""
+    return [(side, rng.randint(1, 10) * 100, rng.randint(low, high))
+            for _ in range(BATCH_SIZE)]
+
+
+@benchmark("side_add_cancel")
+def side_add_cancel(rng: random.Random):
+    """Rest orders at random prices on one side, then cancel them."""
+    book = Book("ABC")
+    store = book.store
+    side = book.bids
+    orders = _orders(rng, Side.BUY, 9000, 10000)
+
+    def run():
+        handles = []
+        for side_, quantity, price in orders:
+            handle = store.allocate("", None, "ABC", side_, "", 0,
+                                    quantity, price)
+            side.add_order(handle)
+            handles.append(handle)
+        rng.shuffle(handles)
+        for handle in handles:
+            side.cancel_order(handle)
+            store.release(handle)
+    return run, BATCH_SIZE
+
+
+@benchmark("book_match")
+def book_match(rng: random.Random):
+    """Match aggressive orders against a book of resting orders."""
+    book = Book("ABC")
+    store = book.store
+    resting = _orders(rng, Side.SELL, 10000, 10100)
+    aggressive = _orders(rng, Side.BUY, 10100, 10100)
+
+    def run():
+        handles = []
+        for side, quantity, price in resting:
+            handle = store.allocate("", None, "ABC", side, "", 0,
+                                    quantity, price)
+            book.add_order(handle)
+            handles.append(handle)
+        for side, quantity, price in aggressive:
+            handle = store.allocate("", None, "ABC", side, "", 0,
+                                    quantity, price)
+            book.add_order(handle)
+            handles.append(handle)
+        book.cancel_all_orders()
+        for handle in handles:
+            store.release(handle)
+    return run, BATCH_SIZE
+
+
+@benchmark("manager_decode")
+def manager_decode(rng: random.Random):
+    """Decode and validate a buffer of management requests."""
+    data = b"".join(encode_message({"type": "get_book",
+                                    "id": i,
+                                    "engine": "e%d" % rng.randint(1, 10),
+                                    "symbol": "ABC"})
+                    for i in range(BATCH_SIZE))
+
+    def run():
+        reader = MessageReader()
+        reader.append_buffer(data)
+        for message in reader.get_messages():
+            validate_request(message)
+    return run, BATCH_SIZE
+
+
+def pin_cpu(cpu: int) -> bool:
+    """Restrict this process to one CPU.
+
+    :param cpu: CPU number.
+    :returns: False if the platform doesn't support it."""
+    if not hasattr(os, "sched_setaffinity"):
+        return False
+    os.sched_setaffinity(0, {cpu})
+    return True
+
+
+def measure(function: typing.Callable, operations: int, warmup: float,
+            repeat: int, min_time: float) -> dict:
+    """Time a benchmark function.
+
+    :param function: Function to call.
+    :param operations: Operations per call.
+    :param warmup: Seconds to run before timing.
+    :param repeat: Number of samples.
+    :param min_time: Minimum seconds per sample.
+    :returns: Dictionary of nanoseconds per operation statistics."""
+    deadline = time.perf_counter() + warmup
+    while True:
+        function()
+        if time.perf_counter() >= deadline:
+            break
+
+    # Calibrate the number of calls per sample.
+    loops = 1
+    while True:
+        start = time.perf_counter()
+        for _ in range(loops):
+            function()
+        if time.perf_counter() - start >= min_time:
+            break
+        loops *= 2
+
+    samples = []
+    gc_enabled = gc.isenabled()
+    gc.disable()
+    try:
+        for _ in range(repeat):
+            start = time.perf_counter_ns()
+            for _ in range(loops):
+                function()
+            elapsed = time.perf_counter_ns() - start
+            samples.append(elapsed / (loops * operations))
+    finally:
+        if gc_enabled:
+            gc.enable()
+
+    return {"median": statistics.median(samples),
+            "min": min(samples),
+            "max": max(samples),
+            "stdev": statistics.stdev(samples) if repeat > 1 else 0.0,
+            "loops": loops,
+            "operations": operations,
+            "samples": samples}
+
+
+def run(names: typing.List[str], seed: int = 1, warmup: float = 1.0,
+        repeat: int = 10, min_time: float = 0.1,
+        cpu: typing.Optional[int] = None) -> dict:
+    """Run benchmarks.
+
+    :param names: Names of benchmarks to run.
+    :param seed: Random seed, for each benchmark's setup.
+    :param warmup: Seconds to run each before timing.
+    :param repeat: Number of samples of each.
+    :param min_time: Minimum seconds per sample.
+    :param cpu: CPU to pin the process to, or None.
+    :returns: Results dictionary, as written to the JSON output."""
+    if cpu is not None and not pin_cpu(cpu):
+        print("CPU pinning not supported on this platform", file=sys.stderr)
+        cpu = None
+
+    results = {}
+    for name in names:
+        function, operations = BENCHMARKS[name](random.Random(seed))
+        results[name] = measure(function, operations, warmup, repeat,
+                                min_time)
+
+    return {"benchmark": "micro",
+            "exsim_version": exsim.VERSION,
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "time": datetime.datetime.now(datetime.timezone.utc).isoformat(),
+            "config": {"seed": seed,
+                       "warmup": warmup,
+                       "repeat": repeat,
+                       "min_time": min_time,
+                       "cpu": cpu},
+            "results": results}
+
+
+def compare(base: dict, new: dict, threshold: float = 5.0) -> \
+        typing.List[typing.Tuple[str, float, float, float, str]]:
+    """Compare two runs' results.
+
+    :param base: Results of the earlier run.
+    :param new: Results of the later run.
+    :param threshold: Smallest change reported, as a percentage.
+    :returns: List of (name, base, new, change, verdict), where base
+        and new are median nanoseconds per operation, change is a
+        percentage, and verdict is "faster", "slower" or "same"."""
+    rows = []
+    for name, before in base["results"].items():
+        after = new["results"].get(name)
+        if after is None:
+            continue
+
+        change = (after["median"] - before["median"]) / \
+            before["median"] * 100.0
+        noise = max(before["stdev"] / before["median"],
+                    after["stdev"] / after["median"]) * 100.0
+        if abs(change) < max(threshold, noise):
+            verdict = "same"
+        else:
+            verdict = "slower" if change > 0 else "faster"
+        rows.append((name, before["median"], after["median"], change,
+                     verdict))
+    return rows
+
+
+def report(results: dict, out=sys.stdout):
+    """Print a run's results."""
+    print(f"{'benchmark':<24}{'ns/op':>12}{'min':>12}{'stdev':>10}",
+          file=out)
+    for name, result in results["results"].items():
+        print(f"{name:<24}{result['median']:>12.1f}{result['min']:>12.1f}"
+              f"{result['stdev']:>10.1f}", file=out)
+    return
+
+
+def main(argv: typing.Optional[typing.List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(
+        prog="python -m benchmarks.micro",
+        description="Time the order path's components.")
+    parser.add_argument("names", nargs="*",
+                        help="benchmarks to run (default: all of: %s)" %
+                             ", ".join(BENCHMARKS))
+    parser.add_argument("--seed", type=int, default=1,
+                        help="random seed (default: 1)")
+    parser.add_argument("--warmup", type=float, default=1.0,
+                        help="seconds to run before timing (default: 1)")
+    parser.add_argument("--repeat", type=int, default=10,
+                        help="samples per benchmark (default: 10)")
+    parser.add_argument("--min-time", type=float, default=0.1,
+                        help="minimum seconds per sample (default: 0.1)")
+    parser.add_argument("--cpu", type=int,
+                        help="pin the process to this CPU")
+    parser.add_argument("--output", help="write results to JSON file")
+    parser.add_argument("--compare", nargs=2, metavar=("BASE", "NEW"),
+                        help="compare two JSON result files, and exit "
+                             "with status 1 if any benchmark is slower")
+    parser.add_argument("--threshold", type=float, default=5.0,
+                        help="smallest change reported by --compare, "
+                             "as a percentage (default: 5)")
+    args = parser.parse_args(argv)
+
+    if args.compare:
+        with open(args.compare[0]) as f:
+            base = json.load(f)
+        with open(args.compare[1]) as f:
+            new = json.load(f)
+
+        rows = compare(base, new, args.threshold)
+        print(f"{'benchmark':<24}{'base':>12}{'new':>12}{'change':>10}")
+        for name, before, after, change, verdict in rows:
+            print(f"{name:<24}{before:>12.1f}{after:>12.1f}"
+                  f"{change:>+9.1f}%  {verdict}")
+        return 1 if any(row[4] == "slower" for row in rows) else 0
+
+    unknown = [name for name in args.names if name not in BENCHMARKS]
+    if unknown:
+        parser.error("unknown benchmark: %s" % ", ".join(unknown))
+
+    results = run(args.names or list(BENCHMARKS), args.seed, args.warmup,
+                  args.repeat, args.min_time, args.cpu)
+    report(results)
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=2)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
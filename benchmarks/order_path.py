@@ -0,0 +1,465 @@
+# -*- coding: utf-8 -*-
+########################################################################
+# exsim - Exchange Simulator
+# Copyright (C) 2016-2023, zeroXone.
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see http://www.gnu.org/licenses/
+#
+########################################################################
+
+# End-to-end order path benchmark.
+#
+# A server process runs a DefaultEngine behind a FixProtocol endpoint,
+# and one or more client processes connect FIX sessions to it.  Each
+# session logs on, and then sends NewOrderSingle and OrderCancelRequest
+# messages, measuring the time from sending each request to receiving
+# the ExecutionReport that acknowledges it.
+#
+# Orders are limit orders, bought below and sold above the middle
+# price, so they rest on the book without matching; the benchmark
+# measures the request/acknowledgement path, and a cancel ratio
+# (default 0.5) keeps the book from growing without bound.
+#
+# With a target rate, requests are sent on a fixed schedule, and each
+# latency is measured from the time the request was scheduled rather
+# than the time it was actually sent, so a stalled server is charged
+# for the requests it delayed ("coordinated omission").  With a rate
+# of zero, each session keeps a window of requests outstanding, and
+# sends a new one as each is acknowledged, to find the maximum
+# throughput.
+#
+# Results are printed, and optionally written as JSON, to compare
+# across releases:
+#
+#     python -m benchmarks.order_path --sessions 8 --rate 20000 \
+#         --duration 10 --output results.json
+
+import argparse
+import collections
+import datetime
+import json
+import os
+import platform
+import random
+import select
+import selectors
+import signal
+import socket
+import sys
+import time
+import typing
+
+import exsim
+from exsim.clock import FixClock
+from exsim.fix_encoder import FixEncoder
+from exsim.fix_framer import FixFramer
+
+from .histogram import Histogram
+
+
+SYMBOL = b"ABC"
+MIDDLE_PRICE = 100
+
+# Request kinds, reported separately.
+NEW = "new"
+CANCEL = "cancel"
+
+# Time allowed for outstanding replies after sending stops.
+DRAIN_TIME = 2.0
+
+
+def _free_port() -> int:
+    """(Internal) Return a currently unused TCP port number."""
+    with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def _run_server(port: int):
+    """(Internal) Server process main function.
+
+    :param port: Port number for the FIX endpoint."""
+    try:
+        server = exsim.Server(management=False)
+        server.create_engine("bench", "default")
+        server.start_engine("bench")
+        server.create_endpoint("fix", port, "fix42", "bench")
+        server.run()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        os._exit(0)
+
+
+class Client:
+    """One FIX session, driven by a client process."""
+
+    def __init__(self, index: int, port: int, rng: random.Random,
+                 cancel_ratio: float):
+        """Constructor.
+
+        :param index: Number of this session, unique across processes.
+        :param port: Server's FIX endpoint port.
+        :param rng: Random source, for the order mix.
+        :param cancel_ratio: Proportion of requests that are cancels."""
+        self._comp_id = "BENCH%d" % index
+        self._rng = rng
+        self._cancel_ratio = cancel_ratio
+
+        self.socket = socket.create_connection(("127.0.0.1", port))
+        self.socket.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        self._framer = FixFramer(validate_checksum=False)
+        self._encoder = FixEncoder(self._comp_id, "EXSIM")
+        self._clock = FixClock()
+        self._sequence = 0
+        self._next_id = 0
+
+        # Map of ClOrdID to (kind, start time) for unacknowledged
+        # requests, and acknowledged orders available to cancel.
+        self.pending: typing.Dict[bytes, typing.Tuple[str, int]] = {}
+        self._resting: typing.Deque[typing.Tuple[bytes, int]] = \
+            collections.deque()
+
+        self.sent = 0
+        self.errors = 0
+        return
+
+    def logon(self):
+        """Log on, and wait for the server's Logon reply."""
+        self._send(b"A", b"98=0\x01108=30\x01")
+        while True:
+            data = self.socket.recv(65536)
+            if not data:
+                raise ConnectionError("Server closed session during logon")
+            self._framer.append_buffer(data)
+            frame = self._framer.get_frame()
+            if frame is not None and frame.message_type == b"A":
+                break
+        self.socket.setblocking(False)
+        return
+
+    def _send(self, message_type: bytes, body: bytes):
+        """(Internal) Encode and send a message."""
+        self._sequence += 1
+        data = self._encoder.encode(message_type, self._sequence,
+                                    self._clock.now(), body)
+        view = memoryview(data)
+        while view:
+            try:
+                view = view[self.socket.send(view):]
+            except BlockingIOError:
+                # The server is behind: wait for it, as a client would.
+                select.select((), (self.socket,), (), 1.0)
+        return
+
+    def send_request(self, start: int):
+        """Send the next request.
+
+        :param start: Time from which its latency is measured."""
+        self._next_id += 1
+        client_order_id = b"%d" % self._next_id
+
+        if self._resting and self._rng.random() < self._cancel_ratio:
+            original_id, side = self._resting.popleft()
+            self._send(b"F", b"11=%s\x0141=%s\x0155=%s\x0154=%d\x01" %
+                       (client_order_id, original_id, SYMBOL, side))
+            self.pending[client_order_id] = (CANCEL, start)
+        else:
+            side = self._rng.choice((1, 2))
+            offset = self._rng.randint(1, 50) / 100.0
+            price = MIDDLE_PRICE - offset if side == 1 \
+                else MIDDLE_PRICE + offset
+            self._send(b"D", b"11=%s\x0155=%s\x0154=%d\x0140=2\x01"
+                             b"38=100\x0144=%.2f\x0159=0\x01" %
+                       (client_order_id, SYMBOL, side, price))
+            self.pending[client_order_id] = (NEW, start)
+        self.sent += 1
+        return
+
+    def receive(self) -> typing.List[typing.Tuple[str, int]]:
+        """Read replies.
+
+        :returns: List of (kind, start time) for acknowledged requests."""
+        try:
+            data = self.socket.recv(262144)
+        except BlockingIOError:
+            return []
+        if not data:
+            raise ConnectionError("Server closed session")
+
+        self._framer.append_buffer(data)
+        acknowledged = []
+        for frame in self._framer.get_frames():
+            if frame.message_type != b"8" and \
+                    frame.message_type != b"9":
+                continue
+
+            request = self.pending.pop(frame.get(11), None)
+            if request is None:
+                continue
+
+            exec_type = frame.get(150)
+            if frame.message_type == b"9" or exec_type == b"8":
+                self.errors += 1
+            elif exec_type == b"0":
+                self._resting.append((frame.get(11),
+                                      int(frame.get(54) or 1)))
+            acknowledged.append(request)
+        return acknowledged
+
+
+def _run_clients(first: int, count: int, port: int, args,
+                 start_time: float) -> dict:
+    """(Internal) Drive a group of sessions, and return their results.
+
+    :param first: Index of the first session.
+    :param count: Number of sessions.
+    :param port: Server's FIX endpoint port.
+    :param args: Command line arguments.
+    :param start_time: time.time() at which to start sending."""
+    clients = [Client(first + i, port, random.Random(args.seed + first + i),
+                      args.cancel_ratio)
+               for i in range(count)]
+    for client in clients:
+        client.logon()
+
+    selector = selectors.DefaultSelector()
+    for client in clients:
+        selector.register(client.socket, selectors.EVENT_READ, client)
+
+    histograms = {NEW: Histogram(), CANCEL: Histogram()}
+    received = 0
+
+    # Align all processes to the same wall clock start time, then
+    # switch to the monotonic clock.
+    time.sleep(max(0.0, start_time - time.time()))
+    now = time.perf_counter_ns()
+    measure_from = now + int(args.warmup * 1e9)
+    stop_at = measure_from + int(args.duration * 1e9)
+
+    rate = args.rate * count / args.sessions
+    interval = int(1e9 / rate) if rate else 0
+    next_due = now
+    turn = 0
+
+    if not interval:
+        for client in clients:
+            for _ in range(args.window):
+                client.send_request(time.perf_counter_ns())
+
+    deadline = stop_at
+    sending = True
+    while True:
+        now = time.perf_counter_ns()
+        if sending and now >= stop_at:
+            sending = False
+            deadline = now + int(DRAIN_TIME * 1e9)
+        if not sending and \
+                (now >= deadline or not any(c.pending for c in clients)):
+            break
+
+        if sending and interval:
+            while next_due <= now:
+                clients[turn].send_request(next_due)
+                turn = (turn + 1) % count
+                next_due += interval
+            timeout = (next_due - now) / 1e9
+        else:
+            timeout = 0.01
+
+        for key, _ in selector.select(timeout):
+            client = key.data
+            for kind, start in client.receive():
+                end = time.perf_counter_ns()
+                received += 1
+                if start >= measure_from:
+                    histograms[kind].record(end - start)
+                if sending and not interval:
+                    client.send_request(end)
+
+    for client in clients:
+        client.socket.close()
+
+    return {"sent": sum(c.sent for c in clients),
+            "received": received,
+            "errors": sum(c.errors for c in clients),
+            "unacknowledged": sum(len(c.pending) for c in clients),
+            "histograms": {kind: h.to_dict()
+                           for kind, h in histograms.items()}}
+
+
+def _fork_clients(first: int, count: int, port: int, args,
+                  start_time: float) -> typing.Tuple[int, int]:
+    """(Internal) Start a client process.
+
+    :returns: Tuple of process id, and file descriptor for results."""
+    read_fd, write_fd = os.pipe()
+    pid = os.fork()
+    if pid == 0:
+        os.close(read_fd)
+        status = 1
+        try:
+            result = _run_clients(first, count, port, args, start_time)
+            with os.fdopen(write_fd, "w") as f:
+                json.dump(result, f)
+            status = 0
+        finally:
+            os._exit(status)
+
+    os.close(write_fd)
+    return pid, read_fd
+
+
+def _wait_for_port(port: int, timeout: float = 10.0):
+    """(Internal) Wait until a server is listening on a port."""
+    deadline = time.time() + timeout
+    while True:
+        try:
+            socket.create_connection(("127.0.0.1", port)).close()
+            return
+        except ConnectionRefusedError:
+            if time.time() > deadline:
+                raise
+            time.sleep(0.05)
+
+
+def run(args) -> dict:
+    """Run the benchmark.
+
+    :param args: Parsed command line arguments.
+    :returns: Results dictionary, as written to the JSON output."""
+    port = args.port or _free_port()
+    server_pid = os.fork()
+    if server_pid == 0:
+        _run_server(port)
+
+    try:
+        _wait_for_port(port)
+
+        processes = min(args.processes or os.cpu_count() or 1,
+                        args.sessions)
+        start_time = time.time() + 0.5 + 0.01 * args.sessions
+        children = []
+        first = 0
+        for i in range(processes):
+            count = args.sessions // processes + \
+                (1 if i < args.sessions % processes else 0)
+            children.append(_fork_clients(first, count, port, args,
+                                          start_time))
+            first += count
+
+        results = []
+        for pid, read_fd in children:
+            with os.fdopen(read_fd) as f:
+                data = f.read()
+            _, status = os.waitpid(pid, 0)
+            if status or not data:
+                raise RuntimeError("Client process %d failed" % pid)
+            results.append(json.loads(data))
+    finally:
+        os.kill(server_pid, signal.SIGINT)
+        os.waitpid(server_pid, 0)
+
+    histograms = {}
+    for kind in (NEW, CANCEL):
+        histogram = Histogram()
+        for result in results:
+            histogram.merge(Histogram.from_dict(result["histograms"][kind]))
+        histograms[kind] = histogram
+    overall = Histogram()
+    for histogram in histograms.values():
+        overall.merge(histogram)
+
+    return {"benchmark": "order_path",
+            "exsim_version": exsim.VERSION,
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "time": datetime.datetime.now(datetime.timezone.utc).isoformat(),
+            "config": {"sessions": args.sessions,
+                       "processes": len(results),
+                       "rate": args.rate,
+                       "window": args.window,
+                       "cancel_ratio": args.cancel_ratio,
+                       "duration": args.duration,
+                       "warmup": args.warmup,
+                       "seed": args.seed},
+            "sent": sum(r["sent"] for r in results),
+            "received": sum(r["received"] for r in results),
+            "errors": sum(r["errors"] for r in results),
+            "unacknowledged": sum(r["unacknowledged"] for r in results),
+            "throughput": overall.count() / args.duration,
+            "latency_us": {"all": overall.summary(1000.0),
+                           NEW: histograms[NEW].summary(1000.0),
+                           CANCEL: histograms[CANCEL].summary(1000.0)}}
+
+
+def report(results: dict, out=sys.stdout):
+    """Print a summary of the results."""
+    config = results["config"]
+    print(f"{config['sessions']} sessions, "
+          f"rate {config['rate'] or 'unlimited'}, "
+          f"{config['duration']} s: "
+          f"{results['throughput']:.0f} requests/s, "
+          f"{results['errors']} errors, "
+          f"{results['unacknowledged']} unacknowledged", file=out)
+
+    print(f"{'latency (us)':<12}" + "".join(
+        f"{name:>10}" for name in ("count", "p50", "p99", "p99.9", "max")),
+        file=out)
+    for kind, summary in results["latency_us"].items():
+        print(f"{kind:<12}{summary['count']:>10}" + "".join(
+            f"{summary[name]:>10.1f}"
+            for name in ("p50", "p99", "p99.9", "max")), file=out)
+    return
+
+
+def main(argv: typing.Optional[typing.List[str]] = None):
+    parser = argparse.ArgumentParser(
+        prog="python -m benchmarks.order_path",
+        description="Measure FIX order entry throughput and latency.")
+    parser.add_argument("--sessions", type=int, default=4,
+                        help="number of FIX sessions (default: 4)")
+    parser.add_argument("--processes", type=int, default=0,
+                        help="client processes (default: one per CPU, "
+                             "at most one per session)")
+    parser.add_argument("--rate", type=float, default=10000,
+                        help="total requests per second, or 0 for as "
+                             "fast as possible (default: 10000)")
+    parser.add_argument("--window", type=int, default=1,
+                        help="requests outstanding per session, when "
+                             "rate is 0 (default: 1)")
+    parser.add_argument("--cancel-ratio", type=float, default=0.5,
+                        help="proportion of requests that cancel a "
+                             "resting order (default: 0.5)")
+    parser.add_argument("--duration", type=float, default=10.0,
+                        help="measured seconds (default: 10)")
+    parser.add_argument("--warmup", type=float, default=1.0,
+                        help="unmeasured seconds before that (default: 1)")
+    parser.add_argument("--seed", type=int, default=1,
+                        help="random seed for the order mix")
+    parser.add_argument("--port", type=int, default=0,
+                        help="FIX endpoint port (default: any free port)")
+    parser.add_argument("--output", help="write results to JSON file")
+    args = parser.parse_args(argv)
+
+    results = run(args)
+    report(results)
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=2)
+    return
+
+
+if __name__ == "__main__":
+    main()
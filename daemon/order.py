@@ -20,6 +20,11 @@
 
 
 class Order:
+    __slots__ = ("symbol", "suffix", "maturity_year", "maturity_month",
+                 "maturity_day", "put_or_call", "asset_class", "series",
+                 "order_type", "tif", "side", "order_quantity",
+                 "min_quantity", "remaining_quantity", "price", "stop_price")
+
     def __init__(self):
 
         self.symbol = ''
@@ -18,9 +18,37 @@
 #
 ########################################################################
 
-from .engine import Engine
-from .endpoint import Endpoint
-from .manager import Manager
-from .server import Server
-from .session import Session
+# Public classes are imported from their modules on first use, so that
+# importing one part of the package (eg. the client API) doesn't import
+# the whole server.
+
+import importlib
+
 from .version import VERSION
+
+
+_LAZY = {
+    "AsyncServer": "async_server",
+    "Engine": "engine",
+    "Endpoint": "endpoint",
+    "Manager": "manager",
+    "Server": "server",
+    "Session": "session",
+    "ShardedServer": "shard",
+}
+
+__all__ = sorted(_LAZY) + ["VERSION"]
+
+
+def __getattr__(name: str):
+    module_name = _LAZY.get(name)
+    if module_name is None:
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+    value = getattr(importlib.import_module("." + module_name, __name__), name)
+    globals()[name] = value
+    return value
+
+
+def __dir__():
+    return sorted(set(globals()) | set(_LAZY))
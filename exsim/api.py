@@ -18,36 +18,69 @@
 #
 ########################################################################
 
+import concurrent.futures
 import exsim
+import functools
 import logging
 import os
-import pickle
 import signal
 import socket
-import struct
 import sys
+import threading
+import time
 import typing
 
+from . import log
+from .mgmt_codec import MessageReader, encode_message
+from .profiling import DEFAULT_SAMPLE_INTERVAL, DEFAULT_STALL_THRESHOLD
 
-logging.basicConfig(filename="xs.log", level=logging.DEBUG)
+
+logger = logging.getLogger("exsim.api")
+
+
+def __getattr__(name: str):
+    # AsyncAPI is imported on first use, to avoid importing asyncio.
+    if name == "AsyncAPI":
+        from .async_api import AsyncAPI
+        return AsyncAPI
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
 
 
 class API:
     """Exchange Simulator Client API."""
 
-    def __init__(self):
-        """Constructor."""
+    def __init__(self, pool_size: int = 0):
+        """Constructor.
+
+        :param pool_size: Number of server processes to start in
+            advance, so that create_server() can return one at once."""
         self._buffer = b''
         self._servers = {}
         self._connected = False
+
+        # Started, but not yet allocated, server processes.
+        self._pool_size = pool_size
+        self._pool: typing.List[typing.Tuple[int, socket.socket]] = []
+        self.fill_pool()
         return
 
     def delete(self):
         """Clean up this API instance."""
-        for server_proxy in self._servers:
+        for server_proxy in list(self._servers.values()):
             server_proxy.delete()
         self._servers = {}
         self._buffer = b''
+
+        self._pool_size = 0
+        for pid, sock in self._pool:
+            Server(self, "pool", sock, pid).delete()
+        self._pool = []
+        return
+
+    def fill_pool(self):
+        """Start server processes until the pool is full."""
+        while len(self._pool) < self._pool_size:
+            self._pool.append(self._fork_server())
         return
 
     def create_server(self, name: str = 'default'):
@@ -56,45 +89,84 @@ class API:
         :param name: String name to identify this server
 
         Normally, only one server instance is required, but when that's
-        not the case, the name is used to distinguish them."""
+        not the case, the name is used to distinguish them.
 
-        # Create pipe to receive TCP port number from child.
-        from_api_fd, to_api_fd = os.pipe()
+        If the API has a pool of server processes, one of those is used,
+        and is replaced when the server is deleted."""
 
-        # Fork server process off API.
-        pid = os.fork()
-        if pid == 0:
-            # Child (server)
+        if self._pool:
+            pid, sock = self._pool.pop()
+        else:
+            pid, sock = self._fork_server()
+        self._connected = True
+        logger.info("Connected")
 
-            # Make child process more daemon-like.
-            from_devnull = open("/dev/null", "r")
-            to_devnull = open("/dev/null", "w")
+        # Create server proxy class in API.
+        server_proxy = Server(self, name, sock, pid)
+        self._servers[name] = server_proxy
+        return server_proxy
 
-            # FIXME: closing these gets me a crash in pytest, writing to a closed file.
-            #sys.stderr.close()
-            #sys.stdout.close()
-            #sys.stdin.close()
+    def create_embedded_server(self, name: str = 'default'):
+        """Create an Exchange Simulator server in this process.
+
+        :param name: String name to identify this server
 
-            sys.stdin = from_devnull
-            sys.stdout = to_devnull
-            sys.stderr = to_devnull
+        The server runs in a background thread, and is controlled by
+        direct calls rather than over a management connection."""
+        server = EmbeddedServer(self, name)
+        self._servers[name] = server
+        return server
 
-            # Create main Server instance (not the API wrapper).
-            sim_server = exsim.Server()
+    def _fork_server(self) -> typing.Tuple[int, socket.socket]:
+        """(Internal) Start a server process, and connect to it.
 
-            # Return control port number to parent process.
-            port = sim_server.get_port()
-            os.close(from_api_fd)
-            to_api = os.fdopen(to_api_fd, 'w')
-            to_api.write(str(port))
-            to_api.flush()
-            to_api.close()
+        :returns: Tuple of server process id, and management socket."""
 
-            # Enter server mainloop.
-            sim_server.run()
+        # Create pipe to receive TCP port number from child.
+        from_api_fd, to_api_fd = os.pipe()
 
-            # Exit server process.
-            sys.exit(0)
+        # Fork server process off API.
+        pid = os.fork()
+        if pid == 0:
+            # Child (server)
+            try:
+                # Make child process more daemon-like.
+                from_devnull = open("/dev/null", "r")
+                to_devnull = open("/dev/null", "w")
+                sys.stdin = from_devnull
+                sys.stdout = to_devnull
+                sys.stderr = to_devnull
+
+                # Don't hold the parent's connections open.
+                for _, sock in self._pool:
+                    sock.close()
+                for server_proxy in self._servers.values():
+                    if isinstance(server_proxy, Server):
+                        server_proxy._socket.close()
+
+                # Server processes log to a file in the current directory,
+                # from a background thread.
+                log.start("xs.log")
+
+                # Create main Server instance (not the API wrapper).
+                sim_server = exsim.Server()
+
+                # Return control port number to parent process.
+                port = sim_server.get_port()
+                os.close(from_api_fd)
+                to_api = os.fdopen(to_api_fd, 'w')
+                to_api.write(str(port))
+                to_api.flush()
+                to_api.close()
+
+                # Enter server mainloop.
+                sim_server.run()
+            except KeyboardInterrupt:
+                pass
+            finally:
+                # Exit server process, without running any of the
+                # parent's cleanup (eg. a test runner's).
+                os._exit(0)
 
         # Wait to receive server's control port number.
         os.close(to_api_fd)
@@ -106,53 +178,14 @@ class API:
         # Connect to server.
         sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
         sock.connect(('127.0.0.1', port))
-        self._connected = True
-        logging.info("Connected")
-
-        # Create server proxy class in API.
-        server_proxy = Server(self, name, sock, pid)
-        self._servers[name] = server_proxy
-        return server_proxy
+        return pid, sock
 
     def delete_server(self, name):
-        server_proxy = self._servers.get(name)
+        server_proxy = self._servers.pop(name, None)
         if not server_proxy:
             raise KeyError(f"No such server: '{name}'")
         server_proxy.delete()
-        return
-
-    def create_endpoint(self, name, port):
-        request = {"type": "create_endpoint", "name": name, "port": port}
-        reply = {}
-        api._send(request, reply)
-
-        result = reply["result"]
-        if not result:
-            raise Exception(reply["message"])
-        return
-
-    def set_endpoint_engine(self, engine, endpoint):
-        request = {"type": "set_endpoint_engine",
-                   "engine": engine,
-                   "endpoint": endpoint}
-        reply = {}
-        api._send(request, reply)
-
-        result = reply["result"]
-        if not result:
-            raise Exception(reply["message"])
-        return
-
-    def set_endpoint_protocol(self, endpoint, protocol):
-        request = {"type": "set_endpoint_protocol",
-                   "endpoint": endpoint,
-                   "protocol": protocol}
-        reply = {}
-        api._send(request, reply)
-
-        result = reply["result"]
-        if not result:
-            raise Exception(reply["message"])
+        self.fill_pool()
         return
 
 
@@ -170,16 +203,67 @@ class Server:
         self._socket = sock
         self._child_pid = pid
 
-        self._buffer = b''
+        self._reader = MessageReader()
+        self._next_id = 1
+
+        # Replies received, by request id, for requests not yet claimed.
+        self._replies: typing.Dict[int, dict] = {}
+
+        # Called with each event message received, if set.
+        self._event_handler: typing.Optional[typing.Callable] = None
         return
 
-    def delete(self):
-        """Destroy this proxy wrapper, and its managed server process."""
-        os.kill(self._child_pid, signal.SIGINT)
-        pid, status = os.waitpid(self._child_pid, 0)
-        # FIXME: need to have a SIGKILL after a bit here?
+    def delete(self) -> int:
+        """Destroy this proxy wrapper, and its managed server process.
+
+        :returns: The server's exit status, as from os.waitpid()."""
+
+        # A KeyboardInterrupt raised while the server is running a
+        # finalizer is discarded, so repeat the SIGINT until it exits,
+        # and use SIGKILL if it doesn't exit within a few seconds.
+        deadline = time.time() + 5.0
+        while True:
+            os.kill(self._child_pid, signal.SIGINT)
+            pid, status = os.waitpid(self._child_pid, os.WNOHANG)
+            if pid:
+                break
+
+            if time.time() > deadline:
+                os.kill(self._child_pid, signal.SIGKILL)
+                _, status = os.waitpid(self._child_pid, 0)
+                break
+            time.sleep(0.1)
+
+        self._socket.close()
+        return status
+
+    def set_event_handler(self, handler: typing.Optional[typing.Callable]):
+        """Set a function to be called with each event from the server.
+
+        :param handler: Callable, taking the event message, or None.
+
+        Events arrive when the server has a subscription (see the
+        'subscribe' request), and are read along with replies, or by
+        poll().  They are discarded if there's no handler."""
+        self._event_handler = handler
         return
 
+    def poll(self) -> bool:
+        """Handle any messages already received, without waiting.
+
+        :returns: False if the connection was lost."""
+        try:
+            data = self._socket.recv(65536, socket.MSG_DONTWAIT)
+        except BlockingIOError:
+            return True
+
+        if len(data) == 0:
+            self._connected = False
+            return False
+
+        self._received(data)
+        return True
+
     def load_protocol(self, name, module, klass):
         request = {"type": "load_protocol",
                    "name": name,
@@ -193,11 +277,27 @@ class Server:
             raise Exception(reply["message"])
         return
 
-    def create_engine(self, name: str):
+    def load_engine(self, name, module, klass):
+        request = {"type": "load_engine",
+                   "name": name,
+                   "module": module,
+                   "class": klass}
+        reply = {}
+        self._send(request, reply)
+
+        result = reply["result"]
+        if not result:
+            raise Exception(reply["message"])
+        return
+
+    def create_engine(self, name: str, engine_type: str):
         """Request server to create a new simulated matching engine.
 
-        :param name: String name to identify the matching engine."""
-        request = {'type': 'create_engine', 'name': name}
+        :param name: String name to identify the matching engine.
+        :param engine_type: Name of a loaded engine type."""
+        request = {'type': 'create_engine',
+                   'name': name,
+                   'engine_type': engine_type}
         reply = {}
         self._send(request, reply)
 
@@ -220,44 +320,611 @@ class Server:
             raise Exception(reply["message"])
         return
 
+    def start_engine(self, name: str) -> bool:
+        """Request server to start a simulated matching engine.
+
+        :param name: String name to identify the matching engine.
+        :returns: False if the engine was already running."""
+        request = {"type": "start_engine", "name": name}
+        reply = {}
+        self._send(request, reply)
+
+        result = reply["result"]
+        if not result:
+            raise Exception(reply["message"])
+        return reply["changed"]
+
+    def stop_engine(self, name: str) -> bool:
+        """Request server to stop a simulated matching engine.
+
+        :param name: String name to identify the matching engine.
+        :returns: False if the engine was already stopped."""
+        request = {"type": "stop_engine", "name": name}
+        reply = {}
+        self._send(request, reply)
+
+        result = reply["result"]
+        if not result:
+            raise Exception(reply["message"])
+        return reply["changed"]
+
+    def set_engine_property(self, name: str, property_name: str, value):
+        """Request server to configure a simulated matching engine.
+
+        :param name: String name to identify the matching engine.
+        :param property_name: Name of a property of the engine's type.
+        :param value: New value, of a JSON-compatible type."""
+        request = {"type": "set_engine_property",
+                   "name": name,
+                   "property": property_name,
+                   "value": value}
+        reply = {}
+        self._send(request, reply)
+
+        result = reply["result"]
+        if not result:
+            raise Exception(reply["message"])
+        return
+
+    def create_endpoint(self, name: str, port: int, protocol: str,
+                        engine: str, **options) -> int:
+        """Request server to create a listening endpoint.
+
+        :param name: String name to identify the endpoint.
+        :param port: TCP port number, or zero for any free port.
+        :param protocol: Name of a loaded protocol.
+        :param engine: Name of the engine that sessions are attached to.
+        :param options: Optional role, queue_size and policy, as for
+            exsim.endpoint.Endpoint.
+        :returns: Listening port number."""
+        request = dict(options,
+                       type="create_endpoint",
+                       name=name,
+                       port=port,
+                       protocol=protocol,
+                       engine=engine)
+        reply = {}
+        self._send(request, reply)
+
+        result = reply["result"]
+        if not result:
+            raise Exception(reply["message"])
+        return reply["port"]
+
+    def delete_endpoint(self, name: str):
+        """Request server to delete a listening endpoint.
+
+        :param name: String name to identify the endpoint."""
+        request = {"type": "delete_endpoint", "name": name}
+        reply = {}
+        self._send(request, reply)
+
+        result = reply["result"]
+        if not result:
+            raise Exception(reply["message"])
+        return
+
+    def set_endpoint_property(self, name: str, property_name: str, value):
+        """Request server to configure a listening endpoint.
+
+        :param name: String name to identify the endpoint.
+        :param property_name: Name of a property of the endpoint.
+        :param value: New value, of a JSON-compatible type."""
+        request = {"type": "set_endpoint_property",
+                   "name": name,
+                   "property": property_name,
+                   "value": value}
+        reply = {}
+        self._send(request, reply)
+
+        result = reply["result"]
+        if not result:
+            raise Exception(reply["message"])
+        return
+
+    def get_book(self, engine: str, symbol: str, max_levels: int = 0):
+        """Return a snapshot of an engine's book for a symbol.
+
+        :param engine: String name to identify the matching engine.
+        :param symbol: Instrument symbol.
+        :param max_levels: Maximum number of levels per side, or zero
+            for all."""
+        request = {"type": "get_book",
+                   "engine": engine,
+                   "symbol": symbol,
+                   "max_levels": max_levels}
+        reply = {}
+        self._send(request, reply)
+
+        result = reply["result"]
+        if not result:
+            raise Exception(reply["message"])
+        return reply["book"]
+
+    def start_journal(self, path: str):
+        """Request server to record client session traffic.
+
+        :param path: Journal file name, on the server's host."""
+        request = {"type": "start_journal", "path": path}
+        reply = {}
+        self._send(request, reply)
+
+        result = reply["result"]
+        if not result:
+            raise Exception(reply["message"])
+        return
+
+    def stop_journal(self):
+        """Request server to stop recording, and close its journal."""
+        request = {"type": "stop_journal"}
+        reply = {}
+        self._send(request, reply)
+
+        result = reply["result"]
+        if not result:
+            raise Exception(reply["message"])
+        return
+
+    def get_metrics(self) -> dict:
+        """Return the server's metrics (see metrics.format_prometheus)."""
+        request = {"type": "get_metrics"}
+        reply = {}
+        self._send(request, reply)
+
+        result = reply["result"]
+        if not result:
+            raise Exception(reply["message"])
+        return reply["metrics"]
+
+    def start_metrics(self, port: int = 0) -> int:
+        """Request server to serve Prometheus metrics over HTTP.
+
+        :param port: TCP port number, or zero for any free port.
+        :returns: Listener's port number, on the server's host."""
+        request = {"type": "start_metrics", "port": port}
+        reply = {}
+        self._send(request, reply)
+
+        result = reply["result"]
+        if not result:
+            raise Exception(reply["message"])
+        return reply["port"]
+
+    def stop_metrics(self):
+        """Request server to stop serving metrics over HTTP."""
+        request = {"type": "stop_metrics"}
+        reply = {}
+        self._send(request, reply)
+
+        result = reply["result"]
+        if not result:
+            raise Exception(reply["message"])
+        return
+
+    def set_log_level(self, subsystem: str, level: str):
+        """Request server to change a logging subsystem's level.
+
+        :param subsystem: "exsim" for all subsystems, or one of
+            log.SUBSYSTEMS.
+        :param level: Level name, eg. "DEBUG"."""
+        request = {"type": "set_log_level",
+                   "subsystem": subsystem,
+                   "level": level}
+        reply = {}
+        self._send(request, reply)
+
+        result = reply["result"]
+        if not result:
+            raise Exception(reply["message"])
+        return
+
+    def get_log_levels(self) -> typing.Dict[str, str]:
+        """Return the server's level name for each logging subsystem."""
+        request = {"type": "get_log_levels"}
+        reply = {}
+        self._send(request, reply)
+
+        result = reply["result"]
+        if not result:
+            raise Exception(reply["message"])
+        return reply["levels"]
+
+    def start_watchdog(self, threshold: float = DEFAULT_STALL_THRESHOLD):
+        """Request server to record event loop dispatches that stall.
+
+        :param threshold: Dispatch time, in seconds, counted as a stall."""
+        request = {"type": "start_watchdog", "threshold": threshold}
+        reply = {}
+        self._send(request, reply)
+
+        result = reply["result"]
+        if not result:
+            raise Exception(reply["message"])
+        return
+
+    def get_stalls(self) -> dict:
+        """Return the stalls recorded by the server's watchdog.
+
+        See profiling.Watchdog.get_report() for the structure."""
+        request = {"type": "get_stalls"}
+        reply = {}
+        self._send(request, reply)
+
+        result = reply["result"]
+        if not result:
+            raise Exception(reply["message"])
+        return reply["stalls"]
+
+    def stop_watchdog(self) -> dict:
+        """Request server to stop recording stalls.
+
+        :returns: Stalls recorded, as for get_stalls()."""
+        request = {"type": "stop_watchdog"}
+        reply = {}
+        self._send(request, reply)
+
+        result = reply["result"]
+        if not result:
+            raise Exception(reply["message"])
+        return reply["stalls"]
+
+    def start_profile(self, mode: str = "cprofile",
+                      interval: float = DEFAULT_SAMPLE_INTERVAL):
+        """Request server to start profiling its event loop.
+
+        :param mode: "cprofile", to count every call, or "sampling", to
+            periodically sample the event loop's stack.
+        :param interval: Time between samples, in seconds, if sampling."""
+        request = {"type": "start_profile",
+                   "mode": mode,
+                   "interval": interval}
+        reply = {}
+        self._send(request, reply)
+
+        result = reply["result"]
+        if not result:
+            raise Exception(reply["message"])
+        return
+
+    def stop_profile(self) -> dict:
+        """Request server to stop profiling its event loop.
+
+        :returns: Profile (see profiling.Profiler.get_report())."""
+        request = {"type": "stop_profile"}
+        reply = {}
+        self._send(request, reply)
+
+        result = reply["result"]
+        if not result:
+            raise Exception(reply["message"])
+        return reply["profile"]
+
+    def batch(self) -> "Batch":
+        """Return a new, empty Batch of requests for this server.
+
+            with server.batch() as batch:
+                batch.create_engine("e1", "default")
+                batch.create_endpoint("ep1", 9001, "fix", "e1")
+        """
+        return Batch(self)
+
     def _send(self, request, reply):
         """(Internal) Make RPC to server process.
 
         :param request: Request dictionary.
-        :param reply: Empty dictionary to be populated with reply message."""
-
-        # Send request.
-        body = pickle.dumps(request)
-        header = struct.pack("<L", len(body))
-        self._socket.sendall(header + body)
-        logging.debug(f"Sent request to server {self._name}")
-
-        # Wait for reply.
-        while True:
-            data = self._socket.recv(8192)
-            logging.debug(f"Received {len(data)} bytes "
-                          f"from server '{self._name}'")
+        :param reply: Empty dictionary to be populated with reply message.
+        :returns: False if the connection was lost."""
+        replies = self._pipeline([request])
+        if replies is None:
+            return False
+
+        reply.update(replies[0])
+        return True
+
+    def pipeline(self, requests: typing.List[dict]) -> typing.List[dict]:
+        """Make several requests, without waiting for each reply.
+
+        :param requests: List of request dictionaries.
+        :returns: List of reply dictionaries, in request order."""
+        replies = self._pipeline(requests)
+        if replies is None:
+            raise ConnectionError(f"Lost connection to server {self._name}")
+        return replies
+
+    def _pipeline(self, requests: typing.List[dict]):
+        """(Internal) Make several RPCs to server process.
+
+        :param requests: List of request dictionaries.
+        :returns: List of replies, in request order, or None if the
+            connection was lost.
+
+        All the requests are sent before waiting for any reply."""
+        ids = []
+        data = []
+        for request in requests:
+            request = dict(request, id=self._next_id)
+            ids.append(self._next_id)
+            self._next_id += 1
+            data.append(encode_message(request))
+
+        self._socket.sendall(b"".join(data))
+        logger.debug("Sent %d requests to server %s", len(requests),
+                     self._name)
+
+        # Wait for replies.
+        while not all(i in self._replies for i in ids):
+            data = self._socket.recv(65536)
+            logger.debug("Received %d bytes from server '%s'", len(data),
+                         self._name)
             if len(data) == 0:
                 self._connected = False
-                # FIXME: set error in reply
-                return False
-
-            self._buffer += data
-            if len(self._buffer) < 4:
-                continue
-
-            length = struct.unpack("<L", self._buffer[:4])[0]
-            if len(self._buffer) < length + 4:
-                continue
-
-            tmp = pickle.loads(self._buffer[4:4+length])
-            reply.update(tmp)
-            self._buffer = self._buffer[4+length:]
-            if len(self._buffer) > 0:
-                # FIXME: report error
+                return None
+
+            self._received(data)
+
+        return [self._replies.pop(i) for i in ids]
+
+    def _received(self, data: bytes):
+        """(Internal) Decode messages received from the server.
+
+        Replies are kept until their request claims them, and events
+        are passed to the event handler."""
+        self._reader.append_buffer(data)
+        for message in self._reader.get_messages():
+            if "event" in message:
+                if self._event_handler is not None:
+                    self._event_handler(message)
+            else:
+                self._replies[message.get("id")] = message
+        return
+
+
+class EmbeddedServer:
+    """Simulator server running in a thread of this process.
+
+    Has the same interface as the Server proxy, but each request is a
+    direct call to the server's methods, made in the server's thread,
+    rather than a message over a management connection."""
+
+    def __init__(self, api: typing.Optional[API], name: str):
+        """Constructor.
+
+        :param api: Reference to owning API.
+        :param name: String name to identify this server"""
+        self._api = api
+        self._name = name
+
+        self._server = exsim.Server(management=False)
+        self._thread = threading.Thread(target=self._server.run,
+                                        name=f"exsim-{name}",
+                                        daemon=True)
+        self._thread.start()
+        return
+
+    def server(self) -> "exsim.Server":
+        """Return the underlying Server.
+
+        Its methods must only be called using call()."""
+        return self._server
+
+    def delete(self):
+        """Stop the server, and wait for its thread to exit."""
+        if self._thread.is_alive():
+            try:
+                self._server.call_soon_threadsafe(self._server.stop)
+            except ConnectionError:
+                # Exited while we checked.
                 pass
+        self._thread.join()
+        return
 
-            return True
+    def call(self, function, *args):
+        """Call a function in the server's thread, and return its result.
+
+        :param function: Callable, eg. a method of server().
+        :param args: Arguments for function.
+
+        Exceptions raised by the function are re-raised in the caller."""
+        if threading.current_thread() is self._thread:
+            return function(*args)
+
+        future = concurrent.futures.Future()
+
+        def run():
+            try:
+                future.set_result(function(*args))
+            except Exception as e:
+                future.set_exception(e)
+            return
+
+        if not self._thread.is_alive():
+            raise ConnectionError(f"Server '{self._name}' has exited")
+        self._server.call_soon_threadsafe(run)
+
+        # The server's thread might exit before running the call.
+        while True:
+            try:
+                return future.result(timeout=1.0)
+            except concurrent.futures.TimeoutError:
+                if not self._thread.is_alive():
+                    raise ConnectionError(f"Server '{self._name}' has exited")
+
+    def load_protocol(self, name, module, klass):
+        self.call(self._server.load_protocol, name, module, klass)
+        return
+
+    def load_engine(self, name, module, klass):
+        self.call(self._server.load_engine, name, module, klass)
+        return
+
+    def create_engine(self, name: str, engine_type: str):
+        self.call(self._server.create_engine, name, engine_type)
+        return Engine(self, name)
+
+    def delete_engine(self, name):
+        self.call(self._server.delete_engine, name)
+        return
+
+    def start_engine(self, name) -> bool:
+        return self.call(self._server.start_engine, name)
+
+    def stop_engine(self, name) -> bool:
+        return self.call(self._server.stop_engine, name)
+
+    def set_engine_property(self, name: str, property_name: str, value):
+        self.call(self._server.set_engine_property,
+                  name, property_name, value)
+        return
+
+    def create_endpoint(self, name: str, port: int, protocol: str,
+                        engine: str, **options) -> int:
+        """Create an endpoint, and return its listening port number.
+
+        :param options: Optional role, queue_size and policy, as for
+            exsim.endpoint.Endpoint."""
+        return self.call(functools.partial(self._server.create_endpoint,
+                                           name, port, protocol, engine,
+                                           **options))
+
+    def delete_endpoint(self, name: str):
+        self.call(self._server.delete_endpoint, name)
+        return
+
+    def set_endpoint_property(self, name: str, property_name: str, value):
+        self.call(self._server.set_endpoint_property,
+                  name, property_name, value)
+        return
+
+    def get_book(self, engine: str, symbol: str, max_levels: int = 0):
+        """Return a snapshot of an engine's book for a symbol."""
+        return self.call(self._server.get_book_snapshot,
+                         engine, symbol, max_levels)
+
+    def start_journal(self, path: str):
+        self.call(self._server.start_journal, path)
+        return
+
+    def stop_journal(self):
+        self.call(self._server.stop_journal)
+        return
+
+    def get_metrics(self) -> dict:
+        return self.call(self._server.get_metrics)
+
+    def start_metrics(self, port: int = 0) -> int:
+        return self.call(self._server.start_metrics, port)
+
+    def stop_metrics(self):
+        self.call(self._server.stop_metrics)
+        return
+
+    def set_log_level(self, subsystem: str, level: str):
+        self.call(self._server.set_log_level, subsystem, level)
+        return
+
+    def get_log_levels(self) -> typing.Dict[str, str]:
+        return self.call(self._server.get_log_levels)
+
+    def start_watchdog(self, threshold: float = DEFAULT_STALL_THRESHOLD):
+        self.call(self._server.start_watchdog, threshold)
+        return
+
+    def get_stalls(self) -> dict:
+        return self.call(self._server.get_stalls)
+
+    def stop_watchdog(self) -> dict:
+        return self.call(self._server.stop_watchdog)
+
+    def start_profile(self, mode: str = "cprofile",
+                      interval: float = DEFAULT_SAMPLE_INTERVAL):
+        self.call(self._server.start_profile, mode, interval)
+        return
+
+    def stop_profile(self) -> dict:
+        return self.call(self._server.stop_profile)
+
+
+class Batch:
+    """A list of requests, applied by the server in one round trip.
+
+    The server applies the requests in order.  If any fails, the ones
+    already applied are reversed, so the batch has either all or none
+    of its effects.  Used as a context manager, the batch is committed
+    on exit, unless an exception was raised."""
+
+    def __init__(self, server: Server):
+        """Constructor.
+
+        :param server: Server proxy to send batch to."""
+        self._server = server
+        self.requests: typing.List[dict] = []
+
+        # Per-request replies, once committed.
+        self.results: typing.List[dict] = []
+        return
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if exc_type is None:
+            self.commit()
+        return False
+
+    def load_engine(self, name, module, klass):
+        self.requests.append({"type": "load_engine",
+                              "name": name,
+                              "module": module,
+                              "class": klass})
+        return
+
+    def load_protocol(self, name, module, klass):
+        self.requests.append({"type": "load_protocol",
+                              "name": name,
+                              "module": module,
+                              "class": klass})
+        return
+
+    def create_engine(self, name: str, engine_type: str):
+        self.requests.append({"type": "create_engine",
+                              "name": name,
+                              "engine_type": engine_type})
+        return
+
+    def start_engine(self, name: str):
+        self.requests.append({"type": "start_engine", "name": name})
+        return
+
+    def stop_engine(self, name: str):
+        self.requests.append({"type": "stop_engine", "name": name})
+        return
+
+    def create_endpoint(self, name: str, port: int, protocol: str,
+                        engine: str, **options):
+        self.requests.append(dict(options,
+                                  type="create_endpoint",
+                                  name=name,
+                                  port=port,
+                                  protocol=protocol,
+                                  engine=engine))
+        return
+
+    def commit(self) -> typing.List[dict]:
+        """Send the batch to the server.
+
+        :returns: List of per-request replies.
+
+        Raises an exception if the batch failed."""
+        reply = {}
+        if not self._server._send({"type": "batch",
+                                   "requests": self.requests}, reply):
+            raise ConnectionError("Lost connection to server")
+
+        self.results = reply.get("results", [])
+        self.requests = []
+        if not reply["result"]:
+            raise Exception(reply["message"])
+        return self.results
 
 
 class Engine:
@@ -294,12 +961,14 @@ class Session:
 ########################################################################
 
 if __name__ == "__main__":
+    logging.basicConfig(filename="xs.log", level=logging.DEBUG)
     api = API()
 
     server = api.create_server("s1")
     server.load_protocol("fix", "fix_protocol", "FixProtocol")
+    server.load_engine("default", "default_engine", "DefaultEngine")
 
-    engine = server.create_engine("e1")
+    engine = server.create_engine("e1", "default")
     #ep1 = engine.create_endpoint("ep1", 10102)
     #ep1.set_endpoint_protocol("fix")
 
@@ -0,0 +1,257 @@
+# -*- coding: utf-8 -*-
+########################################################################
+# exsim - Exchange Simulator
+# Copyright (C) 2016-2023, zeroXone.
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see http://www.gnu.org/licenses/
+#
+########################################################################
+
+# The asynchronous client is kept separate from the rest of the API, so
+# that a synchronous client doesn't pay for importing asyncio.
+
+import asyncio
+import typing
+
+from .mgmt_codec import MessageReader, encode_message
+from .profiling import DEFAULT_SAMPLE_INTERVAL, DEFAULT_STALL_THRESHOLD
+
+
+class AsyncAPI:
+    """Asynchronous client for a simulator server's management socket.
+
+    Any number of requests can be outstanding at once: each is sent
+    immediately, and its reply is matched to it by request id.  Events
+    from the server are queued, and read using events().
+
+        api = await AsyncAPI.connect("127.0.0.1", port)
+        await asyncio.gather(api.create_engine("e1", "default"),
+                             api.create_engine("e2", "default"))
+        await api.subscribe(["execution"])
+        async for event in api.events():
+            ...
+    """
+
+    def __init__(self, reader: asyncio.StreamReader,
+                 writer: asyncio.StreamWriter):
+        """Constructor.
+
+        :param reader: Stream connected to the server.
+        :param writer: Stream connected to the server."""
+        self._reader = reader
+        self._writer = writer
+        self._decoder = MessageReader()
+        self._next_id = 1
+
+        # Futures for outstanding requests, by request id.
+        self._pending: typing.Dict[int, asyncio.Future] = {}
+
+        # Events received, but not yet read.
+        self._events: asyncio.Queue = asyncio.Queue()
+
+        self._receiver = asyncio.get_running_loop().create_task(
+            self._receive())
+        return
+
+    @classmethod
+    async def connect(cls, host: str, port: int) -> "AsyncAPI":
+        """Connect to a server's management port.
+
+        :param host: Server host name or address.
+        :param port: Server management port number."""
+        reader, writer = await asyncio.open_connection(host, port)
+        return cls(reader, writer)
+
+    async def close(self):
+        """Close the connection to the server."""
+        self._receiver.cancel()
+        self._writer.close()
+        await self._writer.wait_closed()
+        self._fail_pending()
+        return
+
+    async def request(self, request: dict) -> dict:
+        """Send a request, and return its reply.
+
+        :param request: Request dictionary.
+        :returns: Reply dictionary."""
+        request_id = self._next_id
+        self._next_id += 1
+
+        future = asyncio.get_running_loop().create_future()
+        self._pending[request_id] = future
+        self._writer.write(encode_message(dict(request, id=request_id)))
+        return await future
+
+    async def call(self, request: dict) -> dict:
+        """Send a request, and return its reply, raising if it failed."""
+        reply = await self.request(request)
+        if not reply["result"]:
+            raise Exception(reply["message"])
+        return reply
+
+    async def events(self) -> typing.AsyncIterator[dict]:
+        """Yield events from the server, as they arrive.
+
+        Each event is a dictionary with the topic name as "event", and
+        its details as "data"."""
+        while True:
+            event = await self._events.get()
+            if event is None:
+                return
+            yield event
+
+    async def subscribe(self, topics: typing.List[str]):
+        """Ask the server to send events for the listed topics."""
+        await self.call({"type": "subscribe", "topics": topics})
+        return
+
+    async def load_engine(self, name, module, klass):
+        await self.call({"type": "load_engine",
+                         "name": name,
+                         "module": module,
+                         "class": klass})
+        return
+
+    async def load_protocol(self, name, module, klass):
+        await self.call({"type": "load_protocol",
+                         "name": name,
+                         "module": module,
+                         "class": klass})
+        return
+
+    async def create_engine(self, name: str, engine_type: str):
+        await self.call({"type": "create_engine",
+                         "name": name,
+                         "engine_type": engine_type})
+        return
+
+    async def delete_engine(self, name: str):
+        await self.call({"type": "delete_engine", "name": name})
+        return
+
+    async def start_engine(self, name: str):
+        await self.call({"type": "start_engine", "name": name})
+        return
+
+    async def stop_engine(self, name: str):
+        await self.call({"type": "stop_engine", "name": name})
+        return
+
+    async def create_endpoint(self, name: str, port: int, protocol: str,
+                              engine: str, **options) -> int:
+        """Create an endpoint, and return its listening port number.
+
+        :param options: Optional role, queue_size and policy, as for
+            exsim.endpoint.Endpoint."""
+        reply = await self.call(dict(options,
+                                     type="create_endpoint",
+                                     name=name,
+                                     port=port,
+                                     protocol=protocol,
+                                     engine=engine))
+        return reply["port"]
+
+    async def get_book(self, engine: str, symbol: str,
+                       max_levels: int = 0) -> dict:
+        """Return a snapshot of an engine's book for a symbol."""
+        reply = await self.call({"type": "get_book",
+                                 "engine": engine,
+                                 "symbol": symbol,
+                                 "max_levels": max_levels})
+        return reply["book"]
+
+    async def start_journal(self, path: str):
+        await self.call({"type": "start_journal", "path": path})
+        return
+
+    async def stop_journal(self):
+        await self.call({"type": "stop_journal"})
+        return
+
+    async def get_metrics(self) -> dict:
+        reply = await self.call({"type": "get_metrics"})
+        return reply["metrics"]
+
+    async def start_metrics(self, port: int = 0) -> int:
+        reply = await self.call({"type": "start_metrics", "port": port})
+        return reply["port"]
+
+    async def stop_metrics(self):
+        await self.call({"type": "stop_metrics"})
+        return
+
+    async def set_log_level(self, subsystem: str, level: str):
+        await self.call({"type": "set_log_level",
+                         "subsystem": subsystem,
+                         "level": level})
+        return
+
+    async def get_log_levels(self) -> typing.Dict[str, str]:
+        reply = await self.call({"type": "get_log_levels"})
+        return reply["levels"]
+
+    async def start_watchdog(self,
+                             threshold: float = DEFAULT_STALL_THRESHOLD):
+        await self.call({"type": "start_watchdog", "threshold": threshold})
+        return
+
+    async def get_stalls(self) -> dict:
+        reply = await self.call({"type": "get_stalls"})
+        return reply["stalls"]
+
+    async def stop_watchdog(self) -> dict:
+        reply = await self.call({"type": "stop_watchdog"})
+        return reply["stalls"]
+
+    async def start_profile(self, mode: str = "cprofile",
+                            interval: float = DEFAULT_SAMPLE_INTERVAL):
+        await self.call({"type": "start_profile",
+                         "mode": mode,
+                         "interval": interval})
+        return
+
+    async def stop_profile(self) -> dict:
+        reply = await self.call({"type": "stop_profile"})
+        return reply["profile"]
+
+    async def _receive(self):
+        """(Internal) Read and dispatch messages from the server."""
+        try:
+            while True:
+                data = await self._reader.read(65536)
+                if not data:
+                    break
+
+                self._decoder.append_buffer(data)
+                for message in self._decoder.get_messages():
+                    if "event" in message:
+                        self._events.put_nowait(message)
+                        continue
+
+                    future = self._pending.pop(message.get("id"), None)
+                    if future is not None and not future.done():
+                        future.set_result(message)
+        finally:
+            self._fail_pending()
+        return
+
+    def _fail_pending(self):
+        """(Internal) Fail outstanding requests, and end events()."""
+        for future in self._pending.values():
+            if not future.done():
+                future.set_exception(ConnectionError("Connection closed"))
+        self._pending = {}
+        self._events.put_nowait(None)
+        return
@@ -0,0 +1,318 @@
+# -*- coding: utf-8 -*-
+########################################################################
+# exsim - Exchange Simulator
+# Copyright (C) 2016-2023, zeroXone.
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see http://www.gnu.org/licenses/
+#
+########################################################################
+
+import asyncio
+import logging
+import time
+import typing
+
+from .endpoint import Endpoint
+from .journal import CLOSE, OUTBOUND
+from .manager import Manager
+from .profiling import DEFAULT_STALL_THRESHOLD
+from .server import BaseServer
+from .session import Session
+
+
+logger = logging.getLogger("exsim.server")
+
+
+class AsyncSession(Session, asyncio.Protocol):
+    """A client Session, driven by an asyncio transport."""
+
+    def __init__(self, endpoint: Endpoint, server: "AsyncServer"):
+        """Constructor.
+
+        :param endpoint: Endpoint that accepted this session.
+        :param server: AsyncServer hosting this session."""
+        super().__init__(None, None, endpoint)
+        self.set_server(server)
+        self._transport = None
+        return
+
+    def connection_made(self, transport):
+        self._transport = transport
+        self._socket = transport.get_extra_info("socket")
+        self._address = transport.get_extra_info("peername")
+        self._server.session_opened(self)
+        return
+
+    def data_received(self, data: bytes):
+        self.received(data)
+        return
+
+    def connection_lost(self, exc):
+        self._server.session_closed(self)
+        return
+
+    def close(self):
+        """Close this session."""
+        if self._journal is not None:
+            self._journal.record(CLOSE, self._journal_id, b"")
+            self._journal = None
+        self._transport.close()
+        self._address = None
+        return
+
+    def output_size(self) -> int:
+        """Return the number of bytes queued, but not yet sent."""
+        return self._transport.get_write_buffer_size()
+
+    def send(self, data: bytes):
+        """Send the supplied data to the session's peer.
+
+        A session whose peer isn't reading is aborted, discarding its
+        unsent output, once that exceeds max_output_size."""
+        if self._transport.is_closing():
+            return
+
+        if self._journal is not None:
+            self._journal.record(OUTBOUND, self._journal_id, data)
+        self.messages_out += 1
+        self.bytes_out += len(data)
+        self._transport.write(data)
+        if self._transport.get_write_buffer_size() > self.max_output_size:
+            logger.warning("Closing slow session from %s: %d bytes unsent",
+                           self._address,
+                           self._transport.get_write_buffer_size())
+
+            # The transport calls connection_lost() later, so this
+            # doesn't close the session in the middle of a pass.
+            self._transport.abort()
+        return
+
+
+class AsyncManager(Manager, asyncio.Protocol):
+    """A management connection, driven by an asyncio transport."""
+
+    def __init__(self, server: "AsyncServer"):
+        """Constructor.
+
+        :param server: AsyncServer being managed."""
+        super().__init__(None, None)
+        self.set_server(server)
+        self._transport = None
+        return
+
+    def connection_made(self, transport):
+        self._transport = transport
+        self._socket = transport.get_extra_info("socket")
+        self._address = transport.get_extra_info("peername")
+        self._server.manager_opened(self)
+        return
+
+    def data_received(self, data: bytes):
+        self.received(data)
+        return
+
+    def connection_lost(self, exc):
+        self._server.manager_closed(self)
+        return
+
+    def close(self):
+        self._transport.close()
+        self._address = None
+        return
+
+    def write(self, data: bytes):
+        """Send encoded data to the management client."""
+        if self._transport.is_closing():
+            return
+
+        self._transport.write(data)
+        if self._transport.get_write_buffer_size() > self.max_output_size:
+            logger.warning("Closing slow manager %s: %d bytes unsent",
+                           self._address,
+                           self._transport.get_write_buffer_size())
+            self._server.manager_closed(self)
+        return
+
+
+class AsyncServer(BaseServer):
+    """Simulator server, using an asyncio event loop.
+
+    Engines and protocols are the same plugins used by Server.  The
+    endpoint and management sockets are served by the running asyncio
+    loop, so any compatible loop implementation (eg. uvloop) can be
+    used, and the server can be embedded in an existing application:
+
+        server = AsyncServer()
+        ...
+        await server.serve()
+
+    Event loop iteration times aren't included in its metrics, and it
+    has no stall watchdog: asyncio has no hook for measuring them.  Its
+    debug mode (see loop.slow_callback_duration) can log slow callbacks
+    instead."""
+
+    def __init__(self, management: bool = True):
+        """Constructor.
+
+        :param management: If False, don't open a management socket."""
+        super().__init__(management)
+
+        self._loop: typing.Optional[asyncio.AbstractEventLoop] = None
+        self._stopped: typing.Optional[asyncio.Event] = None
+
+        self._sessions: typing.Set[AsyncSession] = set()
+        self._managers: typing.Set[AsyncManager] = set()
+        self._listeners: typing.Dict[str, asyncio.AbstractServer] = {}
+        return
+
+    def run(self):
+        """Run the server in a new asyncio event loop, until stopped."""
+        asyncio.run(self.serve())
+        return
+
+    async def serve(self):
+        """Serve management and client connections until stopped.
+
+        Must be awaited from within the running event loop."""
+        self._loop = asyncio.get_running_loop()
+        self._stopped = asyncio.Event()
+        if not self._is_running:
+            self._stopped.set()
+
+        mgmt = None
+        if self._mgmt_sock is not None:
+            mgmt = await self._loop.create_server(
+                lambda: AsyncManager(self), sock=self._mgmt_sock)
+        for endpoint in self._endpoints.values():
+            await self._listen(endpoint)
+
+        await self._stopped.wait()
+
+        if mgmt is not None:
+            mgmt.close()
+        for listener in self._listeners.values():
+            listener.close()
+        for manager in list(self._managers):
+            manager.close()
+        for session in list(self._sessions):
+            session.close()
+        self._listeners = {}
+        if self._journal is not None:
+            self.stop_journal()
+        if self._metrics_listener is not None:
+            self.stop_metrics()
+        if self._profiler is not None:
+            self.stop_profile()
+        return
+
+    def stop(self):
+        """Request that serve() return."""
+        super().stop()
+        if self._stopped is not None:
+            self._loop.call_soon_threadsafe(self._stopped.set)
+        return
+
+    def start_watchdog(self, threshold: float = DEFAULT_STALL_THRESHOLD):
+        """Not supported: asyncio callbacks can't be timed."""
+        raise ValueError("Stall watchdog requires the selectors-based Server")
+
+    def call_soon_threadsafe(self, callback):
+        if self._loop is None:
+            raise RuntimeError("Server is not running")
+        self._loop.call_soon_threadsafe(callback)
+        return
+
+    def add_timeout(self, expiry_time: float, callback) -> asyncio.TimerHandle:
+        """Schedule a callback.
+
+        :param expiry_time: Time (as for time.time()) to run the callback.
+        :param callback: Callable, taking no parameters.
+        :returns: TimerHandle, to be passed to delete_timeout()."""
+        if self._loop is None:
+            raise RuntimeError("Server is not running")
+
+        when = self._loop.time() + (expiry_time - time.time())
+        return self._loop.call_at(when, callback)
+
+    def delete_timeout(self, timeout: asyncio.TimerHandle):
+        """Cancel a scheduled callback.
+
+        :param timeout: Handle returned from add_timeout()."""
+        timeout.cancel()
+        return
+
+    def manager_opened(self, manager: AsyncManager):
+        self._managers.add(manager)
+        logger.info("New manager from %s", manager.address())
+        return
+
+    def manager_closed(self, manager: AsyncManager):
+        if manager not in self._managers:
+            return
+        self._managers.remove(manager)
+        self.unsubscribe(manager)
+        logger.info("Closed manager from %s", manager.address())
+        manager.close()
+        return
+
+    def session_opened(self, session: AsyncSession):
+        self._sessions.add(session)
+        logger.info("New session from %s", session.address())
+        if self._journal is not None:
+            session.set_journal(self._journal)
+        self._session_event(session, "opened")
+        session.endpoint().session_opened(session)
+        session.engine().attach_session(session)
+        return
+
+    def sessions(self) -> list:
+        return list(self._sessions)
+
+    def close_later(self, session: AsyncSession):
+        self._loop.call_soon(self.session_closed, session)
+        return
+
+    def session_closed(self, session: AsyncSession):
+        if session not in self._sessions:
+            return
+        self._sessions.remove(session)
+        logger.info("Closed session from %s", session.address())
+        self._session_event(session, "closed")
+        session.endpoint().session_closed(session)
+        session.engine().detach_session(session)
+        session.close()
+        return
+
+    def _start_endpoint(self, endpoint: Endpoint):
+        """(Internal) Begin accepting connections for a new endpoint.
+
+        Endpoints created before serve() is called are started when it
+        runs; later ones are started by a task on the running loop."""
+        if self._loop is not None:
+            self._loop.create_task(self._listen(endpoint))
+        return
+
+    def _stop_endpoint(self, endpoint: Endpoint):
+        """(Internal) Stop accepting connections for an endpoint."""
+        listener = self._listeners.pop(endpoint.name(), None)
+        if listener is not None:
+            listener.close()
+        return
+
+    async def _listen(self, endpoint: Endpoint):
+        """(Internal) Serve an endpoint's listening socket."""
+        listener = await self._loop.create_server(
+            lambda: AsyncSession(endpoint, self), sock=endpoint.socket())
+        self._listeners[endpoint.name()] = listener
+        return
@@ -18,9 +18,197 @@
 #
 ########################################################################
 
+import typing
+
+from .order import NO_ORDER, OrderStore
+from .side import Side
+
+
+class Fill:
+    """A match between an incoming order and a resting order."""
+
+    __slots__ = ("resting", "quantity", "price")
+
+    def __init__(self, resting: int, quantity, price):
+        """Constructor.
+
+        :param resting: Handle of resting order that was matched.
+        :param quantity: Matched quantity.
+        :param price: Execution price (the resting order's price)."""
+        self.resting = resting
+        self.quantity = quantity
+        self.price = price
+        return
+
+
 class Book:
-    """A market for a tradable thing."""
+    """A market for a tradable thing.
+
+    Orders are matched in price-time priority.  Each side keeps its
+    price levels in a heap, with a FIFO queue of orders per level, so
+    adding a level is O(log n), and adding, cancelling or modifying an
+    order within a level is O(1).
 
-    def __init__(self):
-        self.symbol = ''
+    Orders are held in an OrderStore, which can be shared by several
+    books, and are referred to by their handle in that store.  The book
+    never allocates or releases handles: an order that leaves the book
+    (filled or cancelled) remains in the store for its owner to report
+    on and release."""
+
+    def __init__(self, symbol: str = '', store: OrderStore = None):
+        """Constructor.
+
+        :param symbol: Symbol for the traded instrument.
+        :param store: OrderStore holding the book's orders."""
+        self.symbol = symbol
+        self.store = store if store is not None else OrderStore()
+
+        self.bids = Side(Side.BUY, self.store)
+        self.bids.symbol = symbol
+        self.offers = Side(Side.SELL, self.store)
+        self.offers.symbol = symbol
+
+        # Number of resting orders.
+        self._count = 0
         return
+
+    def __len__(self):
+        """Return the number of resting orders."""
+        return self._count
+
+    def get_side(self, side) -> Side:
+        """Return the Side of the book for BUY or SELL."""
+        return self.bids if side == Side.BUY else self.offers
+
+    def get_order(self, order_id) -> typing.Optional[int]:
+        """Return a resting order's handle, or None if not found."""
+        store = self.store
+        handle = store.find(order_id)
+        if handle == NO_ORDER or not store.resting[handle] or \
+                store.symbol[handle] != self.symbol:
+            return None
+        return handle
+
+    def add_order(self, handle: int) -> typing.List[Fill]:
+        """Match a new order, and rest any remaining quantity.
+
+        :param handle: New order.
+        :returns: List of Fills, in execution order.
+
+        Orders without a price are never rested: any quantity not
+        matched immediately is left as the order's remaining
+        quantity for the caller to cancel."""
+        store = self.store
+        fills = self._match(handle)
+        if store.remaining_quantity[handle] > 0 and \
+                store.get_price(handle) is not None:
+            self.get_side(store.side[handle]).add_order(handle)
+            self._count += 1
+        return fills
+
+    def cancel_order(self, order_id) -> int:
+        """Remove a resting order from the book.
+
+        :param order_id: Identifier of resting order.
+        :returns: Handle of the cancelled order.
+
+        Raises KeyError if the order is not resting in this book."""
+        handle = self.get_order(order_id)
+        if handle is None:
+            raise KeyError(f"No such order: {order_id}")
+
+        self.get_side(self.store.side[handle]).cancel_order(handle)
+        self._count -= 1
+        return handle
+
+    def modify_order(self, order_id, quantity,
+                     price=None) -> typing.List[Fill]:
+        """Change the quantity and/or price of a resting order.
+
+        :param order_id: Identifier of resting order.
+        :param quantity: New total order quantity.
+        :param price: New limit price, or None to keep the current price.
+        :returns: List of Fills, if the modified order matched.
+
+        Reducing the quantity keeps the order's time priority.  Any
+        other change re-queues it as if it were new, and it might then
+        match.  A quantity no greater than that already filled removes
+        the order from the book.  Raises KeyError if the order is not
+        resting in this book."""
+        store = self.store
+        handle = self.get_order(order_id)
+        if handle is None:
+            raise KeyError(f"No such order: {order_id}")
+
+        side = self.get_side(store.side[handle])
+        remaining = store.remaining_quantity[handle]
+        filled = store.quantity[handle] - remaining
+
+        if quantity <= filled:
+            self.cancel_order(order_id)
+            store.quantity[handle] = filled
+            store.remaining_quantity[handle] = 0
+            return []
+
+        if ((price is None or price == store.price[handle]) and
+                quantity - filled <= remaining):
+            side.modify_order(handle, quantity - filled)
+            store.quantity[handle] = quantity
+            return []
+
+        self.cancel_order(order_id)
+        store.quantity[handle] = quantity
+        store.remaining_quantity[handle] = quantity - filled
+        if price is not None:
+            store.price[handle] = price
+        return self.add_order(handle)
+
+    def snapshot(self, max_levels: int = 0) -> dict:
+        """Return the book's aggregated price levels.
+
+        :param max_levels: Maximum number of levels per side, or zero
+            for all.
+        :returns: Dictionary with symbol, and lists of bid and offer
+            (price, quantity, order count) tuples, best first."""
+        return {"symbol": self.symbol,
+                "bids": self.bids.depth(max_levels),
+                "offers": self.offers.depth(max_levels)}
+
+    def cancel_all_orders(self) -> typing.List[int]:
+        """Remove all resting orders.
+
+        :returns: List of handles of removed orders."""
+        handles = self.bids.cancel_all_orders()
+        handles.extend(self.offers.cancel_all_orders())
+        self._count = 0
+        return handles
+
+    def _match(self, handle: int) -> typing.List[Fill]:
+        """(Internal) Match an order against the opposite side."""
+        store = self.store
+        remaining_quantity = store.remaining_quantity
+        price = store.get_price(handle)
+        opposite = self.offers if store.side[handle] == Side.BUY \
+            else self.bids
+        fills = []
+
+        remaining = remaining_quantity[handle]
+        while remaining > 0 and opposite.is_marketable(price):
+            level = opposite.best_level()
+            while level.count and remaining > 0:
+                resting = level.head
+                resting_remaining = remaining_quantity[resting]
+                quantity = min(remaining, resting_remaining)
+                fills.append(Fill(resting, quantity, level.price))
+                remaining -= quantity
+
+                if quantity == resting_remaining:
+                    opposite.cancel_order(resting)
+                    self._count -= 1
+                    remaining_quantity[resting] = 0
+                else:
+                    opposite.modify_order(resting,
+                                          resting_remaining - quantity)
+
+        remaining_quantity[handle] = remaining
+        return fills
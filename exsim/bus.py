@@ -0,0 +1,271 @@
+# -*- coding: utf-8 -*-
+########################################################################
+# exsim - Exchange Simulator
+# Copyright (C) 2016-2023, zeroXone.
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see http://www.gnu.org/licenses/
+#
+########################################################################
+
+# The event bus carries drop copies and trades from an engine to the
+# sessions that follow them: drop-copy sessions receive a copy of every
+# order report, and trade-feed sessions receive every trade.
+#
+# Publishing an event just appends it to each subscriber's queue, so
+# order entry isn't slowed by the number of followers.  Queues are
+# drained after the engine has finished processing a batch of
+# messages, once the order-entry replies have been queued.  Each event
+# is passed to every subscriber as the same dictionary, which protocols
+# use to cache their encoding of it, so it is only encoded once.
+#
+# A subscriber's queue is drained only while its session's unsent
+# output is below a limit.  When a slow subscriber's queue is full, its
+# policy decides what happens next:
+#
+#   DROP        discard the new event
+#   CONFLATE    replace any queued event with the same key (eg. the
+#               same order), or otherwise discard the oldest event
+#   DISCONNECT  close the subscriber's session
+
+import collections
+import itertools
+import logging
+import time
+import typing
+
+
+logger = logging.getLogger("exsim.engine")
+
+
+# Topics.
+DROPS = "drops"
+TRADES = "trades"
+
+# Policies for a full queue.
+DROP = "drop"
+CONFLATE = "conflate"
+DISCONNECT = "disconnect"
+POLICIES = (DROP, CONFLATE, DISCONNECT)
+
+DEFAULT_QUEUE_SIZE = 10000
+
+# A follower that can't keep up is disconnected, rather than silently
+# missing events, unless configured otherwise.
+DEFAULT_POLICY = DISCONNECT
+
+
+class Subscriber:
+    """A session following a topic, with its queue of unsent events."""
+
+    def __init__(self, session, topic: str, queue_size: int, policy: str):
+        """Constructor.
+
+        :param session: Subscribing session.
+        :param topic: Topic name.
+        :param queue_size: Maximum number of queued events.
+        :param policy: DROP, CONFLATE or DISCONNECT."""
+        if policy not in POLICIES:
+            raise ValueError(f"Bad queue policy: '{policy}'")
+        if queue_size < 1:
+            raise ValueError(f"Bad queue size: {queue_size}")
+
+        self.session = session
+        self.topic = topic
+        self.queue_size = queue_size
+        self.policy = policy
+
+        # Queued events, by key, in order of arrival.  Unless conflated,
+        # each event is keyed by its unique sequence number.
+        self.queue: typing.Dict[typing.Any, dict] = collections.OrderedDict()
+
+        # Count of events discarded.
+        self.dropped = 0
+        return
+
+    def push(self, event: dict, key) -> bool:
+        """Queue an event.
+
+        :param event: Event dictionary, with its sequence number.
+        :param key: Conflation key, or None.
+        :returns: False if the subscriber should be disconnected."""
+        queue = self.queue
+        if self.policy != CONFLATE or key is None:
+            key = event["sequence"]
+        elif key in queue:
+            queue[key] = event
+            queue.move_to_end(key)
+            return True
+
+        if len(queue) >= self.queue_size:
+            if self.policy == DISCONNECT:
+                return False
+            self.dropped += 1
+            if self.policy == DROP:
+                return True
+            queue.popitem(last=False)
+
+        queue[key] = event
+        return True
+
+
+class EventBus:
+    """Fans out an engine's events to subscribed sessions."""
+
+    # Stop sending to a subscriber while its session has at least this
+    # many bytes of unsent output.
+    max_session_output = 1024 * 1024
+
+    # Maximum events sent to each subscriber per pass of the event loop.
+    flush_budget = 1000
+
+    # Seconds to wait before retrying, when every subscriber with queued
+    # events has too much unsent output.
+    retry_interval = 0.01
+
+    def __init__(self, engine):
+        """Constructor.
+
+        :param engine: Engine publishing events.  Events are sent using
+            its send() method."""
+        self._engine = engine
+        self._topics: typing.Dict[str, typing.List[Subscriber]] = {}
+        self._subscribers: typing.Dict[typing.Any,
+                                       typing.List[Subscriber]] = {}
+
+        # Subscribers with queued events.
+        self._pending: typing.Dict[Subscriber, None] = {}
+        self._timeout = None
+
+        # Sequence numbers for events, so that protocols can identify
+        # them consistently for all subscribers.
+        self._sequence = itertools.count(1)
+        return
+
+    def has_subscribers(self, topic: str) -> bool:
+        """Return True if a topic has any subscribers."""
+        return bool(self._topics.get(topic))
+
+    def subscribe(self, topic: str, session,
+                  queue_size: int = DEFAULT_QUEUE_SIZE,
+                  policy: str = DEFAULT_POLICY) -> Subscriber:
+        """Send a topic's events to a session.
+
+        :param topic: DROPS or TRADES.
+        :param session: Subscribing session.
+        :param queue_size: Maximum number of queued events.
+        :param policy: What to do when the queue is full."""
+        subscriber = Subscriber(session, topic, queue_size, policy)
+        self._topics.setdefault(topic, []).append(subscriber)
+        self._subscribers.setdefault(session, []).append(subscriber)
+        return subscriber
+
+    def remove_session(self, session):
+        """Cancel all of a session's subscriptions."""
+        for subscriber in self._subscribers.pop(session, []):
+            self._topics[subscriber.topic].remove(subscriber)
+            self._pending.pop(subscriber, None)
+        return
+
+    def publish(self, topic: str, event: dict, key=None):
+        """Queue an event for a topic's subscribers.
+
+        :param topic: Topic name.
+        :param event: Event dictionary.  It is shared by all subscribers,
+            and must not be modified afterwards.
+        :param key: Identifies events that replace one another when
+            conflated, or None."""
+        subscribers = self._topics.get(topic)
+        if not subscribers:
+            return
+
+        event["sequence"] = next(self._sequence)
+
+        disconnect = []
+        pending = self._pending
+        for subscriber in subscribers:
+            if subscriber.push(event, key):
+                pending[subscriber] = None
+            else:
+                disconnect.append(subscriber)
+
+        for subscriber in disconnect:
+            self._disconnect(subscriber)
+        return
+
+    def has_pending(self) -> bool:
+        """Return True if any subscriber has queued events."""
+        return bool(self._pending)
+
+    def flush(self):
+        """Send queued events, to subscribers that can accept them.
+
+        Called by the engine after processing each batch of messages.
+        If any events remain queued, it's called again on a later pass
+        of the event loop, or after retry_interval if all their
+        sessions' output is full."""
+        if not self._pending:
+            return
+
+        send = self._engine.send
+        limit = self.max_session_output
+        delay = self.retry_interval
+        for subscriber in list(self._pending):
+            session = subscriber.session
+            queue = subscriber.queue
+            budget = self.flush_budget
+            while queue and budget and session.output_size() < limit:
+                send(session, queue.popitem(last=False)[1])
+                budget -= 1
+            if not queue:
+                del self._pending[subscriber]
+            elif not budget:
+                delay = 0
+
+        server = self._engine.server()
+        if self._pending and self._timeout is None and server is not None:
+            # Give order entry a turn before sending more.
+            self._timeout = server.add_timeout(time.time() + delay,
+                                               self._retry)
+        return
+
+    def _retry(self):
+        """(Internal) Timeout callback, to send remaining events."""
+        self._timeout = None
+        self.flush()
+        return
+
+    def close(self):
+        """Discard all subscriptions."""
+        server = self._engine.server()
+        if self._timeout is not None and server is not None:
+            server.delete_timeout(self._timeout)
+        self._timeout = None
+        self._topics = {}
+        self._subscribers = {}
+        self._pending = {}
+        return
+
+    def _disconnect(self, subscriber: Subscriber):
+        """(Internal) Close a subscriber's session, when its queue is full.
+
+        The session is usually being published to while handling another
+        session's messages, so the server closes it later."""
+        logger.warning("Closing %s subscriber: queue full (%d events)",
+                       subscriber.topic, subscriber.queue_size)
+        session = subscriber.session
+        self.remove_session(session)
+        server = self._engine.server()
+        if server is not None:
+            server.close_later(session)
+        return
@@ -0,0 +1,117 @@
+# -*- coding: utf-8 -*-
+########################################################################
+# exsim - Exchange Simulator
+# Copyright (C) 2016-2023, zeroXone.
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see http://www.gnu.org/licenses/
+#
+########################################################################
+
+# FIX UTCTimestamp values look like "20230102-13:14:15.678".  Within
+# any one second, only the fractional part changes, so the clock caches
+# the formatted date and time, and only formats the fraction when it
+# changes.  At millisecond precision, messages sent in a burst usually
+# share a timestamp, and reuse the last one formatted.
+
+import time
+import typing
+
+
+MILLISECONDS = 3
+MICROSECONDS = 6
+NANOSECONDS = 9
+
+
+class SimulatedClock:
+    """A manually-advanced time source, for deterministic tests."""
+
+    def __init__(self, now: int = 0):
+        """Constructor.
+
+        :param now: Initial time, in nanoseconds since the epoch."""
+        self._now = now
+        return
+
+    def __call__(self) -> int:
+        """Return the current time, in nanoseconds since the epoch."""
+        return self._now
+
+    def set(self, now: int):
+        """Set the current time, in nanoseconds since the epoch."""
+        self._now = now
+        return
+
+    def advance(self, nanoseconds: int):
+        """Move the current time forward."""
+        self._now += nanoseconds
+        return
+
+
+class FixClock:
+    """Source of formatted FIX timestamps."""
+
+    def __init__(self, precision: int = MILLISECONDS,
+                 clock: typing.Callable[[], int] = time.time_ns):
+        """Constructor.
+
+        :param precision: Number of decimal places for fractional
+            seconds: MILLISECONDS, MICROSECONDS, NANOSECONDS, or zero.
+        :param clock: Callable returning nanoseconds since the epoch."""
+        if precision not in (0, MILLISECONDS, MICROSECONDS, NANOSECONDS):
+            raise ValueError("Bad timestamp precision: %s" % precision)
+
+        self._clock = clock
+        self._precision = precision
+        self._divisor = 10 ** (NANOSECONDS - precision)
+        self._ticks_per_second = 10 ** precision
+        self._fraction = b".%%0%dd" % precision if precision else b""
+
+        self._ticks = None
+        self._timestamp = b""
+        self._second = None
+        self._prefix = b""
+        return
+
+    def precision(self) -> int:
+        """Return the number of decimal places for fractional seconds."""
+        return self._precision
+
+    def time_ns(self) -> int:
+        """Return the current time, in nanoseconds since the epoch."""
+        return self._clock()
+
+    def now(self) -> bytes:
+        """Return the current time as a FIX UTCTimestamp."""
+        return self.format(self._clock())
+
+    def format(self, nanoseconds: int) -> bytes:
+        """Return a time as a FIX UTCTimestamp.
+
+        :param nanoseconds: Time, in nanoseconds since the epoch."""
+        ticks = nanoseconds // self._divisor
+        if ticks == self._ticks:
+            return self._timestamp
+
+        second, fraction = divmod(ticks, self._ticks_per_second)
+        if second != self._second:
+            self._prefix = time.strftime("%Y%m%d-%H:%M:%S",
+                                         time.gmtime(second)).encode()
+            self._second = second
+
+        if self._precision:
+            self._timestamp = self._prefix + self._fraction % fraction
+        else:
+            self._timestamp = self._prefix
+        self._ticks = ticks
+        return self._timestamp
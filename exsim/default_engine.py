@@ -18,7 +18,22 @@
 #
 ########################################################################
 
+import itertools
+import logging
+import typing
+
+from .book import Book, Fill
+from .bus import DEFAULT_POLICY, DEFAULT_QUEUE_SIZE, DROPS, TRADES
+from .bus import EventBus
+from .endpoint import DROP_COPY, TRADE_FEED
 from .engine import Engine
+from .market_data import MarketDataPublisher
+from .message import *
+from .order import OrderStore
+from .side import Side
+
+
+logger = logging.getLogger("exsim.engine")
 
 
 class DefaultEngine(Engine):
@@ -31,21 +46,38 @@ class DefaultEngine(Engine):
 
         super().__init__(name)
 
-        self.markets = {}  # symbol: book
+        self.markets: typing.Dict[str, Book] = {}  # symbol: book
+
+        # Storage for all live orders, shared by the books.
+        self.orders = OrderStore()
+
+        # Handles of live orders, by session and client order id.
+        self._clients: typing.Dict[typing.Any, typing.Dict[str, int]] = {}
+        self._execution_ids = itertools.count(1)
 
-        self._clients = {}
-        self._drops = {}
-        self._prices = {}
-        self._trades = {}
+        self.market_data = MarketDataPublisher(self)
+
+        # Drop copies and trades, for following sessions.
+        self.bus = EventBus(self)
+
+        # Counters, for metrics.
+        self.messages_in = 0
+        self.fills = 0
         return
 
     def delete(self):
-        # Clean up.
+        self.bus.close()
         return
 
-    def subscribe_drops(self, names):
-        """Request delivery of drop copies for named client sessions."""
-        pass
+    def subscribe_drops(self, session, queue_size: int = DEFAULT_QUEUE_SIZE,
+                        policy: str = DEFAULT_POLICY):
+        """Request delivery of drop copies of all order reports.
+
+        :param session: Session to receive the drop copies.
+        :param queue_size: Maximum number of unsent drop copies.
+        :param policy: What to do when the queue is full (see bus)."""
+        self.bus.subscribe(DROPS, session, queue_size, policy)
+        return
 
     def subscribe_prices(self):
         """Request delivery of pricing.
@@ -54,50 +86,270 @@ class DefaultEngine(Engine):
         limit order prices."""
         pass
 
-    def subscribe_trades(self):
+    def subscribe_trades(self, session, queue_size: int = DEFAULT_QUEUE_SIZE,
+                         policy: str = DEFAULT_POLICY):
         """Request delivery of trade reports.
 
         This is not a drop copy, but rather the unattributed time and
-        sales stream from the matching engine."""
-        pass
+        sales stream from the matching engine.
+
+        :param session: Session to receive the trades.
+        :param queue_size: Maximum number of unsent trades.
+        :param policy: What to do when the queue is full (see bus).
+            Conflated trades keep the last trade for each symbol."""
+        self.bus.subscribe(TRADES, session, queue_size, policy)
+        return
+
+    def get_book(self, symbol: str) -> Book:
+        """Return the Book for a symbol, creating it if necessary."""
+        book = self.markets.get(symbol)
+        if book is None:
+            book = Book(symbol, self.orders)
+            self.markets[symbol] = book
+        return book
+
+    def get_book_snapshot(self, symbol: str, max_levels: int = 0) -> dict:
+        book = self.markets.get(symbol)
+        if book is None:
+            return {"symbol": symbol, "bids": [], "offers": []}
+        return book.snapshot(max_levels)
+
+    def get_metrics(self) -> dict:
+        metrics = super().get_metrics()
+        metrics["messages_in"] = self.messages_in
+        metrics["books"] = len(self.markets)
+        metrics["orders_resting"] = sum(len(book)
+                                        for book in self.markets.values())
+        metrics["fills"] = self.fills
+        return metrics
+
+    def attach_session(self, session):
+        super().attach_session(session)
+        endpoint = session.endpoint()
+        role = endpoint.role()
+        if role == DROP_COPY:
+            self.subscribe_drops(session, endpoint.queue_size(),
+                                 endpoint.policy())
+        elif role == TRADE_FEED:
+            self.subscribe_trades(session, endpoint.queue_size(),
+                                  endpoint.policy())
+        return
+
+    def detach_session(self, session):
+        super().detach_session(session)
+        self.market_data.remove_session(session)
+        self.bus.remove_session(session)
+        return
+
+    def deliver(self, message):
+        self.messages_in += 1
+        self.handle_trade_flow(message)
+        self.send_market_data_update()
+        self.bus.flush()
+        return
+
+    def deliver_batch(self, messages: list):
+        self.messages_in += len(messages)
+        for message in messages:
+            self.handle_trade_flow(message)
+        self.send_market_data_update()
+        self.bus.flush()
+        return
 
     def handle_trade_flow(self, message):
 
         if not hasattr(message, 'type'):
-            self.log("Bad message:", str(message))
+            logger.warning("Bad message: %s", message)
             return
 
         t = message.type
         if t == NEW_ORDER_MESSAGE:
-            pass
+            self.handle_new_order(message)
 
         elif t == MODIFY_ORDER_MESSAGE:
-            pass
+            self.handle_modify_order(message)
 
         elif t == CANCEL_ORDER_MESSAGE:
-            pass
+            self.handle_cancel_order(message)
 
         elif t == CANCEL_ALL_MESSAGE:
-            pass
+            self.handle_cancel_all(message)
+
+        elif t == SUBSCRIBE_MESSAGE:
+            self.handle_subscribe(message)
+
+        elif t == UNSUBSCRIBE_MESSAGE:
+            self.handle_unsubscribe(message)
 
         else:
-            self.log("Bad message type:", t)
+            logger.warning("Bad message type: %s", t)
             return
 
     def handle_new_order(self, message):
         """Process new order."""
+        orders = self._clients.setdefault(message.session, {})
+        if message.client_order_id in orders:
+            self.send_order_reject(message, "Duplicate order identifier")
+            return
+
+        if message.side not in (Side.BUY, Side.SELL):
+            self.send_order_reject(message, "Bad side")
+            return
+
+        if message.quantity <= 0:
+            self.send_order_reject(message, "Bad quantity")
+            return
+
+        price = None if message.order_type == MARKET_ORDER else message.price
+        handle = self.orders.allocate(message.client_order_id,
+                                      message.session,
+                                      message.symbol,
+                                      message.side,
+                                      message.order_type,
+                                      message.time_in_force,
+                                      message.quantity,
+                                      price)
+        orders[message.client_order_id] = handle
+        self.send_order_ack(handle)
+
+        book = self.get_book(message.symbol)
+        fills = book.add_order(handle)
+        remaining = self.orders.remaining_quantity[handle]
+        self.report_fills(handle, fills)
+
+        # Unmatched quantity of an unpriced order is cancelled.
+        if remaining > 0 and price is None:
+            self.send_order_cancelled(handle)
+        return
+
+    def handle_modify_order(self, message):
+        """Process attempt to modify an open order."""
+        handle = self.rename_order(message)
+        if handle is None:
+            return
+
+        book = self.markets[message.symbol]
+        fills = book.modify_order(self.orders.order_id[handle],
+                                  message.quantity,
+                                  message.price)
+        self.send_replace_ack(handle)
+
+        # Reducing the quantity to no more than was filled completes it.
+        if not fills and self.orders.remaining_quantity[handle] == 0:
+            self.finish_order(handle)
+        self.report_fills(handle, fills)
         return
 
     def handle_cancel_order(self, message):
         """Process attempt to cancel an open oerder."""
+        handle = self.rename_order(message)
+        if handle is None:
+            return
+
+        self.markets[message.symbol].cancel_order(self.orders.order_id[handle])
+        self.send_order_cancelled(handle)
+        return
+
+    def handle_cancel_all(self, message):
+        """Cancel all open orders for a session, optionally by symbol."""
+        store = self.orders
+        for handle in list(self._clients.get(message.session, {}).values()):
+            if message.symbol and store.symbol[handle] != message.symbol:
+                continue
+
+            book = self.markets[store.symbol[handle]]
+            if book.get_order(store.order_id[handle]) is not None:
+                book.cancel_order(store.order_id[handle])
+                self.send_order_cancelled(handle)
+        return
+
+    def report_fills(self, handle: int, fills: typing.List[Fill]):
+        """Send execution reports for both parties to each fill.
+
+        :param handle: Incoming order, after matching.
+        :param fills: Matches made by the incoming order."""
+
+        # Each resting order is matched at most once per incoming order,
+        # but the incoming order might have several fills, so calculate
+        # its remaining quantity after each.
+        leaves = self.orders.remaining_quantity[handle] + \
+            sum(f.quantity for f in fills)
+        trades = self.bus.has_subscribers(TRADES)
+        self.fills += len(fills)
+        for fill in fills:
+            execution_id = next(self._execution_ids)
+            if trades:
+                self.publish_trade(handle, fill, execution_id)
+            leaves -= fill.quantity
+            self.send_order_execution(
+                fill.resting, fill, execution_id,
+                self.orders.remaining_quantity[fill.resting])
+            self.send_order_execution(handle, fill, execution_id, leaves)
+        return
+
+    def rename_order(self, message) -> typing.Optional[int]:
+        """Find the resting order for a modify or cancel request.
+
+        :param message: Modify or cancel request.
+        :returns: Order handle, or None if the request was rejected.
+
+        The order is re-keyed with the request's client order id."""
+        orders = self._clients.get(message.session, {})
+        handle = orders.get(message.original_client_order_id)
+        book = self.markets.get(message.symbol)
+        if handle is None or book is None or \
+                book.get_order(self.orders.order_id[handle]) is None:
+            self.send_cancel_reject(message, "Unknown order")
+            return None
+
+        if message.client_order_id != message.original_client_order_id \
+                and message.client_order_id in orders:
+            self.send_cancel_reject(message, "Duplicate order identifier")
+            return None
+
+        del orders[message.original_client_order_id]
+        orders[message.client_order_id] = handle
+        self.orders.client_order_id[handle] = message.client_order_id
+        return handle
+
+    def finish_order(self, handle: int):
+        """Forget a completed order, and release its storage."""
+        store = self.orders
+        orders = self._clients.get(store.session[handle])
+        if orders is not None:
+            orders.pop(store.client_order_id[handle], None)
+        store.release(handle)
         return
 
     def handle_subscribe(self, message):
-        """Process request for streaming prices."""
+        """Process request for streaming prices.
+
+        Each symbol's book is sent as a snapshot, followed by updates
+        to its price levels, unless only a snapshot was requested."""
+        session = message.session
+        if not message.symbols:
+            self.send_subscribe_reject(message, "No symbols requested")
+            return
+
+        if self.market_data.is_subscribed(session, message.request_id):
+            self.send_subscribe_reject(message, "Duplicate request identifier")
+            return
+
+        for symbol in message.symbols:
+            book = self.get_book(symbol)
+            if message.snapshot_only:
+                self.market_data.send_snapshot(session, message.request_id,
+                                               book)
+            else:
+                self.market_data.subscribe(session, message.request_id, book,
+                                           message.conflation_interval)
         return
 
     def handle_unsubscribe(self, message):
         """Process request to cancel streaming prices."""
+        if not self.market_data.unsubscribe(message.session,
+                                            message.request_id):
+            self.send_subscribe_reject(message, "Unknown request identifier")
         return
 
     def handle_quote(self, message):
@@ -111,6 +363,27 @@ class DefaultEngine(Engine):
     def publish_message(self, message):
         return
 
+    def publish_trade(self, handle: int, fill: Fill, execution_id: int):
+        """Publish a trade to trade-feed subscribers."""
+        symbol = self.orders.symbol[handle]
+        self.bus.publish(TRADES, {"type": "trade",
+                                  "symbol": symbol,
+                                  "price": fill.price,
+                                  "quantity": fill.quantity,
+                                  "execution_id": execution_id},
+                         symbol)
+        return
+
+    def send_drop_copy(self, report: dict):
+        """Publish an order report to drop-copy subscribers.
+
+        The report is shared with the order's owner, and with every
+        subscriber, so mustn't be modified once sent."""
+        if self.bus.has_subscribers(DROPS):
+            self.bus.publish(DROPS, {"type": "drop_copy", "report": report},
+                             report.get("order_id"))
+        return
+
     def send_login_ack(self, message):
         """Acknowledge successful login."""
         return
@@ -131,22 +404,101 @@ class DefaultEngine(Engine):
         """Acknowledge successful subscription."""
         return
 
-    def send_subscribe_reject(self, message):
+    def send_subscribe_reject(self, message, reason: str):
         """Acknowledge unsuccessful subscription."""
+        self.send(message.session, {"type": "subscribe_reject",
+                                    "request_id": message.request_id,
+                                    "reason": reason})
         return
 
-    def send_market_data_update(self, message):
-        """Publish new quote to subscribers."""
+    def send_market_data_update(self):
+        """Publish changes to subscribed books."""
+        self.market_data.collect()
         return
 
-    def send_order_ack(self, message):
+    def send_order_ack(self, handle: int):
         """Acknowledge new order."""
+        report = self.order_report("order_ack", handle)
+        self.send(self.orders.session[handle], report)
+        self.send_drop_copy(report)
+        return
+
+    def send_order_reject(self, message, reason: str):
+        """Reject a new order."""
+        report = {"type": "order_reject",
+                  "client_order_id": message.client_order_id,
+                  "symbol": message.symbol,
+                  "side": message.side,
+                  "quantity": message.quantity,
+                  "price": message.price,
+                  "reason": reason}
+        self.send(message.session, report)
+        self.send_drop_copy(report)
+        return
+
+    def send_replace_ack(self, handle: int):
+        """Acknowledge order modification."""
+        report = self.order_report("replace_ack", handle)
+        self.send(self.orders.session[handle], report)
+        self.send_drop_copy(report)
         return
 
-    def send_order_cancelled(self, message):
+    def send_cancel_reject(self, message, reason: str):
+        """Reject an attempt to modify or cancel an order."""
+        report = {"type": "cancel_reject",
+                  "client_order_id": message.client_order_id,
+                  "original_client_order_id":
+                      message.original_client_order_id,
+                  "symbol": message.symbol,
+                  "reason": reason}
+        self.send(message.session, report)
+        return
+
+    def send_order_cancelled(self, handle: int):
         """Report cancellation of remaining order quantity."""
+        report = self.order_report("order_cancelled", handle)
+        report["leaves_quantity"] = 0
+        self.send(self.orders.session[handle], report)
+        self.send_drop_copy(report)
+        self.finish_order(handle)
         return
 
-    def send_order_execution(self, message):
+    def send_order_execution(self, handle: int, fill: Fill,
+                             execution_id: int, leaves_quantity: int):
         """Report execution of some order quantity."""
+        report = self.order_report("order_executed", handle)
+        report["execution_id"] = execution_id
+        report["last_quantity"] = fill.quantity
+        report["last_price"] = fill.price
+        report["leaves_quantity"] = leaves_quantity
+        report["cum_quantity"] = report["quantity"] - leaves_quantity
+        self.send(self.orders.session[handle], report)
+        self.send_drop_copy(report)
+        if self.has_subscribers("execution"):
+            self.publish("execution", dict(report))
+
+        if leaves_quantity == 0:
+            self.finish_order(handle)
+        return
+
+    def order_report(self, report_type: str, handle: int) -> dict:
+        """Return a message dictionary describing an order's state."""
+        store = self.orders
+        quantity = store.quantity[handle]
+        remaining = store.remaining_quantity[handle]
+        return {"type": report_type,
+                "order_id": store.order_id[handle],
+                "client_order_id": store.client_order_id[handle],
+                "symbol": store.symbol[handle],
+                "side": store.side[handle],
+                "order_type": store.order_type[handle],
+                "quantity": quantity,
+                "price": store.get_price(handle),
+                "leaves_quantity": remaining,
+                "cum_quantity": quantity - remaining}
+
+    def send(self, session, message: dict):
+        """Pass a message to a session's protocol for sending."""
+        if session is not None:
+            session.protocol().send(message)
         return
@@ -21,12 +21,22 @@
 
 import logging
 import socket
+import typing
 
+from . import bus
 from .engine import Engine
+from .metrics import SESSION_COUNTERS
 from .protocol import Protocol
 from .session import Session
 
 
+# Endpoint roles: the kind of session each endpoint accepts.
+ORDER_ENTRY = "order_entry"
+DROP_COPY = "drop_copy"
+TRADE_FEED = "trade_feed"
+ROLES = (ORDER_ENTRY, DROP_COPY, TRADE_FEED)
+
+
 class Endpoint:
     """
     An Endpoint represents the combination of a listening socket,
@@ -34,18 +44,41 @@ class Endpoint:
     clients, and creates a Session for each connection.
     """
 
-    def __init__(self, name: str, port: int, protocol: Protocol, engine: Engine):
+    def __init__(self, name: str, port: int, protocol: Protocol,
+                 engine: Engine, role: str = ORDER_ENTRY,
+                 queue_size: int = bus.DEFAULT_QUEUE_SIZE,
+                 policy: str = bus.DEFAULT_POLICY):
         """Constructor.
 
         :param name: Name of listening endpoint.
         :param port: TCP port number on which to accept connections.
         :param protocol: Protocol instance for this Endpoint.
-        :param engine: Engine instance to receive inbound messages."""
+        :param engine: Engine instance to receive inbound messages.
+        :param role: ORDER_ENTRY, or DROP_COPY or TRADE_FEED for sessions
+            that follow the engine's drop copies or trades.
+        :param queue_size: Maximum events queued for a following session.
+        :param policy: What to do when a following session's queue is
+            full: bus.DROP, bus.CONFLATE or bus.DISCONNECT."""
+
+        if role not in ROLES:
+            raise ValueError(f"Bad endpoint role: '{role}'")
+        if policy not in bus.POLICIES:
+            raise ValueError(f"Bad queue policy: '{policy}'")
+        if not isinstance(queue_size, int) or queue_size < 1:
+            raise ValueError(f"Bad queue size: {queue_size}")
 
         self._name = name
         self._port = port
         self._protocol = protocol
         self._engine = engine
+        self._role = role
+        self._queue_size = queue_size
+        self._policy = policy
+
+        # Open sessions, and metrics totals for those already closed.
+        self._sessions: typing.Set[Session] = set()
+        self._sessions_accepted = 0
+        self._closed_totals = dict.fromkeys(SESSION_COUNTERS, 0)
 
         # Open socket and listen for connections.
         self._socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
@@ -54,6 +87,10 @@ class Endpoint:
         self._socket.listen(5)
         return
 
+    def name(self):
+        """Return name of this Endpoint."""
+        return self._name
+
     def socket(self):
         """Return listening socket."""
         return self._socket
@@ -66,6 +103,55 @@ class Endpoint:
         """Return reference to Endpoint's configured Protocol."""
         return self._protocol
 
+    def role(self) -> str:
+        """Return the role of this Endpoint's sessions."""
+        return self._role
+
+    def queue_size(self) -> int:
+        """Return maximum events queued for a following session."""
+        return self._queue_size
+
+    def policy(self) -> str:
+        """Return the policy for a following session's full queue."""
+        return self._policy
+
+    def session_opened(self, session: Session):
+        """Count a new session, for metrics."""
+        self._sessions.add(session)
+        self._sessions_accepted += 1
+        return
+
+    def session_closed(self, session: Session):
+        """Add a closing session's counters to the endpoint's totals."""
+        if session in self._sessions:
+            self._sessions.remove(session)
+            metrics = session.get_metrics()
+            for name in SESSION_COUNTERS:
+                self._closed_totals[name] += metrics[name]
+        return
+
+    def set_property(self, name: str, value):
+        """Configure this endpoint.
+
+        :param name: Property name.
+        :param value: New value, of a JSON-compatible type.
+
+        Endpoints don't yet have any properties."""
+        raise KeyError(f"No such endpoint property: '{name}'")
+
+    def get_metrics(self) -> dict:
+        """Return this endpoint's metrics, as JSON-compatible values.
+
+        Counters include the traffic of sessions already closed."""
+        metrics = dict(self._closed_totals)
+        for session in self._sessions:
+            session_metrics = session.get_metrics()
+            for name in SESSION_COUNTERS:
+                metrics[name] += session_metrics[name]
+        metrics["sessions_accepted"] = self._sessions_accepted
+        metrics["sessions_open"] = len(self._sessions)
+        return metrics
+
     def close(self):
         """Stop listening for connections on this endpoint."""
         self._socket.close()
@@ -75,5 +161,7 @@ class Endpoint:
     def accept(self) -> Session:
         """Accept an inbound connection to this endpoint."""
         client_sock, client_addr = self._socket.accept()
+        client_sock.setblocking(False)
+        client_sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
         session = Session(client_sock, client_addr, self)
         return session
@@ -31,6 +31,81 @@ class Engine:
         self._name = name
 
         self._sessions = []
+        self._is_running = False
+        self._server = None
+        return
+
+    def set_server(self, server):
+        """Set reference to the Server hosting this Engine."""
+        self._server = server
+        return
+
+    def server(self):
+        """Return the Server hosting this Engine, or None."""
+        return self._server
+
+    def has_subscribers(self, topic: str) -> bool:
+        """Return True if events for a topic would be sent anywhere.
+
+        :param topic: Event topic name."""
+        return self._server is not None and \
+            self._server.has_subscribers(topic)
+
+    def publish(self, topic: str, event: dict):
+        """Publish an event to the server's management subscribers.
+
+        :param topic: Event topic name.
+        :param event: Event dictionary, of JSON-compatible values."""
+        if self._server is not None:
+            event["engine"] = self._name
+            self._server.publish(topic, event)
+        return
+
+    def get_book_snapshot(self, symbol: str, max_levels: int = 0) -> dict:
+        """Return a snapshot of a book's price levels.
+
+        :param symbol: Symbol of book.
+        :param max_levels: Maximum number of levels per side, or zero
+            for all."""
+        raise NotImplementedError()
+
+    def set_property(self, name: str, value):
+        """Configure this engine.
+
+        :param name: Property name.
+        :param value: New value, of a JSON-compatible type.
+
+        The base class has no properties: derived engines override this
+        to define their own."""
+        raise KeyError(f"No such engine property: '{name}'")
+
+    def get_metrics(self) -> dict:
+        """Return this engine's metrics, as JSON-compatible values.
+
+        Derived engines extend this with their own counters, using the
+        names known to the metrics module where they apply."""
+        return {"sessions_attached": len(self._sessions)}
+
+    def name(self) -> str:
+        """Return this engine's name."""
+        return self._name
+
+    def is_running(self) -> bool:
+        """Return True if this engine has been started."""
+        return self._is_running
+
+    def start(self):
+        """Start processing orders."""
+        self._is_running = True
+        return
+
+    def stop(self):
+        """Stop processing orders."""
+        self._is_running = False
+        return
+
+    def delete(self):
+        """Release this engine's resources, before it is discarded."""
         return
 
     def attach_session(self, session: Session):
@@ -40,6 +115,22 @@ class Engine:
         return
 
     def detach_session(self, session: Session):
-        """Detach a Session from this Engine."""
-        self._sessions.remove(session)
+        """Detach a Session from this Engine.
+
+        Called by the server when a session closes."""
+        if session in self._sessions:
+            self._sessions.remove(session)
+        return
+
+    def deliver(self, message):
+        """Process a message received from a Session."""
+        return
+
+    def deliver_batch(self, messages: list):
+        """Process a list of messages received together from a Session.
+
+        Engines that can handle a batch more efficiently than message by
+        message should override this."""
+        for message in messages:
+            self.deliver(message)
         return
@@ -0,0 +1,101 @@
+# -*- coding: utf-8 -*-
+########################################################################
+# exsim - Exchange Simulator
+# Copyright (C) 2016-2023, zeroXone.
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see http://www.gnu.org/licenses/
+#
+########################################################################
+
+# Within a FIX session, the start of every message is the same apart
+# from MsgType, MsgSeqNum and SendingTime: BeginString and the CompIDs
+# are fixed at logon.  So the encoder keeps a pre-encoded header for
+# each message type, together with its length and checksum, and only
+# formats the sequence number, time and body of each message.
+#
+# The checksum is the sum of all bytes before the CheckSum field, so
+# it can be built from the partial sums of the constant and variable
+# parts without re-scanning the header.
+
+import decimal
+import typing
+
+
+SOH = b'\x01'
+
+
+def format_price(price: float) -> bytes:
+    """Return the shortest FIX encoding of a price.
+
+    Whole numbers are encoded without a decimal point.  FIX floats
+    can't use exponent notation, so very small or large values are
+    written out in full."""
+    text = b"%.15g" % price
+    if b"e" in text:
+        text = format(decimal.Decimal(text.decode()), "f").encode()
+    return text
+
+
+class FixEncoder:
+    """Per-session FIX message encoder."""
+
+    def __init__(self, sender_comp_id: str, target_comp_id: str,
+                 begin_string: str = "FIX.4.2"):
+        """Constructor.
+
+        :param sender_comp_id: SenderCompID (49) for sent messages.
+        :param target_comp_id: TargetCompID (56) for sent messages.
+        :param begin_string: BeginString (8) for sent messages."""
+        self._begin = b"8=%s\x019=" % begin_string.encode()
+        self._begin_sum = sum(self._begin)
+        self._comp_ids = b"\x0149=%s\x0156=%s\x0134=" % \
+            (sender_comp_id.encode(), target_comp_id.encode())
+
+        # Map of MsgType to (header, length, checksum), where the
+        # header runs from MsgType to the MsgSeqNum tag.
+        self._templates: typing.Dict[bytes, typing.Tuple[bytes, int, int]] = {}
+        return
+
+    def encode(self, message_type: bytes, sequence: int,
+               sending_time: bytes, body: bytes = b"",
+               body_sum: typing.Optional[int] = None) -> bytes:
+        """Return an encoded message.
+
+        :param message_type: MsgType (35) value.
+        :param sequence: MsgSeqNum (34) value.
+        :param sending_time: Formatted SendingTime (52) value.
+        :param body: Encoded body fields, each terminated by SOH.
+        :param body_sum: Sum of the body's bytes, if already known (eg.
+            for a body sent to many sessions).
+        :returns: Complete message, including BodyLength and CheckSum."""
+        template = self._templates.get(message_type)
+        if template is None:
+            template = self._add_template(message_type)
+        header, header_length, header_sum = template
+
+        variable = b"%d\x0152=%s\x01" % (sequence, sending_time)
+        if body_sum is None:
+            body_sum = sum(body)
+        length = b"%d\x01" % (header_length + len(variable) + len(body))
+        checksum = (self._begin_sum + sum(length) + header_sum +
+                    sum(variable) + body_sum) & 0xff
+        return b"".join((self._begin, length, header, variable, body,
+                         b"10=%03d\x01" % checksum))
+
+    def _add_template(self, message_type: bytes):
+        """(Internal) Pre-encode the header for a message type."""
+        header = b"35=" + message_type + self._comp_ids
+        template = (header, len(header), sum(header))
+        self._templates[message_type] = template
+        return template
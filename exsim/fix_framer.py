@@ -0,0 +1,233 @@
+# -*- coding: utf-8 -*-
+########################################################################
+# exsim - Exchange Simulator
+# Copyright (C) 2016-2023, zeroXone.
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see http://www.gnu.org/licenses/
+#
+########################################################################
+
+# Splitting a FIX byte stream into messages only needs the standard
+# header and trailer: BeginString (8) marks the start, BodyLength (9)
+# gives the position of the CheckSum (10) field, and the checksum
+# covers everything before it.  So the framer finds those using
+# bytes.find() and slicing on the receive buffer, rather than parsing
+# every field, and leaves the body to be decoded on demand.
+
+import logging
+import typing
+
+
+logger = logging.getLogger("exsim.protocol")
+
+
+SOH = b'\x01'
+
+# Start of every FIX (and FIXT) message.
+_BEGIN_STRING = b'8=FIX'
+
+# Length of the checksum field, "10=nnn<SOH>".
+_CHECKSUM_FIELD_LENGTH = 7
+
+# Largest BodyLength accepted.  A message claiming to be longer is
+# discarded, rather than buffering input until it's complete.
+MAX_BODY_LENGTH = 64 * 1024
+
+
+class FixFrame:
+    """A complete, validated FIX message.
+
+    Fields are not decoded until requested: get() searches the raw
+    message for the tag, so a handler only pays for the fields it
+    actually reads.  As with any FIX parser that doesn't know the
+    message's data-length fields, binary data fields containing SOH
+    characters are not supported."""
+
+    __slots__ = ("raw",)
+
+    def __init__(self, raw: bytes):
+        """Constructor.
+
+        :param raw: Encoded message, from BeginString to CheckSum."""
+        self.raw = raw
+        return
+
+    def __len__(self):
+        return len(self.raw)
+
+    @property
+    def message_type(self) -> typing.Optional[bytes]:
+        """Return the MsgType (35) value."""
+        return self.get(35)
+
+    def get(self, tag, nth: int = 1) -> typing.Optional[bytes]:
+        """Return n-th value for tag.
+
+        :param tag: FIX field tag number
+        :param nth: Index of tag if repeating
+        :return: None if nothing found, otherwise value matching tag."""
+        raw = self.raw
+        needle = b'\x01%d=' % int(tag)
+        point = -1
+        for _ in range(nth):
+            point = raw.find(needle, point + 1)
+            if point < 0:
+                # BeginString is the only field without a leading SOH.
+                if nth == 1 and raw.startswith(needle[1:]):
+                    return raw[len(needle) - 1:raw.find(SOH)]
+                return None
+
+        start = point + len(needle)
+        return raw[start:raw.find(SOH, start)]
+
+    def pairs(self) -> typing.List[typing.Tuple[int, bytes]]:
+        """Decode and return all fields as a list of (tag, value)."""
+        result = []
+        for field in self.raw.split(SOH)[:-1]:
+            tag, _, value = field.partition(b'=')
+            result.append((int(tag), value))
+        return result
+
+    def __str__(self):
+        return self.raw.replace(SOH, b'|').decode('ascii', 'replace')
+
+
+class FixFramer:
+    """Incremental FIX message framer.
+
+    Received bytes are appended to a single bytearray.  Consumed data
+    is only discarded once it makes up most of the buffer, so the cost
+    of shifting the unconsumed tail is amortised across many messages.
+    Each complete message is copied out of the buffer exactly once,
+    when its FixFrame is created."""
+
+    def __init__(self, validate_checksum: bool = True):
+        """Constructor.
+
+        :param validate_checksum: If False, don't verify message checksums."""
+        self._buffer = bytearray()
+        self._start = 0
+        self._validate_checksum = validate_checksum
+
+        # Count of malformed or corrupt messages discarded.
+        self.errors = 0
+        return
+
+    def __len__(self):
+        """Return the number of buffered, unconsumed bytes."""
+        return len(self._buffer) - self._start
+
+    def reset(self):
+        """Discard all buffered data."""
+        self._buffer = bytearray()
+        self._start = 0
+        return
+
+    def append_buffer(self, data: bytes):
+        """Append received bytes to the buffer."""
+        buf = self._buffer
+        start = self._start
+        if start and start >= len(buf) - start:
+            del buf[:start]
+            self._start = 0
+        buf += data
+        return
+
+    def get_frame(self) -> typing.Optional[FixFrame]:
+        """Return the next complete message, or None."""
+        buf = self._buffer
+        while True:
+            start = self._start
+            end = len(buf)
+
+            begin = buf.find(_BEGIN_STRING, start)
+            if begin < 0:
+                # Keep any partial BeginString at the end of the buffer.
+                self._start = max(start, end - len(_BEGIN_STRING) + 1)
+                return None
+
+            if begin != start:
+                logger.debug("Skipped %d bytes before FIX BeginString",
+                             begin - start)
+
+            begin_end = buf.find(SOH, begin)
+            if begin_end < 0:
+                self._start = begin
+                return None
+
+            if buf[begin_end + 1:begin_end + 3] != b'9=':
+                if begin_end + 3 > end:
+                    self._start = begin
+                    return None
+                self._discard(begin, "missing BodyLength")
+                continue
+
+            length_end = buf.find(SOH, begin_end + 3)
+            if length_end < 0:
+                self._start = begin
+                return None
+
+            try:
+                body_length = int(buf[begin_end + 3:length_end])
+            except ValueError:
+                self._discard(begin, "bad BodyLength")
+                continue
+            if not 0 <= body_length <= MAX_BODY_LENGTH:
+                self._discard(begin, f"bad BodyLength {body_length}")
+                continue
+
+            trailer = length_end + 1 + body_length
+            frame_end = trailer + _CHECKSUM_FIELD_LENGTH
+            if frame_end > end:
+                self._start = begin
+                return None
+
+            if buf[trailer:trailer + 3] != b'10=' or \
+                    buf[frame_end - 1] != 0x01:
+                self._discard(begin, "CheckSum not found at BodyLength")
+                continue
+
+            with memoryview(buf) as view:
+                if self._validate_checksum:
+                    try:
+                        expected = int(buf[trailer + 3:frame_end - 1])
+                    except ValueError:
+                        expected = -1
+                    if sum(view[begin:trailer]) & 0xff != expected:
+                        self._start = frame_end
+                        self.errors += 1
+                        logger.warning("Discarded FIX message with bad "
+                                       "CheckSum")
+                        continue
+
+                frame = FixFrame(bytes(view[begin:frame_end]))
+
+            self._start = frame_end
+            return frame
+
+    def get_frames(self) -> typing.List[FixFrame]:
+        """Return all complete buffered messages."""
+        frames = []
+        frame = self.get_frame()
+        while frame is not None:
+            frames.append(frame)
+            frame = self.get_frame()
+        return frames
+
+    def _discard(self, begin: int, reason: str):
+        """(Internal) Skip a malformed message header."""
+        self._start = begin + len(_BEGIN_STRING)
+        self.errors += 1
+        logger.warning("Discarded malformed FIX message: %s", reason)
+        return
@@ -18,16 +18,63 @@
 #
 ########################################################################
 
-import datetime
 import logging
-import simplefix
+import math
+import typing
 
+from .clock import FixClock
+from .fix_encoder import FixEncoder, format_price
+from .fix_framer import FixFramer
+from .message import *
 from .protocol import Protocol
+from .side import Side
+
+
+logger = logging.getLogger("exsim.protocol")
+
+
+# FIX Side (54) and OrdType (40) values.
+_FIX_SIDES = {b"1": Side.BUY, b"2": Side.SELL}
+_FIX_ORDER_TYPES = {b"1": MARKET_ORDER, b"2": LIMIT_ORDER}
+_ORDER_TYPES_FIX = {MARKET_ORDER: b"1", LIMIT_ORDER: b"2"}
+
+# ExecutionReport body, up to the optional price and fill fields.
+_EXECUTION_REPORT = (b"37=%d\x0111=%s\x0117=%s\x01150=%s\x0139=%s\x01"
+                     b"55=%s\x0154=%d\x0140=%s\x0138=%d\x01")
+
+# ExecType (150) and OrdStatus (39) for order reports.
+_REPORT_STATUSES = {"order_ack": b"0",
+                    "order_cancelled": b"4",
+                    "replace_ack": b"5"}
+
+# FIX MDEntryType (269) values for each side.
+_MD_ENTRY_TYPES = {Side.BUY: b"0", Side.SELL: b"1"}
+
+# User-defined tag for the conflation interval, in milliseconds, of a
+# MarketDataRequest.
+CONFLATION_INTERVAL_TAG = 5000
+
+
+def _decode_price(value: typing.Optional[bytes]) -> typing.Optional[float]:
+    """(Internal) Return a Price (44) value, or None if it's absent.
+
+    float() accepts "nan" and "inf", which would corrupt the book's
+    ordering, so they raise ValueError like any other bad value."""
+    if not value:
+        return None
+    price = float(value)
+    if not math.isfinite(price):
+        raise ValueError(f"Bad price: {value!r}")
+    return price
 
 
 class FixProtocol(Protocol):
     """A basic FIX protocol module."""
 
+    # Source of SendingTime values.  Shared by all sessions, so that
+    # the cached date and time are reused across them.
+    clock = FixClock()
+
     def __init__(self, session):
         super().__init__(session)
 
@@ -40,8 +87,8 @@ class FixProtocol(Protocol):
 
         Discards any received by unprocessed data."""
 
-        # Parser.
-        self._parser = simplefix.FixParser()
+        # Framer.
+        self._framer = FixFramer()
 
         # My CompID.
         self._my_comp_id = ""
@@ -49,6 +96,12 @@ class FixProtocol(Protocol):
         # Peer's CompID.
         self._peer_comp_id = ""
 
+        # BeginString used by peer.
+        self._begin_string = "FIX.4.2"
+
+        # Encoder for sent messages.
+        self._encoder = FixEncoder(self._my_comp_id, self._peer_comp_id)
+
         # Next expected sequence number.
         self._in_seq = 1
 
@@ -60,46 +113,103 @@ class FixProtocol(Protocol):
 
         # Outstanding test request identifiers.
         self._test_requests = {}
+
+        # Count of messages rejected for undecodable field values.
+        self._rejected = 0
         return
 
     def receive(self, buf):
-        """Process a byte buffer received from the session."""
-        return self._parser.append_buffer(buf)
+        """Process a byte buffer received from the session.
 
-    def get_message(self):
-        fix_message =  self._parser.get_message()
-        if not fix_message:
-            #FIXME
-            return
+        :param buf: Received bytes.
+        :returns: List of messages for the engine."""
+        self._framer.append_buffer(buf)
 
-        t = fix_message.get(35)
-        if not t:
-            #FIXME
-            return
+        messages = []
+        frame = self._framer.get_frame()
+        while frame is not None:
+            message = self.get_message(frame)
+            if message is not None:
+                message.session = self.session
+                messages.append(message)
+            frame = self._framer.get_frame()
+        return messages
+
+    def parse_errors(self) -> int:
+        return self._framer.errors + self._rejected
 
-        if t == "D":
-            msg = self.receive_fix_new_order_single(fix_message)
+    def get_message(self, fix_message):
+        """Dispatch a received FIX message.
 
-        elif t == '0':
+        :param fix_message: FixFrame, from the framer.
+        :returns: Message for the engine, or None."""
+        self._in_seq += 1
+
+        t = fix_message.get(35)
+        if not t:
+            logger.warning("Received FIX message without MsgType: %s",
+                           fix_message)
+            return None
+
+        # Field values are decoded with int(), float() and decode(), so
+        # a malformed one raises ValueError: that rejects the message,
+        # rather than escaping into the event loop.
+        try:
+            return self.dispatch_message(t, fix_message)
+        except ValueError as e:
+            logger.warning("Rejected FIX message: %s: %s", e, fix_message)
+            self._rejected += 1
+            self.send_reject(fix_message, t)
+            return None
+
+    def dispatch_message(self, t: bytes, fix_message):
+        """Pass a received FIX message to its handler.
+
+        :param t: MsgType (35) value.
+        :param fix_message: FixFrame, from the framer.
+        :returns: Message for the engine, or None."""
+        if t == b"D":
+            return self.receive_fix_new_order_single(fix_message)
+
+        elif t == b"F":
+            return self.receive_fix_cancel_request(fix_message)
+
+        elif t == b"G":
+            return self.receive_fix_cancel_replace_request(fix_message)
+
+        elif t == b"V":
+            return self.receive_fix_market_data_request(fix_message)
+
+        elif t == b"0":
             self.receive_fix_heartbeat(fix_message)
 
-        elif t == '1':
+        elif t == b"1":
             self.receive_fix_test_request(fix_message)
 
-        elif t == 'A':
-             self.receive_fix_logon(fix_message)
+        elif t == b"A":
+            self.receive_fix_logon(fix_message)
 
-        elif t == '5':
-             self.receive_fix_logout(fix_message)
+        elif t == b"5":
+            self.receive_fix_logout(fix_message)
 
         else:
-             logging.warning("Unhandled message: %s" % str(fix_message))
+            logger.warning("Unhandled message: %s", fix_message)
 
-        return
+        return None
 
     def receive_fix_logon(self, fix_message):
-        # Save CompIDs
-        # Set heartbeat interval
+        # Our CompID is the peer's TargetCompID, and vice versa.
+        self._my_comp_id = (fix_message.get(56) or b"").decode()
+        self._peer_comp_id = (fix_message.get(49) or b"").decode()
+        self._begin_string = fix_message.get(8).decode()
+        self._encoder = FixEncoder(self._my_comp_id, self._peer_comp_id,
+                                   self._begin_string)
+
+        heartbeat_interval = fix_message.get(108)
+        if heartbeat_interval:
+            self._heartbeat_interval = int(heartbeat_interval) * 1000
+
+        self.send_login_ack(None)
         return
 
     def receive_fix_logout(self, fix_message):
@@ -110,15 +220,73 @@ class FixProtocol(Protocol):
 
     def receive_fix_test_request(self, fix_message):
         test_request_id = fix_message.get(112)
-        logging.info("Received FIX TestRequest, id = [%s]" % str(test_request_id))
+        logger.info("Received FIX TestRequest, id = [%s]", test_request_id)
         self.send_heartbeat(test_request_id)
         return
 
     def receive_fix_new_order_single(self, fix_message):
-        return
+        message = NewOrderMessage()
+        message.client_order_id = (fix_message.get(11) or b"").decode()
+        message.symbol = (fix_message.get(55) or b"").decode()
+        message.side = _FIX_SIDES.get(fix_message.get(54), 0)
+        message.order_type = _FIX_ORDER_TYPES.get(fix_message.get(40), "")
+        message.time_in_force = int(fix_message.get(59) or 0)
+        message.quantity = int(fix_message.get(38) or 0)
+
+        message.price = _decode_price(fix_message.get(44))
+        return message
 
     def receive_fix_cancel_request(self, fix_message):
-        return
+        message = CancelOrderMessage()
+        message.client_order_id = (fix_message.get(11) or b"").decode()
+        message.original_client_order_id = \
+            (fix_message.get(41) or b"").decode()
+        message.symbol = (fix_message.get(55) or b"").decode()
+        return message
+
+    def receive_fix_cancel_replace_request(self, fix_message):
+        message = ModifyOrderMessage()
+        message.client_order_id = (fix_message.get(11) or b"").decode()
+        message.original_client_order_id = \
+            (fix_message.get(41) or b"").decode()
+        message.symbol = (fix_message.get(55) or b"").decode()
+        message.quantity = int(fix_message.get(38) or 0)
+
+        message.price = _decode_price(fix_message.get(44))
+        return message
+
+    def receive_fix_market_data_request(self, fix_message):
+        request_id = (fix_message.get(262) or b"").decode()
+        request_type = fix_message.get(263)
+        if request_type == b"2":
+            message = UnsubscribeMessage()
+            message.request_id = request_id
+            return message
+
+        try:
+            interval = int(fix_message.get(CONFLATION_INTERVAL_TAG) or 0)
+            count = int(fix_message.get(146) or 0)
+            if interval < 0 or count < 0:
+                raise ValueError("negative value")
+        except ValueError as e:
+            logger.warning("Rejected FIX MarketDataRequest: %s: %s", e,
+                           fix_message)
+            self._rejected += 1
+            self.send_subscribe_reject({"request_id": request_id,
+                                        "reason": "Incorrect data format "
+                                                  "for value"})
+            return None
+
+        message = SubscribeMessage()
+        message.request_id = request_id
+        message.snapshot_only = request_type == b"0"
+        message.conflation_interval = interval
+        for n in range(1, count + 1):
+            symbol = fix_message.get(55, n)
+            if symbol is None:
+                break
+            message.symbols.append(symbol.decode())
+        return message
 
     def send_login_ack(self, message):
 
@@ -126,57 +294,225 @@ class FixProtocol(Protocol):
         # message.  In addtion to confirming authentication, it also
         # returns the agree heartbeat timeout period.
 
-        fix = simplefix.FixMessage()
-        fix.append_pair(35, "A")
-        fix.append_pair(34, self.next_seq())
-        fix.append_pair(49, self._my_comp_id)  # Sender
-        fix.append_pair(56, self._peer_comp_id)  # Target
-        fix.append_pair(52, self.get_fix_time())
-        fix.append_pair(98, 0)  # No encryption
-        fix.append_pair(108, self._heartbeat_interval)
-        self._session.send(fix.encode())
+        body = b"98=0\x01108=%d\x01" % (self._heartbeat_interval // 1000)
+        self.send_fix(b"A", body)
 
         # FIXME: set timer for heartbeats.
         #self._gateway.add_timeout(time.time() + self._heartbeat_interval, self.send_heartbeat)
 
-        logging.info("Sent FIX logon (login_ack)")
+        logger.info("Sent FIX logon (login_ack)")
         return
 
     def send_order_ack(self, message):
+        self.send_execution_report(message, b"0", b"0")
         return
 
     def send_order_reject(self, message):
+        self.send_fix(b"8", self.order_reject_body(message,
+                                                   b"R%d" % self._out_seq))
         return
 
+    def order_reject_body(self, message, execution_id: bytes) -> bytes:
+        """Return the body of an ExecutionReport rejecting an order."""
+        return b"37=NONE\x0111=%s\x0117=%s\x01150=8\x0139=8\x01" \
+               b"55=%s\x0154=%d\x0138=%d\x01151=0\x0114=0\x0158=%s\x01" % \
+               (message["client_order_id"].encode(),
+                execution_id,
+                message["symbol"].encode(),
+                message["side"],
+                message["quantity"],
+                message["reason"].encode())
+
     def send_order_cancelled(self, message):
+        self.send_execution_report(message, b"4", b"4")
         return
 
     def send_order_executed(self, message):
+        status = b"1" if message["leaves_quantity"] else b"2"
+        self.send_execution_report(message, status, status)
         return
 
     def send_cancel_ack(self, message):
+        self.send_execution_report(message, b"4", b"4")
         return
 
     def send_replace_ack(self, message):
+        self.send_execution_report(message, b"5", b"5")
+        return
+
+    def send_cancel_reject(self, message):
+        body = b"37=NONE\x0111=%s\x0141=%s\x0139=8\x01434=1\x0158=%s\x01" % \
+               (message["client_order_id"].encode(),
+                message["original_client_order_id"].encode(),
+                message["reason"].encode())
+        self.send_fix(b"9", body)
+        return
+
+    def send_execution_report(self, message, exec_type: bytes,
+                              status: bytes):
+        """Send an ExecutionReport describing an order's state.
+
+        :param message: Order report dictionary, from the engine.
+        :param exec_type: ExecType (150) value.
+        :param status: OrdStatus (39) value."""
+        execution_id = message.get("execution_id")
+        if execution_id is None:
+            execution_id = b"R%d" % self._out_seq
+        else:
+            execution_id = b"%d" % execution_id
+
+        self.send_fix(b"8", self.execution_report_body(
+            message, exec_type, status, execution_id))
+        return
+
+    def execution_report_body(self, message, exec_type: bytes,
+                              status: bytes, execution_id: bytes) -> bytes:
+        """Return the body of an ExecutionReport for an order report."""
+        parts = [_EXECUTION_REPORT % (
+            message["order_id"],
+            message["client_order_id"].encode(),
+            execution_id,
+            exec_type,
+            status,
+            message["symbol"].encode(),
+            message["side"],
+            _ORDER_TYPES_FIX.get(message["order_type"], b"2"),
+            message["quantity"])]
+
+        price = message["price"]
+        if price is not None:
+            parts.append(b"44=%s\x01" % format_price(price))
+
+        if "last_quantity" in message:
+            parts.append(b"32=%d\x0131=%s\x01" %
+                         (message["last_quantity"],
+                          format_price(message["last_price"])))
+
+        parts.append(b"151=%d\x0114=%d\x01" %
+                     (message["leaves_quantity"], message["cum_quantity"]))
+        return b"".join(parts)
+
+    def send_drop_copy(self, message):
+        # Drop copies are shared by all subscribers, so the first to
+        # send one caches the encoded body.  Reports other than
+        # executions get an ExecID from the bus's event sequence
+        # number, so it's the same for every subscriber.
+        encoded = message.get("fix_body")
+        if encoded is None:
+            report = message["report"]
+            report_type = report["type"]
+            execution_id = report.get("execution_id")
+            if execution_id is None:
+                execution_id = b"D%d" % message["sequence"]
+            else:
+                execution_id = b"%d" % execution_id
+
+            if report_type == "order_reject":
+                body = self.order_reject_body(report, execution_id)
+            else:
+                if report_type == "order_executed":
+                    status = b"1" if report["leaves_quantity"] else b"2"
+                else:
+                    status = _REPORT_STATUSES[report_type]
+                body = self.execution_report_body(report, status, status,
+                                                  execution_id)
+            encoded = (body, sum(body))
+            message["fix_body"] = encoded
+
+        self.send_fix(b"8", *encoded)
+        return
+
+    def send_trade(self, message):
+        # Trades are sent as MarketDataIncrementalRefresh, with a single
+        # trade entry, encoded once for all subscribers.
+        encoded = message.get("fix_body")
+        if encoded is None:
+            body = b"268=1\x01279=0\x01269=2\x01278=%d\x0155=%s\x01" \
+                   b"270=%s\x01271=%d\x01" % \
+                   (message["execution_id"],
+                    message["symbol"].encode(),
+                    format_price(message["price"]),
+                    message["quantity"])
+            encoded = (body, sum(body))
+            message["fix_body"] = encoded
+
+        self.send_fix(b"X", *encoded)
+        return
+
+    def send_market_data_snapshot(self, message):
+        levels = [(_MD_ENTRY_TYPES[Side.BUY], message["bids"]),
+                  (_MD_ENTRY_TYPES[Side.SELL], message["offers"])]
+        parts = [b"262=%s\x0155=%s\x01268=%d\x01" %
+                 (message["request_id"].encode(),
+                  message["symbol"].encode(),
+                  len(message["bids"]) + len(message["offers"]))]
+        for entry_type, side_levels in levels:
+            for price, quantity, count in side_levels:
+                parts.append(b"269=%s\x01270=%s\x01271=%d\x01346=%d\x01" %
+                             (entry_type, format_price(price), quantity,
+                              count))
+        self.send_fix(b"W", b"".join(parts))
+        return
+
+    def send_market_data_incremental(self, message):
+        # The same message is sent to every subscriber, so the body, and
+        # its contribution to the checksum, are calculated by the first,
+        # and reused by the rest.
+        encoded = message.get("fix_body")
+        if encoded is None:
+            symbol = message["symbol"].encode()
+            parts = [b"268=%d\x01" % len(message["entries"])]
+            for action, side, price, quantity, count in message["entries"]:
+                parts.append(b"279=%d\x01269=%s\x0155=%s\x01270=%s\x01" %
+                             (action, _MD_ENTRY_TYPES[side], symbol,
+                              format_price(price)))
+                if quantity:
+                    parts.append(b"271=%d\x01346=%d\x01" % (quantity, count))
+            body = b"".join(parts)
+            encoded = (body, sum(body))
+            message["fix_body"] = encoded
+
+        self.send_fix(b"X", *encoded)
+        return
+
+    def send_subscribe_reject(self, message):
+        body = b"262=%s\x0158=%s\x01" % (message["request_id"].encode(),
+                                          message["reason"].encode())
+        self.send_fix(b"Y", body)
+        return
+
+    def send_reject(self, fix_message, message_type: bytes):
+        """Send a session-level Reject for an undecodable message.
+
+        :param fix_message: Rejected FixFrame.
+        :param message_type: Its MsgType (35) value."""
+        # SessionRejectReason 6: incorrect data format for value.
+        body = b"45=%s\x01372=%s\x01373=6\x01" \
+               b"58=Incorrect data format for value\x01" % \
+               (fix_message.get(34) or b"0", message_type)
+        self.send_fix(b"3", body)
         return
 
     def send_heartbeat(self, test_request_id = None):
+        body = b"112=%s\x01" % test_request_id if test_request_id else b""
+        self.send_fix(b"0", body)
+        logger.debug("Sent FIX heartbeat, id = [%s]", test_request_id)
+        return
 
-        fix = simplefix.FixMessage()
-        fix.set_message_type('0')  # Heartbeat
-        fix.append_pair(34, self.next_seq())
-        fix.append_pair(49, self._my_compid)
-        fix.append_pair(56, self._peer_compid)
-        fix.append_pair(52, self.get_fix_time())
-        if test_request_id:
-            fix.append_pair(112, test_request_id)
+    def send_fix(self, message_type: bytes, body: bytes,
+                 body_sum: int = None):
+        """Encode and send a FIX message.
 
-        self._session.send(fix.encode())
-        logging.info("Sent FIX heartbeat" + " id = [%s]" % test_request_id if test_request_id else "")
+        :param message_type: MsgType (35) value.
+        :param body: Encoded body fields, after the standard header.
+        :param body_sum: Sum of the body's bytes, if already known."""
+        data = self._encoder.encode(message_type, self.next_seq(),
+                                    self.get_fix_time(), body, body_sum)
+        self.session.send(data)
         return
 
-    def get_fix_time(self):
-        return datetime.datetime.utcnow().isoformat('-')[:-3]
+    def get_fix_time(self) -> bytes:
+        return self.clock.now()
 
     def next_seq(self):
         seq = self._out_seq
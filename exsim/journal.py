@@ -0,0 +1,160 @@
+# -*- coding: utf-8 -*-
+########################################################################
+# exsim - Exchange Simulator
+# Copyright (C) 2016-2023, zeroXone.
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see http://www.gnu.org/licenses/
+#
+########################################################################
+
+# A journal records the bytes received from and sent to client
+# sessions, so that order flow can be replayed later (see replay.py).
+#
+# The file starts with a four byte identifier, followed by records,
+# each with a 17 byte header:
+#
+#   type        1 byte      OPEN, INBOUND, OUTBOUND or CLOSE
+#   session     4 bytes     session number, unique within the journal
+#   time        8 bytes     nanoseconds since the epoch
+#   length      4 bytes     length of the data that follows
+#
+# followed by the data: the bytes received or sent, or for OPEN, a
+# JSON object describing the session's endpoint.  All integers are
+# little-endian.
+#
+# Records are appended to an in-memory buffer, which is written to the
+# file when it fills, so recording costs a struct.pack() and a copy per
+# read or write.
+
+import json
+import struct
+import time
+import typing
+
+
+MAGIC = b"XSJ\x01"
+
+# Record types.
+OPEN = 1
+INBOUND = 2
+OUTBOUND = 3
+CLOSE = 4
+
+_HEADER = struct.Struct("<BIqI")
+
+
+class Journal:
+    """Append-only recording of session traffic."""
+
+    # Write buffered records once there are at least this many bytes.
+    flush_size = 256 * 1024
+
+    def __init__(self, path: str):
+        """Constructor.
+
+        :param path: Journal file name.  An existing file is replaced."""
+        self._path = path
+        self._file = open(path, "wb")
+        self._file.write(MAGIC)
+        self._buffer = bytearray()
+        self._next_session = 1
+        return
+
+    def path(self) -> str:
+        """Return the journal's file name."""
+        return self._path
+
+    def open_session(self, session) -> int:
+        """Record the start of a session.
+
+        :param session: Session being recorded.
+        :returns: Session number, used to record its traffic."""
+        number = self._next_session
+        self._next_session += 1
+
+        endpoint = session.endpoint()
+        info = {"endpoint": endpoint.name(),
+                "role": endpoint.role(),
+                "queue_size": endpoint.queue_size(),
+                "policy": endpoint.policy(),
+                "address": str(session.address())}
+        self.record(OPEN, number, json.dumps(info).encode())
+        return number
+
+    def record(self, record_type: int, session: int, data: bytes):
+        """Append a record.
+
+        :param record_type: OPEN, INBOUND, OUTBOUND or CLOSE.
+        :param session: Session number, from open_session().
+        :param data: Record data."""
+        if self._file is None:
+            return
+
+        buf = self._buffer
+        buf += _HEADER.pack(record_type, session, time.time_ns(), len(data))
+        buf += data
+        if len(buf) >= self.flush_size:
+            self.flush()
+        return
+
+    def flush(self):
+        """Write buffered records to the file."""
+        if self._file is not None and self._buffer:
+            self._file.write(self._buffer)
+            self._file.flush()
+            self._buffer = bytearray()
+        return
+
+    def close(self):
+        """Write any buffered records, and close the file.
+
+        Later records are ignored."""
+        if self._file is not None:
+            self.flush()
+            self._file.close()
+            self._file = None
+        return
+
+
+class JournalReader:
+    """Iterates over the records in a journal file."""
+
+    def __init__(self, path: str):
+        """Constructor.
+
+        :param path: Journal file name."""
+        with open(path, "rb") as f:
+            self._data = f.read()
+
+        if not self._data.startswith(MAGIC):
+            raise ValueError(f"Not a journal file: {path}")
+        return
+
+    def __iter__(self) -> typing.Iterator[typing.Tuple[int, int, int, bytes]]:
+        """Yield (type, session, time, data) for each record.
+
+        A truncated final record, eg. from a server that was killed, is
+        ignored."""
+        data = self._data
+        end = len(data)
+        offset = len(MAGIC)
+        while offset + _HEADER.size <= end:
+            record_type, session, when, length = \
+                _HEADER.unpack_from(data, offset)
+            offset += _HEADER.size
+            if offset + length > end:
+                return
+            yield record_type, session, when, data[offset:offset + length]
+            offset += length
+        return
@@ -0,0 +1,395 @@
+# -*- coding: utf-8 -*-
+########################################################################
+# exsim - Exchange Simulator
+# Copyright (C) 2016-2023, zeroXone.
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see http://www.gnu.org/licenses/
+#
+########################################################################
+
+# Logging for the simulator's subsystems.
+#
+# Each module logs to its subsystem's logger (eg. "exsim.protocol"),
+# passing arguments for the logging module to format, rather than a
+# formatted string, so nothing is formatted for a disabled level.  The
+# subsystems' levels can be changed at runtime, using the manager's
+# set_log_level request.
+#
+# Writing to a file is done by a background thread: start() attaches a
+# handler to the "exsim" logger that only puts each record on a queue.
+# The writer thread formats and writes whatever's queued, and flushes
+# once the queue is empty, so the event loop never waits for the disk.
+# A consequence is that arguments are formatted after the call that
+# logged them returns, so they must not be modified afterwards.  While
+# the writer runs, records also skip collecting the caller's source
+# location and the thread and process details, which the simulator's
+# formats don't use (see "Optimization" in the Python Logging HOWTO).
+#
+# Records are written as text, or in a compact binary format: after a
+# four byte identifier, each record has a 15 byte header
+#
+#   time        8 bytes     nanoseconds since the epoch
+#   level       1 byte      logging level, or zero to define a name
+#   name        2 bytes     logger name number
+#   length      4 bytes     length of the UTF-8 message that follows
+#
+# Logger names are written once, in a record with level zero, and then
+# referred to by number.  Decode a binary log with:
+#
+#     python -m exsim.log xs.log
+#
+# A forked child (eg. a server process) goes on writing a text log to
+# its parent's file, but the numbering of names is particular to one
+# process, so a child writes a binary log to its own file, named with
+# the parent's file name and the child's process id ("xs.log.1234").
+
+import logging
+import os
+import queue
+import struct
+import sys
+import threading
+import time
+import typing
+
+
+ROOT = "exsim"
+
+# Subsystems whose levels can be set independently.
+SUBSYSTEMS = ("exsim.api", "exsim.engine", "exsim.manager", "exsim.plugins",
+              "exsim.protocol", "exsim.server", "exsim.session")
+
+TEXT_FORMAT = "%(asctime)s %(levelname)s %(name)s: %(message)s"
+
+MAGIC = b"XSL\x01"
+
+_HEADER = struct.Struct("<qBHI")
+
+# Queued to stop the writer thread.
+_STOP = object()
+
+
+class _QueueHandler(logging.Handler):
+    """(Internal) Queues records for the writer thread, unformatted."""
+
+    def __init__(self, records: queue.SimpleQueue):
+        super().__init__()
+        self._records = records
+        return
+
+    def emit(self, record: logging.LogRecord):
+        # Tracebacks must be captured now, while they exist.
+        if record.exc_info:
+            record.exc_text = logging.Formatter().formatException(
+                record.exc_info)
+            record.exc_info = None
+        self._records.put(record)
+        return
+
+
+class TextHandler(logging.Handler):
+    """Writes records to a file as lines of text."""
+
+    def __init__(self, path: str):
+        """Constructor.
+
+        :param path: Log file name, appended to if it exists."""
+        super().__init__()
+        self._file = open(path, "a", encoding="utf-8")
+        self.setFormatter(logging.Formatter(TEXT_FORMAT))
+        return
+
+    def emit(self, record: logging.LogRecord):
+        try:
+            self._file.write(self.format(record) + "\n")
+        except Exception:
+            self.handleError(record)
+        return
+
+    def flush(self):
+        self._file.flush()
+        return
+
+    def close(self):
+        self._file.close()
+        super().close()
+        return
+
+
+class BinaryHandler(logging.Handler):
+    """Writes records to a file in the compact binary format."""
+
+    def __init__(self, path: str):
+        """Constructor.
+
+        :param path: Log file name.  An existing file is replaced."""
+        super().__init__()
+        self._path = path
+        self._file = open(path, "wb")
+        self._file.write(MAGIC)
+        self._names: typing.Dict[str, int] = {}
+        return
+
+    def path(self) -> str:
+        """Return the log file name."""
+        return self._path
+
+    def emit(self, record: logging.LogRecord):
+        try:
+            number = self._names.get(record.name)
+            if number is None:
+                number = len(self._names) + 1
+                self._names[record.name] = number
+                name = record.name.encode()
+                self._file.write(_HEADER.pack(0, 0, number, len(name)) + name)
+
+            message = record.getMessage()
+            if record.exc_text:
+                message += "\n" + record.exc_text
+            data = message.encode("utf-8", "replace")
+            self._file.write(_HEADER.pack(int(record.created * 1e9),
+                                          record.levelno, number, len(data)))
+            self._file.write(data)
+        except Exception:
+            self.handleError(record)
+        return
+
+    def flush(self):
+        self._file.flush()
+        return
+
+    def close(self):
+        self._file.close()
+        super().close()
+        return
+
+
+class _Writer:
+    """(Internal) Background thread writing queued records."""
+
+    def __init__(self, handler: logging.Handler):
+        self.handler = handler
+        self.records = queue.SimpleQueue()
+        self.thread = threading.Thread(target=self._run, name="exsim-log",
+                                       daemon=True)
+        self.thread.start()
+        return
+
+    def _run(self):
+        handler = self.handler
+        records = self.records
+        while True:
+            record = records.get()
+            while record is not _STOP:
+                handler.handle(record)
+                try:
+                    record = records.get_nowait()
+                except queue.Empty:
+                    break
+            handler.flush()
+            if record is _STOP:
+                return
+
+    def stop(self):
+        """Write everything queued, and wait for the thread to exit."""
+        self.records.put(_STOP)
+        self.thread.join()
+        return
+
+
+# The running writer, and the handler feeding it, if any.
+_writer: typing.Optional[_Writer] = None
+_queue_handler: typing.Optional[_QueueHandler] = None
+
+# Settings of the logging module changed while the writer runs, and
+# their previous values.
+_SETTINGS = {"_srcfile": None,
+             "logThreads": False,
+             "logProcesses": False,
+             "logMultiprocessing": False}
+_saved_settings: typing.Dict[str, typing.Any] = {}
+
+
+def start(path: str, level: typing.Union[int, str] = logging.INFO,
+          binary: bool = False):
+    """Write the simulator's log records to a file, in the background.
+
+    :param path: Log file name.
+    :param level: Level for the "exsim" logger, and so the default for
+        all subsystems.
+    :param binary: If True, use the compact binary format.
+
+    Records are no longer passed to the root logger's handlers."""
+    stop()
+    handler = BinaryHandler(path) if binary else TextHandler(path)
+    _attach(_Writer(handler))
+    set_level(ROOT, level)
+
+    for name, value in _SETTINGS.items():
+        _saved_settings[name] = getattr(logging, name)
+        setattr(logging, name, value)
+    return
+
+
+def _attach(writer: _Writer):
+    """(Internal) Send the "exsim" logger's records to a writer."""
+    global _writer, _queue_handler
+    _writer = writer
+    _queue_handler = _QueueHandler(writer.records)
+    logger = logging.getLogger(ROOT)
+    logger.addHandler(_queue_handler)
+    logger.propagate = False
+    return
+
+
+def stop():
+    """Stop the background writer, after writing everything queued."""
+    global _writer, _queue_handler
+    if _writer is None:
+        return
+
+    logger = logging.getLogger(ROOT)
+    logger.removeHandler(_queue_handler)
+    logger.propagate = True
+    _writer.stop()
+    _writer.handler.close()
+    _writer = None
+    _queue_handler = None
+
+    for name, value in _saved_settings.items():
+        setattr(logging, name, value)
+    _saved_settings.clear()
+    return
+
+
+def _before_fork():
+    """(Internal) Write out the handler's buffer before forking.
+
+    Otherwise, the child inherits a copy of it, and writes it again.
+    The handler is locked until the fork is done."""
+    if _writer is not None:
+        _writer.handler.acquire()
+        _writer.handler.flush()
+    return
+
+
+def _after_fork_parent():
+    """(Internal) Unlock the handler, once the child is forked."""
+    if _writer is not None:
+        _writer.handler.release()
+    return
+
+
+def _after_fork():
+    """(Internal) Restart the writer thread in a forked child.
+
+    The child inherits the parent's handler, and its open file, but not
+    the thread.  A text log goes on being written to the same file, and
+    a binary log is written to a new file for the child."""
+    global _writer
+    if _writer is not None:
+        logging.getLogger(ROOT).removeHandler(_queue_handler)
+        handler = _writer.handler
+        if isinstance(handler, BinaryHandler):
+            handler.close()
+            handler = BinaryHandler(f"{handler.path()}.{os.getpid()}")
+        _attach(_Writer(handler))
+    return
+
+
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(before=_before_fork,
+                        after_in_parent=_after_fork_parent,
+                        after_in_child=_after_fork)
+
+
+def _level_number(level: typing.Union[int, str]) -> int:
+    """(Internal) Return a level number, from a number or name."""
+    if isinstance(level, int):
+        return level
+
+    number = logging.getLevelName(str(level).upper())
+    if not isinstance(number, int):
+        raise ValueError(f"Bad log level: '{level}'")
+    return number
+
+
+def set_level(subsystem: str, level: typing.Union[int, str]):
+    """Set the level of a subsystem's logger.
+
+    :param subsystem: "exsim", for all subsystems, or one of SUBSYSTEMS.
+    :param level: Level number, or name (eg. "DEBUG")."""
+    if subsystem != ROOT and subsystem not in SUBSYSTEMS:
+        raise KeyError(f"No such log subsystem: '{subsystem}'")
+    logging.getLogger(subsystem).setLevel(_level_number(level))
+    return
+
+
+def get_levels() -> typing.Dict[str, str]:
+    """Return the effective level name for each subsystem."""
+    return {name: logging.getLevelName(
+                logging.getLogger(name).getEffectiveLevel())
+            for name in (ROOT,) + SUBSYSTEMS}
+
+
+def read_binary(path: str) -> \
+        typing.Iterator[typing.Tuple[int, int, str, str]]:
+    """Yield (time, level, name, message) for each binary log record.
+
+    :param path: Binary log file name.
+
+    A truncated final record is ignored."""
+    with open(path, "rb") as f:
+        data = f.read()
+    if not data.startswith(MAGIC):
+        raise ValueError(f"Not a binary log file: {path}")
+
+    names = {}
+    offset = len(MAGIC)
+    while offset + _HEADER.size <= len(data):
+        when, level, number, length = _HEADER.unpack_from(data, offset)
+        offset += _HEADER.size
+        if offset + length > len(data):
+            return
+        text = data[offset:offset + length].decode("utf-8", "replace")
+        offset += length
+
+        if level == 0:
+            names[number] = text
+        else:
+            yield when, level, names.get(number, "?"), text
+    return
+
+
+def main(argv: typing.Optional[typing.List[str]] = None):
+    # Imported here, so servers importing this module don't pay for it.
+    import argparse
+
+    parser = argparse.ArgumentParser(
+        prog="python -m exsim.log",
+        description="Print a binary log file as text.")
+    parser.add_argument("path", help="binary log file name")
+    args = parser.parse_args(argv)
+
+    for when, level, name, message in read_binary(args.path):
+        seconds, nanoseconds = divmod(when, 1000000000)
+        timestamp = time.strftime("%Y-%m-%d %H:%M:%S",
+                                  time.localtime(seconds))
+        print(f"{timestamp},{nanoseconds // 1000000:03d} "
+              f"{logging.getLevelName(level)} {name}: {message}")
+    return
+
+
+if __name__ == "__main__":
+    main()
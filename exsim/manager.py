@@ -18,21 +18,52 @@
 #
 ########################################################################
 
+import collections
 import logging
-import pickle
-import struct
 
-logging.basicConfig(filename="xs.log", level=logging.DEBUG)
+from .mgmt_codec import MessageReader, ProtocolError
+from .mgmt_codec import encode_message, validate_request
+from .profiling import DEFAULT_SAMPLE_INTERVAL, DEFAULT_STALL_THRESHOLD
+
+
+logger = logging.getLogger("exsim.manager")
+
+
+# Requests allowed in a batch, and how to build the request that
+# reverses each one, if a later request in the batch fails.
+_BATCH_UNDO = {
+    "load_engine": lambda r: {"type": "unload_engine", "name": r["name"]},
+    "create_engine": lambda r: {"type": "delete_engine", "name": r["name"]},
+    "start_engine": lambda r: {"type": "stop_engine", "name": r["name"]},
+    "stop_engine": lambda r: {"type": "start_engine", "name": r["name"]},
+    "load_protocol": lambda r: {"type": "unload_protocol", "name": r["name"]},
+    "create_endpoint": lambda r: {"type": "delete_endpoint",
+                                  "name": r["name"]},
+}
 
 
 class Manager:
-    """Server manager."""
+    """Server manager.
+
+    Replies and events are written without blocking: anything the
+    socket won't accept is kept until it becomes writable, so a client
+    that stops reading (eg. an idle event subscriber) can't stall the
+    event loop."""
+
+    # Close the connection if the client leaves more than this many
+    # bytes unread.
+    max_output_size = 16 * 1024 * 1024
 
     def __init__(self, sock, addr):
         self._socket = sock
         self._address = addr
         self._server = None
-        self._buffer = b""
+        self._reader = MessageReader()
+
+        # Output the socket hasn't yet accepted.
+        self._output = collections.deque()
+        self._output_size = 0
+        self._closed = False
         return
 
     def set_server(self, server):
@@ -42,77 +73,131 @@ class Manager:
     def socket(self):
         return self._socket
 
+    def address(self):
+        return self._address
+
     def close(self):
+        self._closed = True
         self._socket.close()
         self._address = None
+        self._output.clear()
+        self._output_size = 0
         return
 
     def readable(self):
-        data = self._socket.recv(8192)
+        """Read and process data from the management socket."""
+        try:
+            data = self._socket.recv(8192)
+        except (BlockingIOError, InterruptedError):
+            return
+        except ConnectionError:
+            data = b""
+
         if len(data) == 0:
             self._server.manager_closed(self)
             return
 
-        self._buffer += data
+        self.received(data)
+        return
+
+    def received(self, data: bytes):
+        """Process data received from the management client.
 
-        msg = self.parse_message()
-        if not msg:
+        Every complete request is dispatched, in order, so a client can
+        send several before waiting for the replies."""
+        self._reader.append_buffer(data)
+        try:
+            messages = self._reader.get_messages()
+        except ProtocolError as e:
+            logger.warning("Closing manager %s: %s", self._address, e)
+            self._server.manager_closed(self)
             return
 
-        self.dispatch(msg)
+        for msg in messages:
+            self.dispatch(msg)
         return
 
     def send(self, msg):
-        data = pickle.dumps(msg)
-        header = struct.pack("<L", len(data))
-        self._socket.sendall(header + data)
+        self.write(encode_message(msg))
         return
 
-    def parse_message(self):
-        # Check we have a header.
-        if len(self._buffer) < 4:
-            logging.debug("Manager buffer < 4")
-            return None
+    def write(self, data: bytes):
+        """Send encoded data to the management client."""
+        if self._closed:
+            return
+
+        if self._output:
+            self._output.append(data)
+            self._output_size += len(data)
+            if self._output_size > self.max_output_size:
+                logger.warning("Closing slow manager %s: %d bytes unsent",
+                               self._address, self._output_size)
+                self._server.manager_closed(self)
+            return
 
-        # Unpack header, and sanity check.
-        l = struct.unpack("<L", self._buffer[:4])[0]
-        if l > 65535:
-            logging.debug(f"Manager buffer > 64KB {l}")
-            return None
+        try:
+            sent = self._socket.send(data)
+        except (BlockingIOError, InterruptedError):
+            sent = 0
+        except OSError as e:
+            logger.warning("Send failed on manager %s: %s", self._address, e)
+            self._server.manager_closed(self)
+            return
 
-        # Check we have the full packet.
-        if len(self._buffer) < l + 4:
-            logging.debug("Manager received message fragment")
-            return None
+        if sent < len(data):
+            self._output.append(data[sent:])
+            self._output_size += len(data) - sent
+            self._server.watch_writable(self)
+        return
 
-        msg = pickle.loads(self._buffer[4:l+4])
-        self._buffer = self._buffer[l+4:]
+    def writable(self):
+        """Resume sending, after the socket becomes writable."""
+        output = self._output
+        while output:
+            try:
+                sent = self._socket.send(output[0])
+            except (BlockingIOError, InterruptedError):
+                return
+            except OSError as e:
+                logger.warning("Send failed on manager %s: %s",
+                               self._address, e)
+                self._server.manager_closed(self)
+                return
 
-        return msg
+            self._output_size -= sent
+            if sent < len(output[0]):
+                output[0] = output[0][sent:]
+                return
+            output.popleft()
+
+        self._server.unwatch_writable(self)
+        return
 
     def dispatch(self, message):
         """Handle a decoded management session message."""
+        reply = {}
+        if "id" in message:
+            reply["id"] = message["id"]
 
-        if not hasattr(self, "handle_" + message["type"]):
-            logging.warning(f"No handler for '{message['type']}' request")
-            # FIXME: create error reply.
-            return
+        error = validate_request(message)
+        if error:
+            self.set_error(reply, message.get("type"), error)
+        else:
+            handler = getattr(self, 'handle_' + message["type"])
+            handler(message, reply)
 
-        reply = {}
-        handler = getattr(self, 'handle_' + message["type"])
-        handler(message, reply)
         self.send(reply)
         return
 
     def set_error(self, reply, request_name, error):
-        logging.info(f"Request '{request_name}' failed: {error}")
+        logger.info("Request '%s' failed: %s", request_name, error)
 
         reply["result"] = False
         reply["message"] = error
         return
 
     def set_success(self, reply, request_name):
-        logging.info(f"Request '{request_name}': succeeded")
+        logger.debug("Request '%s': succeeded", request_name)
         reply["result"] = True
         return
 
@@ -125,12 +210,26 @@ class Manager:
                 return False
         return True
 
+    def handle_load_engine(self, request, reply):
+        if not self.check_parameters(request, reply,
+                                     ["name", "module", "class"]):
+            return
+        try:
+            self._server.load_engine(request["name"],
+                                     request["module"],
+                                     request["class"])
+            self.set_success(reply, "load_engine")
+        except Exception as e:
+            self.set_error(reply, "load_engine", str(e.args))
+        return
+
     def handle_create_engine(self, request, reply):
         if not self.check_parameters(request, reply,
-                                     ['name']):
+                                     ['name', 'engine_type']):
             return
         try:
-            self._server.create_engine(request["name"])
+            self._server.create_engine(request["name"],
+                                       request["engine_type"])
             self.set_success(reply, "create_engine")
         except Exception as e:
             self.set_error(reply, "create_engine", str(e.args))
@@ -147,12 +246,40 @@ class Manager:
             self.set_error(reply, "delete_engine", str(e.args))
         return
 
+    def handle_start_engine(self, request, reply):
+        if not self.check_parameters(request, reply,
+                                     ['name']):
+            return
+        try:
+            reply["changed"] = self._server.start_engine(request["name"])
+            self.set_success(reply, "start_engine")
+        except Exception as e:
+            self.set_error(reply, "start_engine", str(e.args))
+        return
+
+    def handle_stop_engine(self, request, reply):
+        if not self.check_parameters(request, reply,
+                                     ['name']):
+            return
+        try:
+            reply["changed"] = self._server.stop_engine(request["name"])
+            self.set_success(reply, "stop_engine")
+        except Exception as e:
+            self.set_error(reply, "stop_engine", str(e.args))
+        return
+
     def handle_create_endpoint(self, request, reply):
         if not self.check_parameters(request, reply,
-                                     ['name', 'port']):
+                                     ['name', 'port', 'protocol', 'engine']):
             return
         try:
-            self._server.create_endpoint(request["name"], request["port"])
+            options = {k: request[k] for k in ("role", "queue_size", "policy")
+                       if k in request}
+            reply["port"] = self._server.create_endpoint(request["name"],
+                                                         request["port"],
+                                                         request["protocol"],
+                                                         request["engine"],
+                                                         **options)
             self.set_success(reply, "create_endpoint")
         except Exception as e:
             self.set_error(reply, "create_endpoint", str(e.args))
@@ -193,3 +320,222 @@ class Manager:
         except Exception as e:
             self.set_error(reply, "load_protocol", str(e.args))
         return
+
+    def handle_unload_engine(self, request, reply):
+        try:
+            self._server.unload_engine(request["name"])
+            self.set_success(reply, "unload_engine")
+        except Exception as e:
+            self.set_error(reply, "unload_engine", str(e.args))
+        return
+
+    def handle_unload_protocol(self, request, reply):
+        try:
+            self._server.unload_protocol(request["name"])
+            self.set_success(reply, "unload_protocol")
+        except Exception as e:
+            self.set_error(reply, "unload_protocol", str(e.args))
+        return
+
+    def handle_delete_endpoint(self, request, reply):
+        try:
+            self._server.delete_endpoint(request["name"])
+            self.set_success(reply, "delete_endpoint")
+        except Exception as e:
+            self.set_error(reply, "delete_endpoint", str(e.args))
+        return
+
+    def handle_set_engine_property(self, request, reply):
+        try:
+            self._server.set_engine_property(request["name"],
+                                             request["property"],
+                                             request["value"])
+            self.set_success(reply, "set_engine_property")
+        except Exception as e:
+            self.set_error(reply, "set_engine_property", str(e.args))
+        return
+
+    def handle_set_endpoint_property(self, request, reply):
+        try:
+            self._server.set_endpoint_property(request["name"],
+                                               request["property"],
+                                               request["value"])
+            self.set_success(reply, "set_endpoint_property")
+        except Exception as e:
+            self.set_error(reply, "set_endpoint_property", str(e.args))
+        return
+
+    def handle_subscribe(self, request, reply):
+        try:
+            self._server.subscribe(self, request["topics"])
+            self.set_success(reply, "subscribe")
+        except Exception as e:
+            self.set_error(reply, "subscribe", str(e.args))
+        return
+
+    def handle_get_book(self, request, reply):
+        try:
+            reply["book"] = self._server.get_book_snapshot(
+                request["engine"], request["symbol"],
+                request.get("max_levels", 0))
+            self.set_success(reply, "get_book")
+        except Exception as e:
+            self.set_error(reply, "get_book", str(e.args))
+        return
+
+    def handle_start_journal(self, request, reply):
+        try:
+            self._server.start_journal(request["path"])
+            self.set_success(reply, "start_journal")
+        except Exception as e:
+            self.set_error(reply, "start_journal", str(e.args))
+        return
+
+    def handle_stop_journal(self, request, reply):
+        try:
+            self._server.stop_journal()
+            self.set_success(reply, "stop_journal")
+        except Exception as e:
+            self.set_error(reply, "stop_journal", str(e.args))
+        return
+
+    def handle_get_metrics(self, request, reply):
+        try:
+            reply["metrics"] = self._server.get_metrics()
+            self.set_success(reply, "get_metrics")
+        except Exception as e:
+            self.set_error(reply, "get_metrics", str(e.args))
+        return
+
+    def handle_start_metrics(self, request, reply):
+        try:
+            reply["port"] = self._server.start_metrics(
+                request["port"], request.get("address", "127.0.0.1"))
+            self.set_success(reply, "start_metrics")
+        except Exception as e:
+            self.set_error(reply, "start_metrics", str(e.args))
+        return
+
+    def handle_stop_metrics(self, request, reply):
+        try:
+            self._server.stop_metrics()
+            self.set_success(reply, "stop_metrics")
+        except Exception as e:
+            self.set_error(reply, "stop_metrics", str(e.args))
+        return
+
+    def handle_set_log_level(self, request, reply):
+        try:
+            self._server.set_log_level(request["subsystem"], request["level"])
+            self.set_success(reply, "set_log_level")
+        except Exception as e:
+            self.set_error(reply, "set_log_level", str(e.args))
+        return
+
+    def handle_get_log_levels(self, request, reply):
+        reply["levels"] = self._server.get_log_levels()
+        self.set_success(reply, "get_log_levels")
+        return
+
+    def handle_start_watchdog(self, request, reply):
+        try:
+            self._server.start_watchdog(
+                request.get("threshold", DEFAULT_STALL_THRESHOLD))
+            self.set_success(reply, "start_watchdog")
+        except Exception as e:
+            self.set_error(reply, "start_watchdog", str(e.args))
+        return
+
+    def handle_get_stalls(self, request, reply):
+        try:
+            reply["stalls"] = self._server.get_stalls()
+            self.set_success(reply, "get_stalls")
+        except Exception as e:
+            self.set_error(reply, "get_stalls", str(e.args))
+        return
+
+    def handle_stop_watchdog(self, request, reply):
+        try:
+            reply["stalls"] = self._server.stop_watchdog()
+            self.set_success(reply, "stop_watchdog")
+        except Exception as e:
+            self.set_error(reply, "stop_watchdog", str(e.args))
+        return
+
+    def handle_start_profile(self, request, reply):
+        try:
+            self._server.start_profile(
+                request["mode"],
+                request.get("interval", DEFAULT_SAMPLE_INTERVAL))
+            self.set_success(reply, "start_profile")
+        except Exception as e:
+            self.set_error(reply, "start_profile", str(e.args))
+        return
+
+    def handle_stop_profile(self, request, reply):
+        try:
+            reply["profile"] = self._server.stop_profile()
+            self.set_success(reply, "stop_profile")
+        except Exception as e:
+            self.set_error(reply, "stop_profile", str(e.args))
+        return
+
+    def handle_batch(self, request, reply):
+        """Apply a list of requests, all or nothing.
+
+        The requests are applied in order.  If one fails, those already
+        applied are reversed, in reverse order, and the rest are not
+        attempted.  Requests that changed nothing (eg. starting an
+        engine that was already running) aren't reversed.  The reply's
+        "results" list has a reply for each request."""
+        requests = request["requests"]
+        for sub_request in requests:
+            if not isinstance(sub_request, dict) or \
+                    not isinstance(sub_request.get("type"), str) or \
+                    sub_request["type"] not in _BATCH_UNDO:
+                self.set_error(reply, "batch",
+                               f"Request can't be batched: {sub_request}")
+                return
+
+        results = []
+        for sub_request in requests:
+            sub_reply = {}
+            error = validate_request(sub_request)
+            if error:
+                self.set_error(sub_reply, sub_request["type"], error)
+            else:
+                handler = getattr(self, "handle_" + sub_request["type"])
+                handler(sub_request, sub_reply)
+
+            results.append(sub_reply)
+            if not sub_reply["result"]:
+                break
+
+        if results and not results[-1]["result"]:
+            error = results[-1]["message"]
+            applied = list(zip(requests, results[:-1]))
+            for sub_request, sub_reply in reversed(applied):
+                if sub_reply.get("changed", True):
+                    self.undo_request(sub_request)
+                sub_reply["result"] = False
+                sub_reply["message"] = "Rolled back"
+
+            for _ in requests[len(results):]:
+                results.append({"result": False, "message": "Not attempted"})
+            self.set_error(reply, "batch", f"Request {len(applied)} failed: "
+                                           f"{error}")
+        else:
+            self.set_success(reply, "batch")
+
+        reply["results"] = results
+        return
+
+    def undo_request(self, request):
+        """Reverse the effect of a successful batched request."""
+        undo = _BATCH_UNDO[request["type"]](request)
+        undo_reply = {}
+        getattr(self, "handle_" + undo["type"])(undo, undo_reply)
+        if not undo_reply["result"]:
+            logger.error("Failed to roll back %s: %s", request,
+                         undo_reply["message"])
+        return
@@ -0,0 +1,268 @@
+# -*- coding: utf-8 -*-
+########################################################################
+# exsim - Exchange Simulator
+# Copyright (C) 2016-2023, zeroXone.
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see http://www.gnu.org/licenses/
+#
+########################################################################
+
+# Market data is published as incremental changes to the aggregated
+# price levels (L2) of each book.  While a symbol has subscribers, its
+# book's Sides record the prices of levels that change.  After the
+# engine has processed each batch of messages, the publisher collects
+# those prices, and sends the new state of each changed level.
+#
+# Subscribers to a symbol with the same conflation interval share a
+# Feed.  A feed remembers the levels it last published, so it only
+# reports levels whose quantity or order count have really changed,
+# and each update is built once, as a single message dictionary passed
+# to all of the feed's subscribers: protocols cache their encoding of
+# it in the dictionary, so it's encoded once however many subscribers
+# there are.
+#
+# A conflated feed publishes at most once per interval.  Changes in the
+# meantime just mark the level's price, so a slow subscriber receives
+# the latest state of each level rather than every intermediate step,
+# and nothing queues up in the engine.
+
+import time
+import typing
+
+from .book import Book
+from .side import Side
+
+
+# Level update actions, as for FIX MDUpdateAction (279).
+LEVEL_NEW = 0
+LEVEL_CHANGE = 1
+LEVEL_DELETE = 2
+
+
+class Subscription:
+    """A session's subscription to a symbol's market data."""
+
+    __slots__ = ("session", "request_id", "feed")
+
+    def __init__(self, session, request_id: str, feed: "Feed"):
+        """Constructor.
+
+        :param session: Subscribing session.
+        :param request_id: Subscriber's identifier for the request.
+        :param feed: Feed delivering the updates."""
+        self.session = session
+        self.request_id = request_id
+        self.feed = feed
+        return
+
+
+class Feed:
+    """Updates for one book, at one conflation interval."""
+
+    def __init__(self, publisher: "MarketDataPublisher", book: Book,
+                 interval: int):
+        """Constructor.
+
+        :param publisher: Owning publisher.
+        :param book: Book to publish.
+        :param interval: Conflation interval, in milliseconds, or zero
+            to publish after every batch of messages."""
+        self._publisher = publisher
+        self.book = book
+        self.interval = interval
+        self.subscriptions: typing.List[Subscription] = []
+
+        # Last published (quantity, count) of each level, by
+        # (side, price), and the keys of levels changed since.
+        self.levels: typing.Dict[typing.Tuple, typing.Tuple] = {}
+        for side in (book.bids, book.offers):
+            for price, level in side.levels.items():
+                self.levels[(side.side, price)] = (level.quantity,
+                                                   level.count)
+        self.pending: typing.Set[typing.Tuple] = set()
+
+        # Scheduled publication, for a conflated feed.
+        self.timeout = None
+        return
+
+    def publish(self):
+        """Send changes since the last update to all subscribers."""
+        self.timeout = None
+        if not self.pending:
+            return
+
+        book = self.book
+        levels = self.levels
+        entries = []
+        for key in sorted(self.pending):
+            side, price = key
+            level = book.get_side(side).levels.get(price)
+            current = (level.quantity, level.count) if level else None
+            previous = levels.get(key)
+            if current == previous:
+                continue
+
+            if current is None:
+                del levels[key]
+                entries.append((LEVEL_DELETE, side, price, 0, 0))
+            else:
+                levels[key] = current
+                action = LEVEL_NEW if previous is None else LEVEL_CHANGE
+                entries.append((action, side, price) + current)
+        self.pending = set()
+
+        if entries:
+            message = {"type": "market_data_incremental",
+                       "symbol": book.symbol,
+                       "entries": entries}
+            send = self._publisher.send
+            for subscription in self.subscriptions:
+                send(subscription.session, message)
+        return
+
+
+class MarketDataPublisher:
+    """Publishes an engine's books to subscribed sessions."""
+
+    def __init__(self, engine):
+        """Constructor.
+
+        :param engine: Engine whose books are published.  Messages are
+            sent using its send() method, and conflated feeds are
+            scheduled using its server's timeouts."""
+        self._engine = engine
+        self.send = engine.send
+
+        # Feeds, by symbol and interval.
+        self._feeds: typing.Dict[str, typing.Dict[int, Feed]] = {}
+
+        # Subscriptions, by session and request identifier.
+        self._subscriptions: typing.Dict[
+            typing.Any, typing.Dict[str, typing.List[Subscription]]] = {}
+        return
+
+    def is_subscribed(self, session, request_id: str) -> bool:
+        """Return True if a session has a subscription with this id."""
+        return request_id in self._subscriptions.get(session, {})
+
+    def subscribe(self, session, request_id: str, book: Book,
+                  interval: int = 0):
+        """Send a snapshot of a book, and then updates as it changes.
+
+        :param session: Subscribing session.
+        :param request_id: Subscriber's identifier for the request.
+        :param book: Book to publish.
+        :param interval: Conflation interval, in milliseconds."""
+        feeds = self._feeds.setdefault(book.symbol, {})
+        feed = feeds.get(interval)
+        if feed is None:
+            if not feeds:
+                book.bids.dirty = set()
+                book.offers.dirty = set()
+            feed = Feed(self, book, interval)
+            feeds[interval] = feed
+        else:
+            # Bring the feed up to date, so the snapshot and the feed's
+            # next update follow on from one another.
+            self._collect_book(book, feeds)
+            feed.publish()
+
+        self.send_snapshot(session, request_id, book)
+        subscription = Subscription(session, request_id, feed)
+        feed.subscriptions.append(subscription)
+        self._subscriptions.setdefault(session, {}).setdefault(
+            request_id, []).append(subscription)
+        return
+
+    def send_snapshot(self, session, request_id: str, book: Book):
+        """Send the current state of a book to a session."""
+        message = book.snapshot()
+        message["type"] = "market_data_snapshot"
+        message["request_id"] = request_id
+        self.send(session, message)
+        return
+
+    def unsubscribe(self, session, request_id: str) -> bool:
+        """Cancel a session's subscription.
+
+        :returns: False if there was no such subscription."""
+        requests = self._subscriptions.get(session, {})
+        subscriptions = requests.pop(request_id, None)
+        if subscriptions is None:
+            return False
+
+        if not requests:
+            del self._subscriptions[session]
+        for subscription in subscriptions:
+            self._remove(subscription)
+        return True
+
+    def remove_session(self, session):
+        """Cancel all of a session's subscriptions."""
+        requests = self._subscriptions.pop(session, {})
+        for subscriptions in requests.values():
+            for subscription in subscriptions:
+                self._remove(subscription)
+        return
+
+    def collect(self):
+        """Publish, or schedule, updates for changed books.
+
+        Called by the engine after processing each batch of messages."""
+        for feeds in self._feeds.values():
+            feed = next(iter(feeds.values()))
+            self._collect_book(feed.book, feeds)
+        return
+
+    def _collect_book(self, book: Book, feeds: typing.Dict[int, Feed]):
+        """(Internal) Pass a book's changed levels to its feeds."""
+        bids = book.bids.dirty
+        offers = book.offers.dirty
+        if not bids and not offers:
+            return
+
+        changed = [(Side.BUY, price) for price in bids]
+        changed.extend((Side.SELL, price) for price in offers)
+        bids.clear()
+        offers.clear()
+
+        server = self._engine.server()
+        for feed in feeds.values():
+            feed.pending.update(changed)
+            if not feed.interval or server is None:
+                feed.publish()
+            elif feed.timeout is None:
+                feed.timeout = server.add_timeout(
+                    time.time() + feed.interval / 1000, feed.publish)
+        return
+
+    def _remove(self, subscription: Subscription):
+        """(Internal) Remove a subscription from its feed."""
+        feed = subscription.feed
+        feed.subscriptions.remove(subscription)
+        if feed.subscriptions:
+            return
+
+        if feed.timeout is not None:
+            self._engine.server().delete_timeout(feed.timeout)
+            feed.timeout = None
+
+        book = feed.book
+        feeds = self._feeds[book.symbol]
+        del feeds[feed.interval]
+        if not feeds:
+            del self._feeds[book.symbol]
+            book.bids.dirty = None
+            book.offers.dirty = None
+        return
@@ -36,6 +36,12 @@ CANCEL_REJECTED_MESSAGE = "cxl_rej"
 CANCEL_ALL_MESSAGE = "cxl_all"
 EXECUTION_MESSAGE = "exec"
 
+SUBSCRIBE_MESSAGE = "sub"
+UNSUBSCRIBE_MESSAGE = "unsub"
+
+MARKET_ORDER = "market"
+LIMIT_ORDER = "limit"
+
 SYMBOL_STATUS_MESSAGE = "symbol"
 MARKET_STATUS_MESSAGE = "market"
 
@@ -59,6 +65,7 @@ SET_ENDPOINT_PROPERTY_MESSAGE = "set_endpoint_property"
 class Message:
     def __init__(self, msg_type: str=None):
         self.type = msg_type
+        self.session = None  # originating session, if any
         return
 
 
@@ -79,13 +86,60 @@ class LoginAcceptedMessage(Message):
 class NewOrderMessage(Message):
     def __init__(self):
         super().__init__(NEW_ORDER_MESSAGE)
+        self.client_order_id = ''
         self.symbol = ''
+        self.side = 0
         self.order_type = ''
+        self.time_in_force = 0
         self.quantity = 0
         self.price = 0
         return
 
 
+class ModifyOrderMessage(Message):
+    def __init__(self):
+        super().__init__(MODIFY_ORDER_MESSAGE)
+        self.client_order_id = ''
+        self.original_client_order_id = ''
+        self.symbol = ''
+        self.quantity = 0
+        self.price = None
+        return
+
+
+class CancelOrderMessage(Message):
+    def __init__(self):
+        super().__init__(CANCEL_ORDER_MESSAGE)
+        self.client_order_id = ''
+        self.original_client_order_id = ''
+        self.symbol = ''
+        return
+
+
+class CancelAllMessage(Message):
+    def __init__(self):
+        super().__init__(CANCEL_ALL_MESSAGE)
+        self.symbol = ''
+        return
+
+
+class SubscribeMessage(Message):
+    def __init__(self):
+        super().__init__(SUBSCRIBE_MESSAGE)
+        self.request_id = ''
+        self.symbols = []
+        self.snapshot_only = False
+        self.conflation_interval = 0  # milliseconds
+        return
+
+
+class UnsubscribeMessage(Message):
+    def __init__(self):
+        super().__init__(UNSUBSCRIBE_MESSAGE)
+        self.request_id = ''
+        return
+
+
 class CreateEngineMessage(Message):
     def __init__(self):
         super().__init__(CREATE_ENGINE_MESSAGE)
@@ -0,0 +1,256 @@
+# -*- coding: utf-8 -*-
+########################################################################
+# exsim - Exchange Simulator
+# Copyright (C) 2016-2023, zeroXone.
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see http://www.gnu.org/licenses/
+#
+########################################################################
+
+# Metrics are kept where they're cheapest to update: sessions, engines
+# and endpoints count their traffic in plain integer attributes, and
+# the server times each pass through its event loop into a histogram
+# with fixed buckets.  Nothing is aggregated or formatted until the
+# metrics are requested, either with a get_metrics management request,
+# which returns them as a JSON object, or from the HTTP listener, which
+# serves them in the Prometheus text exposition format:
+#
+#     exsim_session_messages_in_total{endpoint="fix",address="..."} 42
+#
+# The listener runs in its own thread, so a slow scraper can't stall
+# the event loop, and collects each snapshot in the event loop thread,
+# using call_soon_threadsafe(), so it never sees a half-updated state.
+
+import bisect
+import concurrent.futures
+import logging
+import threading
+import typing
+
+
+logger = logging.getLogger("exsim.server")
+
+
+# Counters kept by each session, and summed for its endpoint.
+SESSION_COUNTERS = ("messages_in", "messages_out", "bytes_in", "bytes_out",
+                    "parse_errors")
+
+# Upper bounds, in seconds, of the event loop iteration time buckets.
+LOOP_TIME_BUCKETS = (0.00001, 0.00005, 0.0001, 0.0005, 0.001, 0.005, 0.01,
+                     0.05, 0.1, 0.5, 1.0)
+
+# Time allowed for the event loop to collect a snapshot for a scrape.
+COLLECT_TIMEOUT = 5.0
+
+# Type and help text for each metric, by name.
+_METRICS = {
+    "messages_in": ("counter", "Messages received"),
+    "messages_out": ("counter", "Messages sent"),
+    "bytes_in": ("counter", "Bytes received"),
+    "bytes_out": ("counter", "Bytes sent"),
+    "parse_errors": ("counter", "Received messages discarded as malformed"),
+    "output_bytes": ("gauge", "Bytes queued, but not yet sent"),
+    "sessions_accepted": ("counter", "Sessions accepted"),
+    "sessions_open": ("gauge", "Sessions currently open"),
+    "sessions_attached": ("gauge", "Sessions attached to the engine"),
+    "books": ("gauge", "Order books"),
+    "orders_resting": ("gauge", "Orders resting in the books"),
+    "fills": ("counter", "Fills, counting each side once"),
+}
+
+
+class Histogram:
+    """Distribution of observed values, in fixed buckets."""
+
+    def __init__(self, buckets: typing.Sequence[float] = LOOP_TIME_BUCKETS):
+        """Constructor.
+
+        :param buckets: Increasing upper bounds of the buckets.  Larger
+            values are counted in a final, unbounded bucket."""
+        self._bounds = list(buckets)
+        self._counts = [0] * (len(self._bounds) + 1)
+        self._sum = 0.0
+        self._count = 0
+        return
+
+    def observe(self, value: float):
+        """Count a value."""
+        self._counts[bisect.bisect_left(self._bounds, value)] += 1
+        self._sum += value
+        self._count += 1
+        return
+
+    def count(self) -> int:
+        """Return the number of values observed."""
+        return self._count
+
+    def to_dict(self) -> dict:
+        """Return the histogram, as JSON-compatible values.
+
+        Bucket counts are cumulative, as in Prometheus: each is the
+        number of values less than or equal to its bound."""
+        buckets = []
+        total = 0
+        for bound, count in zip(self._bounds + ["+Inf"], self._counts):
+            total += count
+            buckets.append([bound, total])
+        return {"buckets": buckets, "sum": self._sum, "count": self._count}
+
+
+def _escape(value) -> str:
+    """(Internal) Return a value escaped for a Prometheus label."""
+    return str(value).replace("\\", "\\\\").replace("\"", "\\\"") \
+        .replace("\n", "\\n")
+
+
+def _labels(labels: typing.Dict[str, typing.Any]) -> str:
+    """(Internal) Return formatted Prometheus labels."""
+    if not labels:
+        return ""
+    return "{" + ",".join(f'{name}="{_escape(value)}"'
+                          for name, value in labels.items()) + "}"
+
+
+def format_prometheus(metrics: dict) -> str:
+    """Return metrics in the Prometheus text exposition format.
+
+    :param metrics: Dictionary, as returned by a server's get_metrics()."""
+    lines = []
+
+    # Each group is a list of (labels, values) for one kind of object.
+    groups = (
+        ("engine", [({"engine": name}, values)
+                    for name, values in metrics["engines"].items()]),
+        ("endpoint", [({"endpoint": name}, values)
+                      for name, values in metrics["endpoints"].items()]),
+        ("session", [({"endpoint": values["endpoint"],
+                       "address": values["address"]}, values)
+                     for values in metrics["sessions"]]),
+    )
+    for group, members in groups:
+        for name, (kind, text) in _METRICS.items():
+            samples = [(labels, values[name]) for labels, values in members
+                       if name in values]
+            if not samples:
+                continue
+
+            full_name = f"exsim_{group}_{name}"
+            if kind == "counter":
+                full_name += "_total"
+            lines.append(f"# HELP {full_name} {text}")
+            lines.append(f"# TYPE {full_name} {kind}")
+            for labels, value in samples:
+                lines.append(f"{full_name}{_labels(labels)} {value}")
+
+    # Loop time, for this server and any worker processes.
+    servers = [({}, metrics["server"])]
+    for index, server in sorted(metrics.get("shards", {}).items()):
+        servers.append(({"shard": index}, server))
+
+    name = "exsim_loop_iteration_seconds"
+    lines.append(f"# HELP {name} Time spent handling events per event "
+                 f"loop iteration")
+    lines.append(f"# TYPE {name} histogram")
+    for labels, server in servers:
+        histogram = server["loop_iteration_seconds"]
+        for bound, count in histogram["buckets"]:
+            lines.append(f"{name}_bucket{_labels(dict(labels, le=bound))} "
+                         f"{count}")
+        lines.append(f"{name}_sum{_labels(labels)} {histogram['sum']}")
+        lines.append(f"{name}_count{_labels(labels)} {histogram['count']}")
+
+    name = "exsim_sessions_open"
+    lines.append(f"# HELP {name} Client sessions currently open")
+    lines.append(f"# TYPE {name} gauge")
+    for labels, server in servers:
+        lines.append(f"{name}{_labels(labels)} {server['sessions_open']}")
+
+    lines.append("")
+    return "\n".join(lines)
+
+
+class MetricsListener:
+    """HTTP listener serving a server's metrics to Prometheus."""
+
+    def __init__(self, server, port: int = 0, address: str = "127.0.0.1"):
+        """Constructor.
+
+        :param server: Server whose metrics are served.
+        :param port: TCP port number, or zero for any free port.
+        :param address: Local address to listen on."""
+
+        # Imported here, so servers that never export metrics don't
+        # pay for importing http.server.
+        import http.server
+
+        listener = self
+
+        class Handler(http.server.BaseHTTPRequestHandler):
+            def do_GET(self):
+                if self.path.split("?")[0] != "/metrics":
+                    self.send_error(404)
+                    return
+
+                try:
+                    body = format_prometheus(listener.collect()).encode()
+                except Exception as e:
+                    logger.warning("Failed to collect metrics: %s", e)
+                    self.send_error(503)
+                    return
+
+                self.send_response(200)
+                self.send_header("Content-Type",
+                                 "text/plain; version=0.0.4; charset=utf-8")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+                return
+
+            def log_message(self, format, *args):
+                logger.debug("Metrics request: " + format, *args)
+                return
+
+        self._server = server
+        self._httpd = http.server.ThreadingHTTPServer((address, port),
+                                                      Handler)
+        self._httpd.daemon_threads = True
+        self._thread = threading.Thread(target=self._httpd.serve_forever,
+                                        name="exsim-metrics", daemon=True)
+        self._thread.start()
+        return
+
+    def port(self) -> int:
+        """Return the listener's TCP port number."""
+        return self._httpd.server_address[1]
+
+    def collect(self) -> dict:
+        """Return the server's metrics, collected in its event loop."""
+        future = concurrent.futures.Future()
+
+        def collect():
+            try:
+                future.set_result(self._server.get_metrics())
+            except Exception as e:
+                future.set_exception(e)
+            return
+
+        self._server.call_soon_threadsafe(collect)
+        return future.result(COLLECT_TIMEOUT)
+
+    def close(self):
+        """Stop listening, and wait for the listener's thread to exit."""
+        self._httpd.shutdown()
+        self._httpd.server_close()
+        self._thread.join()
+        return
@@ -0,0 +1,165 @@
+# -*- coding: utf-8 -*-
+########################################################################
+# exsim - Exchange Simulator
+# Copyright (C) 2016-2023, zeroXone.
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see http://www.gnu.org/licenses/
+#
+########################################################################
+
+# Management messages are JSON objects, each sent with a five byte
+# header: a protocol version number, and the length of the UTF-8
+# encoded JSON text that follows.
+#
+# Every request has a "type", and may have an "id".  The reply to a
+# request carries the same "id", so a client can have many requests
+# outstanding, and match up the replies as they arrive.  Replies are
+# sent in the order the requests were received.
+#
+# A client can also subscribe to events, which the server sends as
+# they happen, as messages with "event" (the topic) and "data" fields,
+# and no "id".
+
+import json
+import struct
+import typing
+
+
+PROTOCOL_VERSION = 1
+
+# Largest message accepted.
+MAX_MESSAGE_SIZE = 64 * 1024 * 1024
+
+_HEADER = struct.Struct("<BL")
+
+# Parameters required by each request type, and their types.
+REQUEST_SCHEMAS: typing.Dict[str, typing.Dict[str, type]] = {
+    "load_engine": {"name": str, "module": str, "class": str},
+    "create_engine": {"name": str, "engine_type": str},
+    "delete_engine": {"name": str},
+    "set_engine_property": {"name": str, "property": str, "value": object},
+    "start_engine": {"name": str},
+    "stop_engine": {"name": str},
+    "create_endpoint": {"name": str, "port": int, "protocol": str,
+                        "engine": str},
+    "set_endpoint_engine": {"endpoint": str, "engine": str},
+    "set_endpoint_protocol": {"endpoint": str, "protocol": str},
+    "load_protocol": {"name": str, "module": str, "class": str},
+    "unload_engine": {"name": str},
+    "unload_protocol": {"name": str},
+    "delete_endpoint": {"name": str},
+    "set_endpoint_property": {"name": str, "property": str,
+                              "value": object},
+    "batch": {"requests": list},
+    "subscribe": {"topics": list},
+    "get_book": {"engine": str, "symbol": str},
+    "start_journal": {"path": str},
+    "stop_journal": {},
+    "get_metrics": {},
+    "start_metrics": {"port": int},
+    "stop_metrics": {},
+    "set_log_level": {"subsystem": str, "level": str},
+    "get_log_levels": {},
+    "start_watchdog": {},
+    "get_stalls": {},
+    "stop_watchdog": {},
+    "start_profile": {"mode": str},
+    "stop_profile": {},
+}
+
+
+class ProtocolError(Exception):
+    """Management connection received an undecodable message."""
+
+
+def encode_message(message: dict) -> bytes:
+    """Return a message encoded for the management connection.
+
+    :param message: Message dictionary, of JSON-compatible values."""
+    body = json.dumps(message, separators=(",", ":")).encode()
+    if len(body) > MAX_MESSAGE_SIZE:
+        raise ValueError(f"Message too large: {len(body)} bytes")
+    return _HEADER.pack(PROTOCOL_VERSION, len(body)) + body
+
+
+def validate_request(request: dict) -> typing.Optional[str]:
+    """Check a request against its schema.
+
+    :param request: Decoded request dictionary.
+    :returns: None if valid, otherwise a description of the problem."""
+    request_type = request.get("type")
+    if not isinstance(request_type, str):
+        return f"Request type must be str: {request_type!r}"
+
+    schema = REQUEST_SCHEMAS.get(request_type)
+    if schema is None:
+        return f"Unknown request type: '{request_type}'"
+
+    for name, value_type in schema.items():
+        if name not in request:
+            return f"Missing '{name}' parameter"
+        if not isinstance(request[name], value_type):
+            return f"Parameter '{name}' must be {value_type.__name__}"
+    return None
+
+
+class MessageReader:
+    """Incremental decoder for management messages."""
+
+    def __init__(self):
+        """Constructor."""
+        self._buffer = bytearray()
+        self._start = 0
+        return
+
+    def append_buffer(self, data: bytes):
+        """Append received bytes to the buffer."""
+        if self._start:
+            del self._buffer[:self._start]
+            self._start = 0
+        self._buffer += data
+        return
+
+    def get_messages(self) -> typing.List[dict]:
+        """Return all complete messages in the buffer.
+
+        Raises ProtocolError if the data can't be decoded: the stream
+        can't be resynchronised after that, so the connection should be
+        closed."""
+        messages = []
+        buf = self._buffer
+        offset = self._start
+        while len(buf) - offset >= _HEADER.size:
+            version, length = _HEADER.unpack_from(buf, offset)
+            if version != PROTOCOL_VERSION:
+                raise ProtocolError(f"Unsupported protocol version {version}")
+            if length > MAX_MESSAGE_SIZE:
+                raise ProtocolError(f"Message too large: {length} bytes")
+
+            end = offset + _HEADER.size + length
+            if len(buf) < end:
+                break
+
+            try:
+                message = json.loads(buf[offset + _HEADER.size:end])
+            except ValueError as e:
+                raise ProtocolError(f"Bad message: {e}")
+            if not isinstance(message, dict):
+                raise ProtocolError("Message is not an object")
+
+            messages.append(message)
+            offset = end
+
+        self._start = offset
+        return messages
@@ -18,27 +18,204 @@
 #
 ########################################################################
 
+import array
+import typing
+
 
 class Order(object):
 
+    __slots__ = ("order_id", "client_order_id", "session", "symbol", "side",
+                 "order_type", "time_in_force", "quantity",
+                 "remaining_quantity", "price")
+
     def __init__(self):
+        self.order_id = 0  # assigned by engine
+        self.client_order_id = ''
+        self.session = None  # originating session
         self.symbol = ''
+        self.side = 0  # Side.BUY or Side.SELL
         self.order_type = 0  # market, limit, etc
         self.time_in_force = 0  # IOC, Day, GTD, GTC, FOK, FAK, OCO, etc, etc
         self.quantity = 0
+        self.remaining_quantity = 0
+        self.price = None  # None for orders without a limit
         return
 
 
 class LimitOrder(Order):
 
+    __slots__ = ()
+
     def __init__(self):
         super(LimitOrder, self).__init__()
-        self.limit_price = 0
+        self.price = 0
         return
 
 
 class MarketOrder(Order):
 
+    __slots__ = ()
+
     def __init__(self):
         super(MarketOrder, self).__init__()
         return
+
+
+# Null handle value.
+NO_ORDER = -1
+
+# Order identifiers combine a handle (in the low bits) with a count of
+# the times the handle has been used (in the high bits).
+_HANDLE_BITS = 32
+_HANDLE_MASK = (1 << _HANDLE_BITS) - 1
+
+
+class OrderStore:
+    """Compact storage for orders, addressed by integer handle.
+
+    Rather than an object per order, each attribute is kept in its own
+    array, indexed by the order's handle.  Numeric attributes use typed
+    arrays, so they cost a few bytes each, and there are no per-order
+    objects for the garbage collector to traverse.
+
+    Released handles are kept on a free list, and reused by later
+    allocations, so the arrays only grow to the peak number of live
+    orders.  The store assigns each order a unique identifier, which
+    encodes its handle, so an order can be found from its identifier
+    without needing an index.
+
+    The store also holds the links for the price level queues in a
+    Book, so resting orders need no additional objects there either."""
+
+    def __init__(self):
+        """Constructor."""
+
+        # Numeric attributes.
+        self.order_id = array.array('q')
+        self.generation = array.array('l')
+        self.resting = array.array('b')  # true if in a Book
+        self.side = array.array('b')
+        self.quantity = array.array('q')
+        self.remaining_quantity = array.array('q')
+        self.price = array.array('d')  # NaN for orders without a limit
+
+        # Object attributes.
+        self.client_order_id: typing.List = []
+        self.session: typing.List = []
+        self.symbol: typing.List = []
+        self.order_type: typing.List = []
+        self.time_in_force: typing.List = []
+
+        # Queue links, for the orders at a price level.
+        self.prev = array.array('q')
+        self.next = array.array('q')
+
+        self._free: typing.List[int] = []
+        return
+
+    def __len__(self):
+        """Return the number of allocated orders."""
+        return len(self.order_id) - len(self._free)
+
+    def allocate(self, client_order_id, session, symbol, side: int,
+                 order_type, time_in_force, quantity: int, price) -> int:
+        """Store a new order.
+
+        :param client_order_id: Client's identifier for the order.
+        :param session: Originating Session.
+        :param symbol: Instrument symbol.
+        :param side: Side.BUY or Side.SELL.
+        :param order_type: Order type.
+        :param time_in_force: Time in force.
+        :param quantity: Order quantity.
+        :param price: Limit price, or None.
+        :returns: Handle for the new order."""
+
+        if price is None:
+            price = float('nan')
+
+        if self._free:
+            handle = self._free.pop()
+            generation = self.generation[handle] + 1
+            self.generation[handle] = generation
+            self.order_id[handle] = (generation << _HANDLE_BITS) | handle
+            self.resting[handle] = 0
+            self.side[handle] = side
+            self.quantity[handle] = quantity
+            self.remaining_quantity[handle] = quantity
+            self.price[handle] = price
+            self.client_order_id[handle] = client_order_id
+            self.session[handle] = session
+            self.symbol[handle] = symbol
+            self.order_type[handle] = order_type
+            self.time_in_force[handle] = time_in_force
+            self.prev[handle] = NO_ORDER
+            self.next[handle] = NO_ORDER
+            return handle
+
+        handle = len(self.order_id)
+        if handle > _HANDLE_MASK:
+            raise MemoryError("Order store is full")
+
+        self.order_id.append((1 << _HANDLE_BITS) | handle)
+        self.generation.append(1)
+        self.resting.append(0)
+        self.side.append(side)
+        self.quantity.append(quantity)
+        self.remaining_quantity.append(quantity)
+        self.price.append(price)
+        self.client_order_id.append(client_order_id)
+        self.session.append(session)
+        self.symbol.append(symbol)
+        self.order_type.append(order_type)
+        self.time_in_force.append(time_in_force)
+        self.prev.append(NO_ORDER)
+        self.next.append(NO_ORDER)
+        return handle
+
+    def find(self, order_id: int) -> int:
+        """Return the handle for a live order, or NO_ORDER.
+
+        :param order_id: Identifier assigned to the order."""
+        handle = order_id & _HANDLE_MASK
+        if order_id <= 0 or handle >= len(self.order_id) or \
+                self.order_id[handle] != order_id:
+            return NO_ORDER
+        return handle
+
+    def release(self, handle: int):
+        """Return an order's handle to the free list.
+
+        :param handle: Handle from allocate().
+
+        The handle must not be used again until it's returned by a
+        later call to allocate()."""
+
+        # Invalidate the identifier, and drop object references so they
+        # can be collected.
+        self.order_id[handle] = 0
+        self.client_order_id[handle] = None
+        self.session[handle] = None
+        self._free.append(handle)
+        return
+
+    def get_price(self, handle: int):
+        """Return an order's limit price, or None if it has none."""
+        price = self.price[handle]
+        return None if price != price else price
+
+    def get_order(self, handle: int) -> Order:
+        """Return a copy of an order's attributes as an Order instance."""
+        order = LimitOrder() if self.price[handle] == self.price[handle] \
+            else MarketOrder()
+        order.order_id = self.order_id[handle]
+        order.client_order_id = self.client_order_id[handle]
+        order.session = self.session[handle]
+        order.symbol = self.symbol[handle]
+        order.side = self.side[handle]
+        order.order_type = self.order_type[handle]
+        order.time_in_force = self.time_in_force[handle]
+        order.quantity = self.quantity[handle]
+        order.remaining_quantity = self.remaining_quantity[handle]
+        order.price = self.get_price(handle)
+        return order
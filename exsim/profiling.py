@@ -0,0 +1,321 @@
+# -*- coding: utf-8 -*-
+########################################################################
+# exsim - Exchange Simulator
+# Copyright (C) 2016-2023, zeroXone.
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see http://www.gnu.org/licenses/
+#
+########################################################################
+
+# All sessions share one event loop, so a handler that runs for too
+# long delays every other client.  Two tools help find them while the
+# server is running:
+#
+# A Watchdog times each dispatch from the event loop (a socket becoming
+# readable or writable, or a timeout expiring), and records those that
+# take longer than its threshold.  Timing is done in the loop itself,
+# but the stack of a slow handler can only be seen while it's running,
+# so a separate thread polls the current dispatch, and takes a sample
+# of the event loop thread's stack once it has run past the threshold.
+#
+# A Profiler collects a profile of the event loop thread, using either
+# cProfile, which counts every call, or a thread that periodically
+# samples the event loop thread's stack, which is cheaper but
+# approximate.  A sampling thread only runs when the event loop thread
+# releases the GIL, so samples are biased towards the points where it
+# does: blocking system calls, and the interpreter's switch interval.
+
+import cProfile
+import collections
+import logging
+import pstats
+import sys
+import threading
+import time
+import traceback
+import typing
+
+
+logger = logging.getLogger("exsim.server")
+
+
+# Default duration, in seconds, of a dispatch counted as a stall.
+DEFAULT_STALL_THRESHOLD = 0.05
+
+# Number of most recent stalls kept.
+MAX_STALLS = 100
+
+CPROFILE = "cprofile"
+SAMPLING = "sampling"
+
+# Default time between samples, in seconds, for a sampling profile.
+DEFAULT_SAMPLE_INTERVAL = 0.001
+
+# Number of entries in a profile's report.
+DEFAULT_PROFILE_LIMIT = 50
+
+
+def describe_handler(handler: typing.Callable) -> str:
+    """Return a readable name for an event loop callback.
+
+    :param handler: Callable dispatched by the event loop."""
+    while hasattr(handler, "func"):
+        # functools.partial
+        handler = handler.func
+
+    owner = getattr(handler, "__self__", None)
+    if owner is None:
+        return getattr(handler, "__qualname__", repr(handler))
+
+    name = f"{type(owner).__name__}.{handler.__name__}"
+    sock = getattr(owner, "socket", None)
+    if callable(sock):
+        name += f" (fd {sock().fileno()})"
+    return name
+
+
+def _code_name(code) -> str:
+    """(Internal) Return a code object's function name.
+
+    The qualified name (with its class) is only available from Python
+    3.11."""
+    return getattr(code, "co_qualname", code.co_name)
+
+
+def _frame_name(frame) -> str:
+    """(Internal) Return a stack frame's function, and its location."""
+    code = frame.f_code
+    return f"{_code_name(code)} ({code.co_filename}:{frame.f_lineno})"
+
+
+class Watchdog:
+    """Detector for event loop dispatches that run too long."""
+
+    def __init__(self, threshold: float = DEFAULT_STALL_THRESHOLD):
+        """Constructor.
+
+        :param threshold: Dispatch time, in seconds, counted as a stall.
+
+        Must be created in the event loop thread."""
+        if threshold <= 0:
+            raise ValueError(f"Bad stall threshold: {threshold}")
+
+        self._threshold = threshold
+        self._loop_thread = threading.get_ident()
+
+        # Sequence number and start time of the running dispatch, if
+        # any, set as a single tuple so the polling thread always sees
+        # a consistent pair.
+        self._sequence = 0
+        self._current: typing.Optional[typing.Tuple[int, float]] = None
+
+        # Sequence number and stack of the last dispatch sampled.
+        self._sample: typing.Optional[typing.Tuple[int, list]] = None
+
+        self._count = 0
+        self._stalls = collections.deque(maxlen=MAX_STALLS)
+
+        self._stopped = threading.Event()
+        self._thread = threading.Thread(target=self._poll,
+                                        name="exsim-watchdog",
+                                        daemon=True)
+        self._thread.start()
+        return
+
+    def threshold(self) -> float:
+        """Return the dispatch time, in seconds, counted as a stall."""
+        return self._threshold
+
+    def call(self, handler: typing.Callable):
+        """Run and time an event loop callback.
+
+        :param handler: Callable, taking no parameters."""
+        self._sequence += 1
+        sequence = self._sequence
+        started = time.perf_counter()
+        self._current = (sequence, started)
+        try:
+            handler()
+        finally:
+            self._current = None
+
+        elapsed = time.perf_counter() - started
+        if elapsed >= self._threshold:
+            self._record(sequence, handler, elapsed)
+        return
+
+    def _record(self, sequence: int, handler: typing.Callable,
+                elapsed: float):
+        """(Internal) Record a stall."""
+        sample = self._sample
+        stack = sample[1] if sample and sample[0] == sequence else []
+        name = describe_handler(handler)
+
+        self._count += 1
+        self._stalls.append({"time": time.time(),
+                             "handler": name,
+                             "seconds": elapsed,
+                             "stack": stack})
+        logger.warning("Event loop stalled for %.3fs in %s", elapsed, name)
+        return
+
+    def _poll(self):
+        """(Internal) Sample the stack of dispatches past the threshold."""
+        interval = self._threshold / 2
+        while not self._stopped.wait(interval):
+            current = self._current
+            if current is None:
+                continue
+
+            sequence, started = current
+            if time.perf_counter() - started < self._threshold:
+                continue
+            if self._sample and self._sample[0] == sequence:
+                continue
+
+            frame = sys._current_frames().get(self._loop_thread)
+            if frame is not None:
+                stack = [_frame_name(f) for f, _ in
+                         traceback.walk_stack(frame)]
+                self._sample = (sequence, stack)
+        return
+
+    def get_report(self) -> dict:
+        """Return the recorded stalls, as JSON-compatible values.
+
+        The report has the "threshold" in seconds, the total "count"
+        of stalls, and a list of the most recent "stalls", oldest first.
+        Each stall has its wall clock "time", the "handler" name, its
+        duration in "seconds", and the "stack" sampled while it was
+        running, innermost frame first (empty if it wasn't sampled)."""
+        return {"threshold": self._threshold,
+                "count": self._count,
+                "stalls": list(self._stalls)}
+
+    def stop(self):
+        """Stop the polling thread."""
+        self._stopped.set()
+        self._thread.join()
+        return
+
+
+class Profiler:
+    """Profile of the event loop thread."""
+
+    def __init__(self, mode: str = CPROFILE,
+                 interval: float = DEFAULT_SAMPLE_INTERVAL):
+        """Constructor.
+
+        :param mode: CPROFILE, to count every call, or SAMPLING, to
+            periodically sample the stack.
+        :param interval: Time between samples, in seconds, for SAMPLING.
+
+        Must be created in the event loop thread.  Profiling starts
+        immediately."""
+        if mode not in (CPROFILE, SAMPLING):
+            raise ValueError(f"Bad profile mode: '{mode}'")
+        if interval <= 0:
+            raise ValueError(f"Bad sample interval: {interval}")
+
+        self._mode = mode
+        self._interval = interval
+        self._started = time.perf_counter()
+        self._elapsed = None
+
+        # Count of samples of each stack, as a tuple of frame names,
+        # outermost first.
+        self._samples: typing.Dict[tuple, int] = collections.Counter()
+
+        self._profile = None
+        self._thread = None
+        if mode == CPROFILE:
+            self._profile = cProfile.Profile()
+            self._profile.enable()
+        else:
+            self._loop_thread = threading.get_ident()
+            self._stopped = threading.Event()
+            self._thread = threading.Thread(target=self._sample,
+                                            name="exsim-profiler",
+                                            daemon=True)
+            self._thread.start()
+        return
+
+    def mode(self) -> str:
+        """Return the profiling mode."""
+        return self._mode
+
+    def _sample(self):
+        """(Internal) Sample the event loop thread's stack."""
+        samples = self._samples
+        while not self._stopped.wait(self._interval):
+            frame = sys._current_frames().get(self._loop_thread)
+            if frame is not None:
+                stack = tuple(f"{_code_name(f.f_code)} "
+                              f"({f.f_code.co_filename})"
+                              for f, _ in traceback.walk_stack(frame))
+                samples[stack[::-1]] += 1
+        return
+
+    def stop(self):
+        """Stop profiling.  Must be called in the event loop thread."""
+        if self._elapsed is not None:
+            return
+
+        self._elapsed = time.perf_counter() - self._started
+        if self._profile is not None:
+            self._profile.disable()
+        else:
+            self._stopped.set()
+            self._thread.join()
+        return
+
+    def get_report(self, limit: int = DEFAULT_PROFILE_LIMIT) -> dict:
+        """Return the profile, as JSON-compatible values.
+
+        :param limit: Maximum number of entries to report.
+
+        The report has the "mode", and the profile's duration in
+        "seconds".  A CPROFILE report lists "functions", by descending
+        cumulative time, each with its "function" name and location,
+        its count of "calls", and its "total_seconds" (excluding calls
+        it made) and "cumulative_seconds".  A SAMPLING report has the
+        total count of "samples", and lists "stacks", by descending
+        sample count, each with the "stack" in the folded format used
+        by flame graph tools (frame names, outermost first, separated
+        by semicolons) and its "count"."""
+        report = {"mode": self._mode,
+                  "seconds": (self._elapsed if self._elapsed is not None
+                              else time.perf_counter() - self._started)}
+
+        if self._profile is not None:
+            stats = pstats.Stats(self._profile).stats
+            functions = []
+            for (filename, line, name), (_, calls, total, cumulative, _) \
+                    in stats.items():
+                functions.append({"function": f"{name} ({filename}:{line})",
+                                  "calls": calls,
+                                  "total_seconds": total,
+                                  "cumulative_seconds": cumulative})
+            functions.sort(key=lambda f: f["cumulative_seconds"],
+                           reverse=True)
+            report["functions"] = functions[:limit]
+        else:
+            samples = dict(self._samples)
+            report["samples"] = sum(samples.values())
+            report["stacks"] = [{"stack": ";".join(stack), "count": count}
+                                for stack, count in
+                                sorted(samples.items(),
+                                       key=lambda s: s[1],
+                                       reverse=True)[:limit]]
+        return report
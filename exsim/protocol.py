@@ -28,6 +28,11 @@
 # data, order entry, and drop copy.  A given protocol implementation
 # can support one or more of these roles.
 
+import logging
+
+
+logger = logging.getLogger("exsim.protocol")
+
 
 class Protocol:
     """A protocol module."""
@@ -37,8 +42,15 @@ class Protocol:
         return
 
     def receive(self, buf):
-        """Process a byte buffer received from the session."""
-        return
+        """Process a byte buffer received from the session.
+
+        Returns a list of the complete messages decoded, to be
+        delivered to the engine."""
+        return []
+
+    def parse_errors(self) -> int:
+        """Return the number of received messages discarded as malformed."""
+        return 0
 
     def send(self, message):
         """Encode this message, and send it via the session."""
@@ -77,10 +89,28 @@ class Protocol:
         elif message_type == "cancel_ack":
             self.send_cancel_ack(message)
 
+        elif message_type == "cancel_reject":
+            self.send_cancel_reject(message)
+
         elif message_type == "replace_ack":
             self.send_replace_ack(message)
 
+        elif message_type == "market_data_snapshot":
+            self.send_market_data_snapshot(message)
+
+        elif message_type == "market_data_incremental":
+            self.send_market_data_incremental(message)
+
+        elif message_type == "subscribe_reject":
+            self.send_subscribe_reject(message)
+
+        elif message_type == "drop_copy":
+            self.send_drop_copy(message)
+
+        elif message_type == "trade":
+            self.send_trade(message)
+
         else:
-            logging.warning("Unhandled message type: '%s'" % message_type)
+            logger.warning("Unhandled message type: '%s'", message_type)
 
         return
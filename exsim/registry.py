@@ -0,0 +1,165 @@
+# -*- coding: utf-8 -*-
+########################################################################
+# exsim - Exchange Simulator
+# Copyright (C) 2016-2023, zeroXone.
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see http://www.gnu.org/licenses/
+#
+########################################################################
+
+# Engines and protocols are plugins: classes derived from Engine or
+# Protocol.  A plugin can be loaded explicitly, by module and class
+# name, or found by name in the "exsim.engines" and "exsim.protocols"
+# entry point groups, which other packages declare in their setup.py:
+#
+#     entry_points={"exsim.engines": ["mine = mypackage.engine:MyEngine"]}
+#
+# Installed entry points are discovered once per process, when a name
+# is first looked up.  Each plugin module is imported when the plugin
+# is first used, and the class is cached, so later loads, in this or
+# any other server in the process, are just a dictionary lookup.
+
+import importlib
+import logging
+import typing
+
+try:
+    from importlib import metadata
+except ImportError:
+    # Python 3.7: only the built-in plugins are available by name.
+    metadata = None
+
+from .engine import Engine
+from .protocol import Protocol
+
+
+logger = logging.getLogger("exsim.plugins")
+
+
+ENGINE_GROUP = "exsim.engines"
+PROTOCOL_GROUP = "exsim.protocols"
+
+# Plugins included with exsim.  These are also declared as entry points
+# in setup.py, but are listed here so they're found when running from
+# a source tree.
+_BUILTIN = {
+    ENGINE_GROUP: {"default": "exsim.default_engine:DefaultEngine"},
+    PROTOCOL_GROUP: {"fix42": "exsim.fix_protocol:FixProtocol"},
+}
+
+# Resolved classes, by (module name, class name, base class).
+_classes: typing.Dict[typing.Tuple[str, str, type], type] = {}
+
+
+def load_class(module_name: str, class_name: str, base: type) -> type:
+    """Return a plugin class, importing its module if necessary.
+
+    :param module_name: Name of a module in the exsim package, or a
+        full dotted module name.
+    :param class_name: Name of the class within the module.
+    :param base: Class the plugin must be derived from."""
+    key = (module_name, class_name, base)
+    cls = _classes.get(key)
+    if cls is not None:
+        return cls
+
+    if not all(part.isidentifier() for part in module_name.split(".")):
+        raise ValueError(f"Bad module name: '{module_name}'")
+    if not class_name.isidentifier():
+        raise ValueError(f"Bad class name: '{class_name}'")
+
+    module = _import_module(module_name)
+    cls = getattr(module, class_name, None)
+    if not isinstance(cls, type) or not issubclass(cls, base):
+        raise TypeError(f"{module.__name__}.{class_name} is not "
+                        f"a subclass of {base.__name__}")
+
+    _classes[key] = cls
+    return cls
+
+
+def _import_module(module_name: str):
+    """(Internal) Import a module, looking in the exsim package first."""
+    if "." not in module_name:
+        try:
+            return importlib.import_module("exsim." + module_name)
+        except ModuleNotFoundError as e:
+            if e.name != "exsim." + module_name:
+                raise
+    return importlib.import_module(module_name)
+
+
+def _entry_points(group: str) -> list:
+    """(Internal) Return the installed entry points in a group."""
+    if metadata is None:
+        return []
+    try:
+        return list(metadata.entry_points(group=group))
+    except TypeError:
+        # Python 3.8 and 3.9 return a dictionary of groups.
+        return list(metadata.entry_points().get(group, []))
+
+
+class Registry:
+    """Plugin classes of one kind, by name."""
+
+    def __init__(self, group: str, base: type):
+        """Constructor.
+
+        :param group: Entry point group name.
+        :param base: Class that plugins must be derived from."""
+        self._group = group
+        self._base = base
+
+        # Map of plugin name to "module:class", once discovered.
+        self._specs: typing.Optional[typing.Dict[str, str]] = None
+        return
+
+    def names(self) -> typing.List[str]:
+        """Return the names of all available plugins."""
+        return sorted(self._discover())
+
+    def get(self, name: str) -> typing.Optional[type]:
+        """Return the named plugin class, or None if there's no such plugin.
+
+        :param name: Plugin name."""
+        spec = self._discover().get(name)
+        if spec is None:
+            return None
+
+        module_name, _, class_name = spec.partition(":")
+        return load_class(module_name.strip(), class_name.strip(),
+                          self._base)
+
+    def _discover(self) -> typing.Dict[str, str]:
+        """(Internal) Find installed plugins, the first time it's called."""
+        if self._specs is not None:
+            return self._specs
+
+        specs = dict(_BUILTIN.get(self._group, {}))
+        for entry_point in _entry_points(self._group):
+            existing = specs.get(entry_point.name)
+            if existing is not None and existing != entry_point.value:
+                logger.warning("Ignored duplicate %s plugin '%s': %s",
+                               self._group, entry_point.name,
+                               entry_point.value)
+                continue
+            specs[entry_point.name] = entry_point.value
+
+        self._specs = specs
+        return specs
+
+
+engines = Registry(ENGINE_GROUP, Engine)
+protocols = Registry(PROTOCOL_GROUP, Protocol)
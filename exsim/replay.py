@@ -0,0 +1,225 @@
+# -*- coding: utf-8 -*-
+########################################################################
+# exsim - Exchange Simulator
+# Copyright (C) 2016-2023, zeroXone.
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see http://www.gnu.org/licenses/
+#
+########################################################################
+
+# Replay feeds the client traffic recorded in a journal back into an
+# engine.  Each recorded session gets a new protocol instance, which
+# decodes the session's inbound data, and the messages are delivered to
+# the engine just as a Session would deliver them.  Replies are counted
+# and discarded: nothing is sent over the network.
+#
+# Following sessions (drop copies and trade feeds) get the queue size
+# and policy recorded for their endpoint.  With no event loop to send
+# the rest later, events still queued after a batch are sent before
+# the next record is replayed, as replay sessions never fall behind.
+#
+# By default records are replayed as fast as possible, for reproducing
+# problems and measuring matching throughput.  A pace of 1.0 replays
+# at the recorded speed, 10.0 at ten times that, and so on.
+#
+#     python -m exsim.replay xs.journal --engine default --protocol fix42
+
+import argparse
+import json
+import sys
+import time
+import typing
+
+from . import registry
+from .bus import DEFAULT_POLICY, DEFAULT_QUEUE_SIZE
+from .endpoint import ORDER_ENTRY
+from .engine import Engine
+from .journal import CLOSE, INBOUND, OPEN, OUTBOUND, JournalReader
+from .protocol import Protocol
+
+
+class ReplayEndpoint:
+    """Stands in for a recorded session's Endpoint."""
+
+    def __init__(self, name: str, role: str, protocol: type, engine: Engine,
+                 queue_size: int = DEFAULT_QUEUE_SIZE,
+                 policy: str = DEFAULT_POLICY):
+        self._name = name
+        self._role = role
+        self._protocol = protocol
+        self._engine = engine
+        self._queue_size = queue_size
+        self._policy = policy
+        return
+
+    def name(self) -> str:
+        return self._name
+
+    def role(self) -> str:
+        return self._role
+
+    def protocol(self) -> type:
+        return self._protocol
+
+    def engine(self) -> Engine:
+        return self._engine
+
+    def queue_size(self) -> int:
+        return self._queue_size
+
+    def policy(self) -> str:
+        return self._policy
+
+
+class ReplaySession:
+    """Stands in for a recorded Session, counting what's sent to it."""
+
+    def __init__(self, endpoint: ReplayEndpoint, address):
+        self._endpoint = endpoint
+        self._address = address
+        self._protocol = endpoint.protocol()(self)
+
+        self.sent = 0
+        self.sent_bytes = 0
+        return
+
+    def endpoint(self) -> ReplayEndpoint:
+        return self._endpoint
+
+    def engine(self) -> Engine:
+        return self._endpoint.engine()
+
+    def protocol(self) -> Protocol:
+        return self._protocol
+
+    def address(self):
+        return self._address
+
+    def output_size(self) -> int:
+        return 0
+
+    def send(self, data: bytes):
+        self.sent += 1
+        self.sent_bytes += len(data)
+        return
+
+
+def replay(path: str, engine: Engine, protocol: type,
+           pace: float = 0.0) -> typing.Dict[str, typing.Any]:
+    """Replay a journal's inbound traffic into an engine.
+
+    :param path: Journal file name.
+    :param engine: Engine to receive the messages.
+    :param protocol: Protocol class used to decode each session.
+    :param pace: Speed relative to the recording, or zero to replay as
+        fast as possible.
+    :returns: Dictionary of statistics: numbers of sessions, messages
+        delivered, replies sent, replies in the recording, and the
+        elapsed time in seconds."""
+    sessions: typing.Dict[int, ReplaySession] = {}
+    closed = []
+    bus = getattr(engine, "bus", None)
+    messages = 0
+    recorded_replies = 0
+    first = None
+
+    start = time.perf_counter()
+    for record_type, number, when, data in JournalReader(path):
+        if record_type == OUTBOUND:
+            recorded_replies += 1
+            continue
+
+        if pace:
+            if first is None:
+                first = when
+            delay = (when - first) / 1e9 / pace - (time.perf_counter() - start)
+            if delay > 0:
+                time.sleep(delay)
+
+        if record_type == INBOUND:
+            session = sessions.get(number)
+            if session is not None:
+                batch = session.protocol().receive(data)
+                if batch:
+                    engine.deliver_batch(batch)
+                    messages += len(batch)
+                    while bus is not None and bus.has_pending():
+                        bus.flush()
+
+        elif record_type == OPEN:
+            info = json.loads(data)
+            endpoint = ReplayEndpoint(
+                info["endpoint"], info.get("role", ORDER_ENTRY), protocol,
+                engine, info.get("queue_size", DEFAULT_QUEUE_SIZE),
+                info.get("policy", DEFAULT_POLICY))
+            session = ReplaySession(endpoint, info.get("address"))
+            sessions[number] = session
+            engine.attach_session(session)
+
+        elif record_type == CLOSE:
+            session = sessions.pop(number, None)
+            if session is not None:
+                engine.detach_session(session)
+                closed.append(session)
+
+    elapsed = time.perf_counter() - start
+    replayed = closed + list(sessions.values())
+    return {"sessions": len(replayed),
+            "messages": messages,
+            "replies": sum(s.sent for s in replayed),
+            "recorded_replies": recorded_replies,
+            "elapsed": elapsed}
+
+
+def _load(registry_: registry.Registry, spec: str, base: type) -> type:
+    """(Internal) Return a plugin class, by name or "module:class"."""
+    if ":" in spec:
+        module_name, _, class_name = spec.partition(":")
+        return registry.load_class(module_name, class_name, base)
+
+    cls = registry_.get(spec)
+    if cls is None:
+        raise KeyError(f"No such plugin: '{spec}'")
+    return cls
+
+
+def main(argv: typing.Optional[typing.List[str]] = None):
+    parser = argparse.ArgumentParser(
+        prog="python -m exsim.replay",
+        description="Replay a journal's order flow into a new engine.")
+    parser.add_argument("journal", help="journal file name")
+    parser.add_argument("--engine", default="default",
+                        help="engine type name, or module:class")
+    parser.add_argument("--protocol", default="fix42",
+                        help="protocol name, or module:class")
+    parser.add_argument("--pace", type=float, default=0.0,
+                        help="speed relative to the recording "
+                             "(default: as fast as possible)")
+    args = parser.parse_args(argv)
+
+    engine_class = _load(registry.engines, args.engine, Engine)
+    protocol = _load(registry.protocols, args.protocol, Protocol)
+    engine = engine_class("replay")
+    engine.start()
+
+    stats = replay(args.journal, engine, protocol, args.pace)
+    if stats["elapsed"]:
+        stats["messages_per_second"] = stats["messages"] / stats["elapsed"]
+    json.dump(stats, sys.stdout, indent=2)
+    print()
+    return
+
+
+if __name__ == "__main__":
+    main()
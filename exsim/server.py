@@ -18,29 +18,47 @@
 #
 ########################################################################
 
+import collections
+import functools
 import logging
-import select
+import selectors
 import socket
 import time
 import typing
 
-from .endpoint import Endpoint
+from . import log, registry
+from .bus import DEFAULT_POLICY, DEFAULT_QUEUE_SIZE
+from .endpoint import Endpoint, ORDER_ENTRY
 from .engine import Engine
+from .journal import Journal
 from .manager import Manager
+from .metrics import Histogram, MetricsListener
+from .profiling import (DEFAULT_SAMPLE_INTERVAL, DEFAULT_STALL_THRESHOLD,
+                        Profiler, Watchdog)
 from .protocol import Protocol
 from .session import Session
+from .timer import Timeout, TimerQueue
 
-# FIXME: this should be loaded as a plugin
-from .default_engine import DefaultEngine
 
+logger = logging.getLogger("exsim.server")
 
-logging.basicConfig(filename="xs.log", level=logging.DEBUG)
 
+# Event topics a management client can subscribe to.
+EVENT_TOPICS = ("session", "execution")
 
-class Server:
 
-    def __init__(self):
-        """Constructor."""
+class BaseServer:
+    """Common base for simulator servers.
+
+    Holds the loaded engine and protocol types, and the engines and
+    endpoints created from them.  Derived classes provide the event
+    loop that drives the management interface and client sessions."""
+
+    def __init__(self, management: bool = True):
+        """Constructor.
+
+        :param management: If False, don't open a management socket: the
+            server is controlled only by direct calls."""
 
         self._engine_types: typing.Dict[str, type(Engine)] = {}
 
@@ -48,150 +66,332 @@ class Server:
         self._endpoints: typing.Dict[str, Endpoint] = {}
         self._protocols: typing.Dict[str, Protocol] = {}
 
-        self._session_socks: typing.Dict[socket, Session] = {}
-        self._manager_socks: typing.Dict[socket, Manager] = {}
-        self._endpoint_socks: typing.Dict[socket, Endpoint] = {}
-
         self._is_running: bool = True
-        self._timeouts: typing.List = []
+
+        # Managers subscribed to each event topic.
+        self._subscribers: typing.Dict[str, typing.Set[Manager]] = {}
+
+        # Journal recording session traffic, if any.
+        self._journal: typing.Optional[Journal] = None
+
+        # Time spent handling events per pass through the event loop,
+        # and the HTTP listener exporting metrics, if any.
+        self._loop_time = Histogram()
+        self._metrics_listener: typing.Optional[MetricsListener] = None
+
+        # Stall detector timing event loop dispatches, and profile of
+        # the event loop, if any.
+        self._watchdog: typing.Optional[Watchdog] = None
+        self._profiler: typing.Optional[Profiler] = None
 
         # Management interface.
-        self._mgmt_sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-        self._mgmt_sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
-        self._mgmt_sock.bind(('0.0.0.0', 0))
-        self._mgmt_sock.listen(5)
+        self._mgmt_sock = None
+        if management:
+            self._mgmt_sock = socket.socket(socket.AF_INET,
+                                            socket.SOCK_STREAM)
+            self._mgmt_sock.setsockopt(socket.SOL_SOCKET,
+                                       socket.SO_REUSEADDR, 1)
+            self._mgmt_sock.bind(('0.0.0.0', 0))
+            self._mgmt_sock.listen(5)
         return
 
-    def get_port(self) -> int:
-        """Return integer port number for management socket."""
+    def get_port(self) -> typing.Optional[int]:
+        """Return integer port number for management socket, if any."""
+        if self._mgmt_sock is None:
+            return None
         _, port = self._mgmt_sock.getsockname()
         return port
 
     def authenticate(self, username, password, source_address):
         return
 
-    def create_manager(self, sock):
-        mgmt_sock, mgmt_addr = sock.accept()
-        manager = Manager(mgmt_sock, mgmt_addr)
-        self._manager_socks[mgmt_sock] = manager
-        manager.set_server(self)
+    def run(self):
+        """Run the server's event loop, until stop() is called."""
+        raise NotImplementedError()
 
-        logging.info("New manager %d from %s"
-                     % (manager.socket().fileno(), str(mgmt_addr)))
+    def stop(self):
+        """Request that the server's event loop exit."""
+        self._is_running = False
         return
 
+    def call_soon_threadsafe(self, callback):
+        """Run a callback in the server's event loop.
+
+        :param callback: Callable, taking no parameters.
+
+        This is the only Server method that may be called from a thread
+        other than the one running the event loop."""
+        raise NotImplementedError()
+
+    def add_timeout(self, expiry_time: float, callback):
+        """Schedule a callback.
+
+        :param expiry_time: Time (as for time.time()) to run the callback.
+        :param callback: Callable, taking no parameters.
+        :returns: Handle, to be passed to delete_timeout()."""
+        raise NotImplementedError()
+
+    def delete_timeout(self, timeout):
+        """Cancel a scheduled callback.
+
+        :param timeout: Handle returned from add_timeout()."""
+        raise NotImplementedError()
+
     def manager_closed(self, manager):
-        del self._manager_socks[manager.socket()]
-        logging.info("Closed manager %d" % manager.socket().fileno())
-        manager.close()
+        """Clean up after a management connection closes."""
+        raise NotImplementedError()
+
+    def session_closed(self, session):
+        """Clean up after a client session closes."""
+        raise NotImplementedError()
+
+    def close_later(self, session):
+        """Close a client session, once the current event is handled.
+
+        :param session: Session to be closed.
+
+        Used to close a session other than the one being handled, which
+        might still have events waiting to be dispatched."""
+        raise NotImplementedError()
+
+    def sessions(self) -> list:
+        """Return a list of the open client sessions."""
+        raise NotImplementedError()
+
+    def start_journal(self, path: str):
+        """Record all client session traffic, for later replay.
+
+        :param path: Journal file name.  An existing file is replaced.
+
+        Sessions already open are recorded from now on."""
+        if self._journal is not None:
+            raise KeyError(f"Already recording to '{self._journal.path()}'")
+
+        self._journal = Journal(path)
+        for session in self.sessions():
+            session.set_journal(self._journal)
+        logger.info("Started journal '%s'", path)
         return
 
-    def create_session(self, sock):
-        """Accept a connection to an endpoint, and create a session."""
+    def stop_journal(self):
+        """Stop recording session traffic, and close the journal."""
+        if self._journal is None:
+            raise KeyError("No journal")
 
-        endpoint = self._endpoint_socks[sock]
-        session = endpoint.accept()
-        self._session_socks[session.socket()] = session
+        for session in self.sessions():
+            session.set_journal(None)
+        self._journal.close()
+        logger.info("Stopped journal '%s'", self._journal.path())
+        self._journal = None
+        return
 
-        logging.info("New session %d from %s"
-                     % (session.socket().fileno(), str(session.address())))
+    def get_metrics(self) -> dict:
+        """Return the server's metrics, as JSON-compatible values.
+
+        See metrics.format_prometheus() for the structure."""
+        sessions = self.sessions()
+        return {"server": {"loop_iteration_seconds":
+                           self._loop_time.to_dict(),
+                           "sessions_open": len(sessions)},
+                "engines": {name: engine.get_metrics()
+                            for name, engine in self._engines.items()},
+                "endpoints": {name: endpoint.get_metrics()
+                              for name, endpoint in self._endpoints.items()},
+                "sessions": [session.get_metrics() for session in sessions]}
+
+    def start_metrics(self, port: int = 0,
+                      address: str = "127.0.0.1") -> int:
+        """Serve metrics over HTTP, for Prometheus.
+
+        :param port: TCP port number, or zero for any free port.
+        :param address: Local address to listen on.
+        :returns: Listener's port number."""
+        if self._metrics_listener is not None:
+            raise KeyError("Already serving metrics on port "
+                           f"{self._metrics_listener.port()}")
+
+        self._metrics_listener = MetricsListener(self, port, address)
+        logger.info("Serving metrics on port %d",
+                    self._metrics_listener.port())
+        return self._metrics_listener.port()
+
+    def stop_metrics(self):
+        """Stop serving metrics over HTTP."""
+        if self._metrics_listener is None:
+            raise KeyError("Not serving metrics")
+
+        self._metrics_listener.close()
+        self._metrics_listener = None
+        logger.info("Stopped serving metrics")
         return
 
-    def session_closed(self, session):
-        del self._session_socks[session.socket()]
-        logging.info("Closed %d" % session.socket().fileno())
-        session.close()
+    def set_log_level(self, subsystem: str, level: str):
+        """Set a logging subsystem's level.
+
+        :param subsystem: "exsim" for all subsystems, or one of
+            log.SUBSYSTEMS.
+        :param level: Level name, eg. "DEBUG"."""
+        log.set_level(subsystem, level)
+        logger.info("Set log level for %s to %s", subsystem, level)
         return
 
-    def get_session_socks(self):
-        return [x.socket() for x in self._session_socks.values()]
+    def get_log_levels(self) -> typing.Dict[str, str]:
+        """Return the level name for each logging subsystem."""
+        return log.get_levels()
 
-    def get_endpoints(self):
-        return [e.socket() for e in self._endpoints.values()]
+    def start_watchdog(self, threshold: float = DEFAULT_STALL_THRESHOLD):
+        """Record event loop dispatches that take too long.
 
-    def get_manager_socks(self):
-        return [m.socket() for m in self._manager_socks.values()]
+        :param threshold: Dispatch time, in seconds, counted as a stall."""
+        if self._watchdog is not None:
+            raise KeyError("Watchdog already running, with threshold "
+                           f"{self._watchdog.threshold()}s")
 
-    def run(self):
-        while self._is_running:
-            now = time.time()
-            while True:
-                if len(self._timeouts) == 0:
-                    break
-
-                expiry, callback = self._timeouts[0]
-                if expiry > now:
-                    break
-
-                callback()
-                self._timeouts.pop(0)
-
-            if len(self._timeouts) > 0:
-                wait = self._timeouts[0][0] - time.time()
-                if wait < 0:
-                    wait = 0
-            else:
-                wait = 1.0
+        self._watchdog = Watchdog(threshold)
+        logger.info("Started watchdog, with threshold %gs", threshold)
+        return
 
-            sessions = self.get_session_socks()
-            endpoints = self.get_endpoints()
-            managers = self.get_manager_socks()
+    def get_stalls(self) -> dict:
+        """Return the stalls recorded by the running watchdog.
 
-            r, w, x = select.select(sessions +
-                                    endpoints +
-                                    managers +
-                                    [self._mgmt_sock],
-                                    [], [], wait)
+        See profiling.Watchdog.get_report() for the structure."""
+        if self._watchdog is None:
+            raise KeyError("No watchdog")
+        return self._watchdog.get_report()
 
-            for s in r:
-                if s in sessions:
-                    msg = self._session_socks[s].readable()
-                elif s in endpoints:
-                    self.create_session(s)
-                elif s in managers:
-                    self._manager_socks[s].readable()
-                else:
-                    self.create_manager(s)
+    def stop_watchdog(self) -> dict:
+        """Stop recording stalls.
+
+        :returns: Stalls recorded, as for get_stalls()."""
+        if self._watchdog is None:
+            raise KeyError("No watchdog")
+
+        self._watchdog.stop()
+        report = self._watchdog.get_report()
+        self._watchdog = None
+        logger.info("Stopped watchdog")
+        return report
+
+    def start_profile(self, mode: str = "cprofile",
+                      interval: float = DEFAULT_SAMPLE_INTERVAL):
+        """Start profiling the event loop.
+
+        :param mode: "cprofile", to count every call, or "sampling", to
+            periodically sample the event loop's stack.
+        :param interval: Time between samples, in seconds, if sampling."""
+        if self._profiler is not None:
+            raise KeyError(f"Already profiling, using {self._profiler.mode()}")
+
+        self._profiler = Profiler(mode, interval)
+        logger.info("Started %s profile", mode)
         return
 
-    def add_timeout(self, expiry_time, callback):
-        t = (expiry_time, callback)
-        self._timeouts.append(t)
-        self._timeouts.sort()
+    def stop_profile(self) -> dict:
+        """Stop profiling the event loop.
+
+        :returns: Profile, as for profiling.Profiler.get_report()."""
+        if self._profiler is None:
+            raise KeyError("Not profiling")
+
+        self._profiler.stop()
+        report = self._profiler.get_report()
+        self._profiler = None
+        logger.info("Stopped %s profile", report["mode"])
+        return report
+
+    def subscribe(self, manager: Manager, topics: typing.List[str]):
+        """Send events for the listed topics to a management client.
+
+        :param manager: Subscribing management connection.
+        :param topics: List of topic names, from EVENT_TOPICS."""
+        for topic in topics:
+            if topic not in EVENT_TOPICS:
+                raise KeyError(f"No such topic: {topic!r}")
+
+        for topic in topics:
+            self._subscribers.setdefault(topic, set()).add(manager)
+        return
+
+    def unsubscribe(self, manager: Manager):
+        """Stop sending events to a management client."""
+        for managers in self._subscribers.values():
+            managers.discard(manager)
         return
 
-    def delete_timeout(self, expiry_time, callback):
-        t = (expiry_time, callback)
-        self._timeouts.remove(t)
+    def has_subscribers(self, topic: str) -> bool:
+        """Return True if any management client subscribes to a topic."""
+        return bool(self._subscribers.get(topic))
+
+    def publish(self, topic: str, event: dict):
+        """Send an event to the topic's subscribers.
+
+        :param topic: Topic name.
+        :param event: Event dictionary, of JSON-compatible values."""
+        managers = self._subscribers.get(topic)
+        if managers:
+            message = {"event": topic, "data": event}
+            for manager in list(managers):
+                manager.send(message)
+        return
+
+    def _session_event(self, session, state: str):
+        """(Internal) Publish a session's change of state."""
+        if self.has_subscribers("session"):
+            self.publish("session", {"state": state,
+                                     "endpoint": session.endpoint().name(),
+                                     "address": str(session.address())})
         return
 
+    def _start_endpoint(self, endpoint: Endpoint):
+        """(Internal) Begin accepting connections for a new endpoint."""
+        raise NotImplementedError()
+
+    def _stop_endpoint(self, endpoint: Endpoint):
+        """(Internal) Stop accepting connections for an endpoint."""
+        raise NotImplementedError()
+
     def load_engine(self, name, module_name, class_name):
-        """Load a protocol plugin.
+        """Load an engine plugin.
 
         :param name: String name for this engine.
-        :param module_name: String name for the module file.
-        :param class_name: String name for the engine class."""
+        :param module_name: Name of a module in the exsim package, or
+            a full dotted module name.
+        :param class_name: String name for the engine class.
+
+        Engine types installed as plugins can be used by name without
+        loading them first."""
 
         if name in self._engine_types:
-            return KeyError(f"Engine type '{name}' already loaded")
+            raise KeyError(f"Engine type '{name}' already loaded")
 
-        # FIXME: sanitize!
-        d = {}
-        exec(f"from exsim import {module_name}", globals(), d)
-        exec(f"engine = {module_name}.{class_name}", globals(), d)
-        self._engine_types[name] = d["engine"]
-        logging.info(f"Loaded engine type '{name}'")
+        self._engine_types[name] = registry.load_class(module_name,
+                                                       class_name,
+                                                       Engine)
+        logger.info("Loaded engine type '%s'", name)
+        return
+
+    def unload_engine(self, name):
+        """Unload an engine plugin.
+
+        :param name: String name of engine type."""
+        if name not in self._engine_types:
+            raise KeyError(f"Engine type '{name}' not loaded")
+
+        del self._engine_types[name]
+        logger.info("Unloaded engine type '%s'", name)
         return
 
     def create_engine(self, name: str, engine_type: str):
         if name in self._engines:
             raise KeyError(f"Engine '{name}' already exists")
 
-        if engine_type not in self._engine_types:
-            raise KeyError(f"Engine type '{engine_type}' not leaded")
+        engine_class = self._engine_types.get(engine_type) or \
+            registry.engines.get(engine_type)
+        if not engine_class:
+            raise KeyError(f"Engine type '{engine_type}' not loaded")
 
-        # FIXME: need to lookup the engine type name here
-        engine = self._engine_types[engine_type](name)
+        engine = engine_class(name)
+        engine.set_server(self)
         self._engines[name] = engine
         return engine
 
@@ -204,72 +404,448 @@ class Server:
         engine.delete()
         return
 
-    def set_engine_property(self, name, value):
+    def set_engine_property(self, name, property_name, value):
+        """Configure an engine.
+
+        :param name: Engine name.
+        :param property_name: Name of a property of the engine's class.
+        :param value: New value, of a JSON-compatible type."""
         if name not in self._engines:
             raise KeyError("No such engine: '%s'" % name)
 
         engine = self._engines[name]
-        engine.set_property(name, value)
+        engine.set_property(property_name, value)
         return
 
-    def start_engine(self, name):
+    def start_engine(self, name) -> bool:
+        """Start an engine.
+
+        :returns: False if it was already running."""
         if name not in self._engines:
             raise KeyError("No such engine: '%s'" % name)
 
-        self._engines[name].start()
-        return
+        engine = self._engines[name]
+        changed = not engine.is_running()
+        engine.start()
+        return changed
 
-    def stop_engine(self, name):
+    def stop_engine(self, name) -> bool:
+        """Stop an engine.
+
+        :returns: False if it was already stopped."""
         if name not in self._engines:
             raise KeyError("No such engine: '%s'" % name)
 
-        self._engines[name].stop()
-        return
+        engine = self._engines[name]
+        changed = engine.is_running()
+        engine.stop()
+        return changed
+
+    def get_book_snapshot(self, engine_name: str, symbol: str,
+                          max_levels: int = 0) -> dict:
+        """Return a snapshot of an engine's book for a symbol."""
+        engine = self._engines.get(engine_name)
+        if not engine:
+            raise KeyError("No such engine: '%s'" % engine_name)
+
+        return engine.get_book_snapshot(symbol, max_levels)
 
     def load_protocol(self, name, module_name, class_name):
         """Load a protocol plugin.
 
         :param name: String name for this protocol.
-        :param module_name: String name for the module file.
-        :param class_name: String name for the protocol class."""
+        :param module_name: Name of a module in the exsim package, or
+            a full dotted module name.
+        :param class_name: String name for the protocol class.
+
+        Protocols installed as plugins can be used by name without
+        loading them first."""
 
         if name in self._protocols:
-            return KeyError(f"Protocol '{name}' already loaded")
+            raise KeyError(f"Protocol '{name}' already loaded")
+
+        self._protocols[name] = registry.load_class(module_name,
+                                                    class_name,
+                                                    Protocol)
+        logger.info("Loaded protocol %s", name)
+        return
+
+    def unload_protocol(self, name):
+        """Unload a protocol plugin.
+
+        :param name: String name of protocol."""
+        if name not in self._protocols:
+            raise KeyError(f"Protocol '{name}' not loaded")
 
-        # FIXME: sanitise!
-        d = {}
-        exec(f"from exsim import {module_name}", globals(), d)
-        exec(f"protocol = {module_name}.{class_name}", globals(), d)
-        self._protocols[name] = d["protocol"]
-        logging.info(f"Loaded protocol {name}")
+        del self._protocols[name]
+        logger.info("Unloaded protocol %s", name)
         return
 
     def create_endpoint(self,
                         name: str,
                         port: int,
                         protocol_name: str,
-                        engine_name: str):
-        """Create a new Endpoint, listening for client connections."""
+                        engine_name: str,
+                        role: str = ORDER_ENTRY,
+                        queue_size: int = DEFAULT_QUEUE_SIZE,
+                        policy: str = DEFAULT_POLICY) -> int:
+        """Create a new Endpoint, listening for client connections.
+
+        See Endpoint for the role, queue size and policy.
+
+        :returns: Listening port number, useful if 'port' was zero."""
         if name in self._endpoints:
-            return KeyError(f"Endpoint '{name}' already exists")
+            raise KeyError(f"Endpoint '{name}' already exists")
 
-        protocol = self._protocols.get(protocol_name)
+        protocol = self._protocols.get(protocol_name) or \
+            registry.protocols.get(protocol_name)
         if not protocol:
-            return KeyError(f"Protocol '{protocol_name}' not found")
+            raise KeyError(f"Protocol '{protocol_name}' not found")
 
         engine = self._engines.get(engine_name)
         if not engine:
-            return KeyError(f"Engine '{engine_name}' not found")
+            raise KeyError(f"Engine '{engine_name}' not found")
 
-        endpoint = Endpoint(name, port, protocol, engine)
+        endpoint = Endpoint(name, port, protocol, engine,
+                            role, queue_size, policy)
         self._endpoints[name] = endpoint
-        self._endpoint_socks[endpoint.socket()] = endpoint
+        self._start_endpoint(endpoint)
+        return endpoint.socket().getsockname()[1]
+
+    def delete_endpoint(self, name: str):
+        """Close an Endpoint's listening socket, and discard it.
+
+        Sessions already accepted by the endpoint are not affected."""
+        endpoint = self._endpoints.pop(name, None)
+        if not endpoint:
+            raise KeyError("No such endpoint: '%s'" % name)
+
+        self._stop_endpoint(endpoint)
+        endpoint.close()
         return
 
-    def set_endpoint_property(self, name, value):
+    def set_endpoint_property(self, name, property_name, value):
+        """Configure an endpoint.
+
+        :param name: Endpoint name.
+        :param property_name: Name of a property of the endpoint.
+        :param value: New value, of a JSON-compatible type."""
         if name not in self._endpoints:
-            return KeyError("No such endpoint: '%s'" % name)
+            raise KeyError("No such endpoint: '%s'" % name)
 
         endpoint = self._endpoints[name]
-        endpoint.set_property(name, value)
+        endpoint.set_property(property_name, value)
+        return
+
+
+class Server(BaseServer):
+    """Simulator server, using a selectors-based event loop."""
+
+    def __init__(self, management: bool = True):
+        """Constructor.
+
+        :param management: If False, don't open a management socket."""
+        super().__init__(management)
+
+        self._session_socks: typing.Dict[socket, Session] = {}
+        self._manager_socks: typing.Dict[socket, Manager] = {}
+        self._endpoint_socks: typing.Dict[socket, Endpoint] = {}
+
+        self._timeouts = TimerQueue()
+
+        # Sessions with output to be written at the end of this pass
+        # through the event loop.
+        self._flush_sessions: typing.List[Session] = []
+
+        # Sessions to be closed at the end of this pass, rather than
+        # while the selector's other ready events are dispatched.
+        self._close_sessions: typing.List[Session] = []
+
+        # Handlers for sockets waiting to become writable.
+        self._writers: typing.Dict[socket, typing.Callable] = {}
+
+        # Sockets stay registered with the selector for their lifetime,
+        # with the handler to call when they become readable as the
+        # registration's data, so dispatch doesn't need to search for
+        # the owner of a ready socket.
+        self._selector = selectors.DefaultSelector()
+        if self._mgmt_sock is not None:
+            self._add_reader(self._mgmt_sock,
+                             functools.partial(self.create_manager,
+                                               self._mgmt_sock))
+
+        # Callbacks queued by other threads, and a socketpair used to
+        # wake the event loop to run them.
+        self._calls = collections.deque()
+        self._wakeup_sock, self._wakeup_peer = socket.socketpair()
+        self._wakeup_peer.setblocking(False)
+        self._add_reader(self._wakeup_sock, self._run_calls)
+        return
+
+    def call_soon_threadsafe(self, callback):
+        self._calls.append(callback)
+        try:
+            self._wakeup_peer.send(b"\0")
+        except BlockingIOError:
+            # Already plenty of wakeups pending.
+            pass
+        except OSError:
+            raise ConnectionError("Server is closed")
+        return
+
+    def _run_calls(self):
+        """(Internal) Run callbacks queued by other threads."""
+        self._wakeup_sock.recv(4096)
+        calls = self._calls
+        while calls:
+            calls.popleft()()
+        return
+
+    def create_manager(self, sock):
+        """Accept a connection to the management socket."""
+        mgmt_sock, mgmt_addr = sock.accept()
+        self.add_manager(mgmt_sock, mgmt_addr)
+        return
+
+    def add_manager(self, mgmt_sock, mgmt_addr):
+        """Attach an already-connected management socket.
+
+        :param mgmt_sock: Connected socket.
+        :param mgmt_addr: Peer address of socket."""
+        mgmt_sock.setblocking(False)
+        manager = Manager(mgmt_sock, mgmt_addr)
+        self._manager_socks[mgmt_sock] = manager
+        manager.set_server(self)
+        self._add_reader(mgmt_sock, manager.readable)
+
+        logger.info("New manager %d from %s", manager.socket().fileno(),
+                    mgmt_addr)
+        return
+
+    def manager_closed(self, manager):
+        if manager.socket() not in self._manager_socks:
+            return
+        self.unsubscribe(manager)
+        self._remove_reader(manager.socket())
+        self._writers.pop(manager.socket(), None)
+        del self._manager_socks[manager.socket()]
+        logger.info("Closed manager %d", manager.socket().fileno())
+        manager.close()
+        return
+
+    def create_session(self, sock):
+        """Accept a connection to an endpoint, and create a session."""
+
+        endpoint = self._endpoint_socks[sock]
+        session = endpoint.accept()
+        self._session_socks[session.socket()] = session
+        session.set_server(self)
+        self._add_reader(session.socket(), session.readable)
+        if self._journal is not None:
+            session.set_journal(self._journal)
+
+        logger.info("New session %d from %s", session.socket().fileno(),
+                    session.address())
+        self._session_event(session, "opened")
+        endpoint.session_opened(session)
+        session.engine().attach_session(session)
+        return
+
+    def session_closed(self, session):
+        if session.socket() not in self._session_socks:
+            return
+        self._remove_reader(session.socket())
+        self._writers.pop(session.socket(), None)
+        del self._session_socks[session.socket()]
+        logger.info("Closed %d", session.socket().fileno())
+        self._session_event(session, "closed")
+        session.endpoint().session_closed(session)
+        session.engine().detach_session(session)
+        session.close()
+        return
+
+    def close_later(self, session):
+        self._close_sessions.append(session)
+        return
+
+    def flush_later(self, session):
+        """Write a session's buffered output at the end of this pass.
+
+        :param session: Session with newly-buffered output."""
+        self._flush_sessions.append(session)
+        return
+
+    def watch_writable(self, session):
+        """Resume a session's output when its socket becomes writable.
+
+        :param session: Session (or Manager) with output the socket
+            didn't accept."""
+        sock = session.socket()
+        self._writers[sock] = session.writable
+        self._selector.modify(sock,
+                              selectors.EVENT_READ | selectors.EVENT_WRITE,
+                              session.readable)
+        return
+
+    def unwatch_writable(self, session):
+        """Stop watching for a session's socket to become writable.
+
+        :param session: Session (or Manager) whose output has been
+            written."""
+        sock = session.socket()
+        del self._writers[sock]
+        self._selector.modify(sock, selectors.EVENT_READ, session.readable)
+        return
+
+    def get_session_socks(self):
+        return [x.socket() for x in self._session_socks.values()]
+
+    def sessions(self) -> list:
+        return list(self._session_socks.values())
+
+    def get_endpoints(self):
+        return [e.socket() for e in self._endpoints.values()]
+
+    def get_manager_socks(self):
+        return [m.socket() for m in self._manager_socks.values()]
+
+    def _add_reader(self, sock, callback):
+        """(Internal) Watch a socket, calling 'callback' when readable.
+
+        :param sock: Socket to be watched.
+        :param callback: Callable, taking no parameters."""
+        self._selector.register(sock, selectors.EVENT_READ, callback)
+        return
+
+    def _remove_reader(self, sock):
+        """(Internal) Stop watching a socket.
+
+        :param sock: Socket previously passed to _add_reader()."""
+        self._selector.unregister(sock)
+        return
+
+    def run(self):
+        loop_time = self._loop_time
+        started = None
+        while self._is_running:
+            # Dispatches are timed only while a watchdog is running.
+            watchdog = self._watchdog
+            if watchdog is None:
+                self._timeouts.expire(time.time())
+            else:
+                self._timeouts.expire(time.time(), watchdog.call)
+
+            # Send everything queued by the previous batch of events,
+            # and by any timeouts.
+            self._flush()
+
+            # Time from select() returning events until their output
+            # is flushed.  Idle passes aren't counted.
+            if started is not None:
+                loop_time.observe(time.perf_counter() - started)
+
+            expiry = self._timeouts.next_expiry()
+            if expiry is not None:
+                wait = max(expiry - time.time(), 0)
+            else:
+                wait = 1.0
+
+            ready = self._selector.select(wait)
+            started = time.perf_counter() if ready else None
+            for key, events in ready:
+                if events & selectors.EVENT_READ:
+                    if watchdog is None:
+                        key.data()
+                    else:
+                        watchdog.call(key.data)
+
+                # Looked up after reading, in case that closed the session.
+                if events & selectors.EVENT_WRITE:
+                    writer = self._writers.get(key.fileobj)
+                    if writer:
+                        if watchdog is None:
+                            writer()
+                        else:
+                            watchdog.call(writer)
+
+        self._flush()
+        if self._journal is not None:
+            self.stop_journal()
+        if self._metrics_listener is not None:
+            self.stop_metrics()
+        if self._watchdog is not None:
+            self.stop_watchdog()
+        if self._profiler is not None:
+            self.stop_profile()
+        self.close()
+        return
+
+    def close(self):
+        """Close all the server's sockets.
+
+        Called when run() exits.  Client sessions, management
+        connections and endpoints are closed, along with the management
+        socket, and the event loop's own sockets and selector."""
+        for session in self.sessions():
+            self.session_closed(session)
+        for manager in list(self._manager_socks.values()):
+            self.manager_closed(manager)
+        for name in list(self._endpoints):
+            self.delete_endpoint(name)
+
+        if self._mgmt_sock is not None:
+            self._remove_reader(self._mgmt_sock)
+            self._mgmt_sock.close()
+            self._mgmt_sock = None
+
+        self._remove_reader(self._wakeup_sock)
+        self._wakeup_sock.close()
+        self._wakeup_peer.close()
+        self._selector.close()
+        return
+
+    def _flush(self):
+        """(Internal) Write output buffered during this pass, and close
+        sessions passed to close_later()."""
+        sessions = self._flush_sessions
+        while sessions:
+            self._flush_sessions = []
+            for session in sessions:
+                session.flush()
+            sessions = self._flush_sessions
+
+        sessions = self._close_sessions
+        if sessions:
+            self._close_sessions = []
+            for session in sessions:
+                self.session_closed(session)
+        return
+
+    def add_timeout(self, expiry_time: float, callback) -> Timeout:
+        """Schedule a callback.
+
+        :param expiry_time: Time (as for time.time()) to run the callback.
+        :param callback: Callable, taking no parameters.
+        :returns: Timeout handle, to be passed to delete_timeout()."""
+        return self._timeouts.add(expiry_time, callback)
+
+    def delete_timeout(self, timeout: Timeout):
+        """Cancel a scheduled callback.
+
+        :param timeout: Handle returned from add_timeout()."""
+        self._timeouts.cancel(timeout)
+        return
+
+    def _start_endpoint(self, endpoint: Endpoint):
+        """(Internal) Begin accepting connections for a new endpoint."""
+        self._endpoint_socks[endpoint.socket()] = endpoint
+        self._add_reader(endpoint.socket(),
+                         functools.partial(self.create_session,
+                                           endpoint.socket()))
+        return
+
+    def _stop_endpoint(self, endpoint: Endpoint):
+        """(Internal) Stop accepting connections for an endpoint."""
+        self._remove_reader(endpoint.socket())
+        del self._endpoint_socks[endpoint.socket()]
         return
@@ -20,6 +20,16 @@
 
 import logging
 import socket
+import typing
+
+from .journal import CLOSE, INBOUND, OUTBOUND
+
+
+logger = logging.getLogger("exsim.session")
+
+
+# Maximum number of buffers passed to a single sendmsg() call.
+_IOV_MAX = 1024
 
 
 class Session:
@@ -27,17 +37,62 @@ class Session:
     A Session represents an:
     - An active client connection, eg. a TCP session
     - A Protocol instance, and
+
+    Sent messages are buffered, and written to the socket together
+    once the Server has finished dispatching the current batch of
+    events.  Writes never block: anything the socket won't accept is
+    kept until it becomes writable again.
     """
 
+    # Close the session if its peer leaves more than this many bytes
+    # unread.
+    max_output_size = 64 * 1024 * 1024
+
+    # Maximum bytes read from the socket per readable event, so that a
+    # busy session can't starve the others.
+    read_budget = 256 * 1024
+
     def __init__(self, sock: socket.socket, addr, endpoint: 'Endpoint'):
         self._socket = sock
         self._address = addr
         self._endpoint = endpoint
+        self._server = None
+
+        # Buffered outbound data.
+        self._output: typing.List[bytes] = []
+        self._output_size = 0
+        self._flush_scheduled = False
+        self._write_blocked = False
+
+        # Journal recording this session's traffic, if any.
+        self._journal = None
+        self._journal_id = 0
+
+        # Traffic counters, for metrics: messages received are those
+        # delivered to the engine, and each send() is one message.
+        self.messages_in = 0
+        self.messages_out = 0
+        self.bytes_in = 0
+        self.bytes_out = 0
 
-        self._protocol = self._endpoint.protocol()
+        self._protocol = self._endpoint.protocol()(self)
         self._engine = self._endpoint.engine()
         return
 
+    def set_server(self, server):
+        """Set reference to the Server hosting this Session."""
+        self._server = server
+        return
+
+    def set_journal(self, journal):
+        """Record this session's traffic in a journal.
+
+        :param journal: Journal, or None to stop recording."""
+        self._journal = journal
+        if journal is not None:
+            self._journal_id = journal.open_session(self)
+        return
+
     def socket(self):
         """Return reference to the Session's socket."""
         return self._socket
@@ -46,6 +101,10 @@ class Session:
         """Return reference to the Session's address."""
         return self._address
 
+    def endpoint(self):
+        """Return reference to the Endpoint that accepted this Session."""
+        return self._endpoint
+
     def engine(self):
         """Return reference to Session's Engine."""
         return self._engine
@@ -56,21 +115,157 @@ class Session:
 
     def close(self):
         """Close this session."""
+        if self._journal is not None:
+            self._journal.record(CLOSE, self._journal_id, b"")
+            self._journal = None
         self._socket.close()
         self._address = None
+        self._output = []
+        self._output_size = 0
+        self._write_blocked = False
         return
 
     def readable(self):
-        data = self._socket.recv(8192)
-        if len(data) == 0:
-            self._gateway.session_closed(self)
-            return
+        """Read and process data from the session's socket.
+
+        Reads until the socket is drained or the read budget is used,
+        then passes everything received to the protocol at once, so
+        that all the complete messages are delivered as a batch."""
+        chunks = []
+        total = 0
+        closed = False
+        while total < self.read_budget:
+            size = min(65536, self.read_budget - total)
+            try:
+                data = self._socket.recv(size)
+            except (BlockingIOError, InterruptedError):
+                break
+            except ConnectionError:
+                closed = True
+                break
+
+            if len(data) == 0:
+                closed = True
+                break
+
+            chunks.append(data)
+            total += len(data)
+            if len(data) < size:
+                break
 
-        message = self._protocol.receive(data)
-        if message:
-            self._engine.deliver(message)
+        if chunks:
+            self.received(chunks[0] if len(chunks) == 1 else b"".join(chunks))
+
+        if closed:
+            self._server.session_closed(self)
+        return
+
+    def received(self, data: bytes):
+        """Process data received from the session's peer."""
+        if self._journal is not None:
+            self._journal.record(INBOUND, self._journal_id, data)
+        self.bytes_in += len(data)
+        messages = self._protocol.receive(data)
+        if messages:
+            self.messages_in += len(messages)
+            self._engine.deliver_batch(messages)
         return
 
+    def output_size(self) -> int:
+        """Return the number of bytes queued, but not yet sent."""
+        return self._output_size
+
+    def get_metrics(self) -> dict:
+        """Return this session's metrics, as JSON-compatible values."""
+        return {"endpoint": self._endpoint.name(),
+                "address": str(self._address),
+                "messages_in": self.messages_in,
+                "messages_out": self.messages_out,
+                "bytes_in": self.bytes_in,
+                "bytes_out": self.bytes_out,
+                "parse_errors": self._protocol.parse_errors(),
+                "output_bytes": self.output_size()}
+
     def send(self, data: bytes):
-        """Send the supplied data to the session's peer."""
-        return self._socket.sendall(data)
+        """Queue the supplied data to be sent to the session's peer."""
+        if self._journal is not None:
+            self._journal.record(OUTBOUND, self._journal_id, data)
+        self.messages_out += 1
+        self.bytes_out += len(data)
+        self._output.append(data)
+        self._output_size += len(data)
+
+        if self._server is None:
+            self.flush()
+        elif self._write_blocked:
+            # No flush until the socket is writable, so check the limit
+            # here, or a peer that never reads grows the output forever.
+            if self._output_size > self.max_output_size:
+                self._close_slow()
+        elif not self._flush_scheduled:
+            self._flush_scheduled = True
+            self._server.flush_later(self)
+        return
+
+    def _close_slow(self):
+        """(Internal) Close a session whose peer isn't reading.
+
+        This can be called while handling another session's events, so
+        the session is closed at the end of the server's pass, and its
+        output is discarded meanwhile."""
+        logger.warning("Closing slow session from %s: %d bytes unsent",
+                       self._address, self._output_size)
+        self._output = []
+        self._output_size = 0
+        self._server.close_later(self)
+        return
+
+    def flush(self):
+        """Write as much buffered data as the socket will accept."""
+        self._flush_scheduled = False
+        output = self._output
+        while output:
+            try:
+                sent = self._socket.sendmsg(output[:_IOV_MAX])
+            except (BlockingIOError, InterruptedError):
+                break
+            except OSError as e:
+                logger.warning("Send failed on session from %s: %s",
+                               self._address, e)
+                self._output = []
+                self._output_size = 0
+                if self._server is not None:
+                    self._server.session_closed(self)
+                return
+
+            self._output_size -= sent
+            count = 0
+            for data in output:
+                if sent < len(data):
+                    break
+                sent -= len(data)
+                count += 1
+            del output[:count]
+            if sent:
+                output[0] = output[0][sent:]
+                break
+
+        if self._server is None:
+            return
+
+        if self._output_size > self.max_output_size:
+            self._close_slow()
+
+        elif output and not self._write_blocked:
+            self._write_blocked = True
+            self._server.watch_writable(self)
+
+        elif not output and self._write_blocked:
+            self._write_blocked = False
+            self._server.unwatch_writable(self)
+        return
+
+    def writable(self):
+        """Resume sending, after the socket becomes writable."""
+        self.flush()
+        return
@@ -0,0 +1,451 @@
+# -*- coding: utf-8 -*-
+########################################################################
+# exsim - Exchange Simulator
+# Copyright (C) 2016-2023, zeroXone.
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see http://www.gnu.org/licenses/
+#
+########################################################################
+
+# A sharded server runs its engines in a set of worker processes, so
+# that matching for independent engines can use more than one core.
+#
+# The supervisor process is a normal Server, accepting management
+# connections, but it hosts no engines of its own.  Each worker is a
+# Server whose only management connection is one end of a socketpair
+# shared with the supervisor.  Engine and endpoint requests are
+# forwarded to the worker that owns the engine; plugin loads are sent
+# to every worker.
+#
+# An endpoint is always created in the same worker as its engine, so
+# client sessions connect directly to the process doing their matching,
+# and order flow never passes through the supervisor.
+#
+# Event subscriptions are passed on to every worker, and the events
+# they send back over the socketpair are republished by the supervisor
+# to its own subscribers.
+
+import functools
+import logging
+import os
+import socket
+import typing
+
+from . import api, log
+from .bus import DEFAULT_POLICY, DEFAULT_QUEUE_SIZE
+from .endpoint import ORDER_ENTRY
+from .profiling import DEFAULT_SAMPLE_INTERVAL, DEFAULT_STALL_THRESHOLD
+from .server import Server
+
+
+logger = logging.getLogger("exsim.server")
+
+
+class Shard:
+    """Supervisor's handle for a worker process."""
+
+    def __init__(self, index: int, sock: socket.socket, pid: int):
+        """Constructor.
+
+        :param index: Sequence number of this worker.
+        :param sock: Supervisor's end of management socketpair.
+        :param pid: Process identifier of worker."""
+        self._index = index
+        self._socket = sock
+        self._proxy = api.Server(None, f"shard{index}", sock, pid)
+
+        # Names of engines owned by this worker.
+        self.engines: typing.Set[str] = set()
+        return
+
+    def index(self) -> int:
+        """Return sequence number of this worker."""
+        return self._index
+
+    def socket(self):
+        """Return supervisor's end of management socketpair."""
+        return self._socket
+
+    def call(self, request: dict) -> dict:
+        """Make a management request to the worker.
+
+        :param request: Request dictionary.
+        :returns: Reply dictionary.
+
+        Raises an exception if the request fails."""
+        reply = {}
+        if not self._proxy._send(request, reply):
+            raise ConnectionError(f"Lost connection to shard {self._index}")
+
+        if not reply["result"]:
+            raise Exception(reply["message"])
+        return reply
+
+    def set_event_handler(self, handler: typing.Callable):
+        """Set a function to be called with each event from the worker.
+
+        :param handler: Callable, taking the event message."""
+        self._proxy.set_event_handler(handler)
+        return
+
+    def receive_events(self) -> bool:
+        """Handle events already sent by the worker, without waiting.
+
+        :returns: False if the connection to the worker was lost."""
+        return self._proxy.poll()
+
+    def close(self):
+        """Stop the worker process.
+
+        A worker that exited with a failure status, or was killed, is
+        logged as an error."""
+        status = self._proxy.delete()
+        self._socket.close()
+
+        if os.WIFSIGNALED(status):
+            logger.error("Shard %d killed by signal %d",
+                         self._index, os.WTERMSIG(status))
+        elif os.WIFEXITED(status) and os.WEXITSTATUS(status) != 0:
+            logger.error("Shard %d failed, exit status %d",
+                         self._index, os.WEXITSTATUS(status))
+        return
+
+
+def _run_shard(sock: socket.socket):
+    """(Internal) Worker process main function.
+
+    :param sock: Worker's end of management socketpair.
+
+    Exits with status 1 if the server fails, so the supervisor can tell
+    a crashed worker from one that was stopped."""
+    status = 0
+    try:
+        server = Server(management=False)
+        server.add_manager(sock, "supervisor")
+        server.run()
+    except KeyboardInterrupt:
+        pass
+    except BaseException:
+        logger.exception("Shard failed")
+        status = 1
+    finally:
+        log.stop()
+        os._exit(status)
+
+
+class ShardedServer(Server):
+    """Simulator server, distributing engines across worker processes."""
+
+    def __init__(self, shards: int = 0):
+        """Constructor.
+
+        :param shards: Number of worker processes, or zero for one per CPU.
+
+        The workers are forked before the supervisor opens its own
+        sockets, so they don't inherit them."""
+
+        self._shards: typing.List[Shard] = []
+        self._engine_shards: typing.Dict[str, Shard] = {}
+        self._endpoint_shards: typing.Dict[str, Shard] = {}
+
+        # Event topics already subscribed to in the workers.
+        self._shard_topics: typing.Set[str] = set()
+
+        for index in range(shards or os.cpu_count() or 1):
+            self._shards.append(self._spawn_shard(index))
+
+        super().__init__()
+
+        for shard in self._shards:
+            shard.set_event_handler(self._shard_event)
+            self._add_reader(shard.socket(),
+                             functools.partial(self._shard_readable, shard))
+        return
+
+    def _spawn_shard(self, index: int) -> Shard:
+        """(Internal) Fork a worker process."""
+        supervisor_sock, worker_sock = socket.socketpair()
+
+        pid = os.fork()
+        if pid == 0:
+            supervisor_sock.close()
+            for shard in self._shards:
+                shard.socket().close()
+            _run_shard(worker_sock)
+
+        worker_sock.close()
+        logger.info("Started shard %d, pid %d", index, pid)
+        return Shard(index, supervisor_sock, pid)
+
+    def get_shard_count(self) -> int:
+        """Return number of worker processes."""
+        return len(self._shards)
+
+    def run(self):
+        try:
+            super().run()
+        finally:
+            self.stop_shards()
+        return
+
+    def close(self):
+        """Close all the server's sockets.
+
+        Workers' sockets are no longer watched, but are left open for
+        stop_shards()."""
+        registered = self._selector.get_map()
+        for shard in self._shards:
+            if shard.socket() in registered:
+                self._remove_reader(shard.socket())
+        super().close()
+        return
+
+    def stop_shards(self):
+        """Stop all worker processes."""
+        for shard in self._shards:
+            shard.close()
+        self._shards = []
+        self._engine_shards = {}
+        self._endpoint_shards = {}
+        self._shard_topics = set()
+        return
+
+    def _shard_readable(self, shard: Shard):
+        """(Internal) Handle events sent by a worker."""
+        if not shard.receive_events():
+            logger.error("Lost connection to shard %d", shard.index())
+            self._remove_reader(shard.socket())
+        return
+
+    def _shard_event(self, message: dict):
+        """(Internal) Republish an event sent by a worker."""
+        self.publish(message["event"], message["data"])
+        return
+
+    def subscribe(self, manager, topics: typing.List[str]):
+        """Send events for the listed topics to a management client.
+
+        Workers are subscribed to each topic the first time a client
+        asks for it, and stay subscribed."""
+        super().subscribe(manager, topics)
+
+        new_topics = [t for t in topics if t not in self._shard_topics]
+        if new_topics:
+            self._broadcast({"type": "subscribe", "topics": new_topics})
+            self._shard_topics.update(new_topics)
+        return
+
+    def _broadcast(self, request: dict):
+        """(Internal) Send a request to all workers."""
+        for shard in self._shards:
+            shard.call(request)
+        return
+
+    def _get_engine_shard(self, name: str) -> Shard:
+        """(Internal) Return worker owning the named engine."""
+        shard = self._engine_shards.get(name)
+        if not shard:
+            raise KeyError("No such engine: '%s'" % name)
+        return shard
+
+    def load_engine(self, name, module_name, class_name):
+        self._broadcast({"type": "load_engine",
+                         "name": name,
+                         "module": module_name,
+                         "class": class_name})
+        logger.info("Loaded engine type '%s' in all shards", name)
+        return
+
+    def unload_engine(self, name):
+        self._broadcast({"type": "unload_engine", "name": name})
+        return
+
+    def create_engine(self, name: str, engine_type: str):
+        if name in self._engine_shards:
+            raise KeyError(f"Engine '{name}' already exists")
+
+        shard = min(self._shards, key=lambda s: len(s.engines))
+        shard.call({"type": "create_engine",
+                    "name": name,
+                    "engine_type": engine_type})
+        shard.engines.add(name)
+        self._engine_shards[name] = shard
+        return
+
+    def delete_engine(self, name):
+        shard = self._get_engine_shard(name)
+        shard.call({"type": "delete_engine", "name": name})
+        shard.engines.remove(name)
+        del self._engine_shards[name]
+        return
+
+    def start_engine(self, name) -> bool:
+        shard = self._get_engine_shard(name)
+        return shard.call({"type": "start_engine", "name": name})["changed"]
+
+    def stop_engine(self, name) -> bool:
+        shard = self._get_engine_shard(name)
+        return shard.call({"type": "stop_engine", "name": name})["changed"]
+
+    def set_engine_property(self, name: str, property_name: str, value):
+        shard = self._get_engine_shard(name)
+        shard.call({"type": "set_engine_property",
+                    "name": name,
+                    "property": property_name,
+                    "value": value})
+        return
+
+    def get_book_snapshot(self, engine_name: str, symbol: str,
+                          max_levels: int = 0) -> dict:
+        shard = self._get_engine_shard(engine_name)
+        return shard.call({"type": "get_book",
+                           "engine": engine_name,
+                           "symbol": symbol,
+                           "max_levels": max_levels})["book"]
+
+    def load_protocol(self, name, module_name, class_name):
+        self._broadcast({"type": "load_protocol",
+                         "name": name,
+                         "module": module_name,
+                         "class": class_name})
+        logger.info("Loaded protocol %s in all shards", name)
+        return
+
+    def unload_protocol(self, name):
+        self._broadcast({"type": "unload_protocol", "name": name})
+        return
+
+    def create_endpoint(self,
+                        name: str,
+                        port: int,
+                        protocol_name: str,
+                        engine_name: str,
+                        role: str = ORDER_ENTRY,
+                        queue_size: int = DEFAULT_QUEUE_SIZE,
+                        policy: str = DEFAULT_POLICY) -> int:
+        """Create a new Endpoint, in the worker hosting its engine."""
+        if name in self._endpoint_shards:
+            raise KeyError(f"Endpoint '{name}' already exists")
+
+        shard = self._get_engine_shard(engine_name)
+        reply = shard.call({"type": "create_endpoint",
+                            "name": name,
+                            "port": port,
+                            "protocol": protocol_name,
+                            "engine": engine_name,
+                            "role": role,
+                            "queue_size": queue_size,
+                            "policy": policy})
+        self._endpoint_shards[name] = shard
+        return reply["port"]
+
+    def start_journal(self, path: str):
+        """Record client session traffic.
+
+        Each worker writes its own journal, named with the worker's
+        index as a suffix."""
+        for shard in self._shards:
+            shard.call({"type": "start_journal",
+                        "path": f"{path}.{shard.index()}"})
+        return
+
+    def stop_journal(self):
+        self._broadcast({"type": "stop_journal"})
+        return
+
+    def get_metrics(self) -> dict:
+        """Return the metrics of the supervisor and all workers.
+
+        Engines, endpoints and sessions from every worker are listed
+        together, and each worker's event loop metrics are under
+        "shards", by index."""
+        metrics = super().get_metrics()
+        metrics["shards"] = {}
+        for shard in self._shards:
+            shard_metrics = shard.call({"type": "get_metrics"})["metrics"]
+            metrics["engines"].update(shard_metrics["engines"])
+            metrics["endpoints"].update(shard_metrics["endpoints"])
+            metrics["sessions"].extend(shard_metrics["sessions"])
+            metrics["shards"][str(shard.index())] = shard_metrics["server"]
+        return metrics
+
+    def set_log_level(self, subsystem: str, level: str):
+        """Set a logging subsystem's level, here and in all workers."""
+        super().set_log_level(subsystem, level)
+        self._broadcast({"type": "set_log_level",
+                         "subsystem": subsystem,
+                         "level": level})
+        return
+
+    def start_watchdog(self, threshold: float = DEFAULT_STALL_THRESHOLD):
+        """Record stalls, here and in all workers."""
+        super().start_watchdog(threshold)
+        self._broadcast({"type": "start_watchdog", "threshold": threshold})
+        return
+
+    def get_stalls(self) -> dict:
+        """Return the stalls of the supervisor and all workers.
+
+        Each worker's stalls are under "shards", by index."""
+        return self._collect(super().get_stalls(), "get_stalls", "stalls")
+
+    def stop_watchdog(self) -> dict:
+        """Stop recording stalls, here and in all workers."""
+        return self._collect(super().stop_watchdog(), "stop_watchdog",
+                             "stalls")
+
+    def start_profile(self, mode: str = "cprofile",
+                      interval: float = DEFAULT_SAMPLE_INTERVAL):
+        """Start profiling, here and in all workers."""
+        super().start_profile(mode, interval)
+        self._broadcast({"type": "start_profile",
+                         "mode": mode,
+                         "interval": interval})
+        return
+
+    def stop_profile(self) -> dict:
+        """Stop profiling, here and in all workers.
+
+        Each worker's profile is under "shards", by index."""
+        return self._collect(super().stop_profile(), "stop_profile",
+                             "profile")
+
+    def _collect(self, report: dict, request_type: str, key: str) -> dict:
+        """(Internal) Add each worker's reply to a supervisor's report."""
+        report["shards"] = {}
+        for shard in self._shards:
+            reply = shard.call({"type": request_type})
+            report["shards"][str(shard.index())] = reply[key]
+        return report
+
+    def delete_endpoint(self, name: str):
+        shard = self._get_endpoint_shard(name)
+        shard.call({"type": "delete_endpoint", "name": name})
+        del self._endpoint_shards[name]
+        return
+
+    def set_endpoint_property(self, name: str, property_name: str, value):
+        shard = self._get_endpoint_shard(name)
+        shard.call({"type": "set_endpoint_property",
+                    "name": name,
+                    "property": property_name,
+                    "value": value})
+        return
+
+    def _get_endpoint_shard(self, name: str) -> Shard:
+        """(Internal) Return worker owning the named endpoint."""
+        shard = self._endpoint_shards.get(name)
+        if not shard:
+            raise KeyError("No such endpoint: '%s'" % name)
+        return shard
@@ -18,6 +18,35 @@
 #
 ########################################################################
 
+import heapq
+import typing
+
+from .order import NO_ORDER, OrderStore
+
+
+class Level:
+    """Orders resting at a single price, in time priority.
+
+    The orders form a doubly-linked queue, using the prev/next links
+    in the OrderStore, so any order can be removed in O(1)."""
+
+    __slots__ = ("price", "head", "tail", "count", "quantity")
+
+    def __init__(self, price):
+        """Constructor.
+
+        :param price: Price of this level."""
+        self.price = price
+
+        # Handles of first and last orders in the queue.
+        self.head = NO_ORDER
+        self.tail = NO_ORDER
+
+        # Number of orders, and their total remaining quantity.
+        self.count = 0
+        self.quantity = 0
+        return
+
 
 class Side:
     """A single-side of a book for a market for a tradable thing."""
@@ -25,20 +54,186 @@ class Side:
     BUY = 1
     SELL = 2
 
-    def __init__(self):
+    def __init__(self, side=None, store: OrderStore = None):
+        """Constructor.
+
+        :param side: BUY or SELL.
+        :param store: OrderStore holding this side's orders."""
         self.symbol = ''
-        self.side = None
-        self.orders = []
+        self.side = side
+        self.store = store if store is not None else OrderStore()
+
+        # Price levels, keyed by price.
+        self.levels: typing.Dict[typing.Any, Level] = {}
+
+        # Heap of prices with levels, keyed so that the best price is at
+        # the top: bids are stored negated.  Prices whose level has
+        # emptied are left in the heap, and discarded lazily.
+        self._prices = []
+        self._heaped = set()
+
+        # Prices of levels changed since they were last collected, for
+        # market data, or None if changes aren't being tracked.
+        self.dirty: typing.Optional[set] = None
+        return
+
+    def __len__(self):
+        """Return the number of price levels on this side."""
+        return len(self.levels)
+
+    def _key(self, price):
+        """(Internal) Return heap key for price."""
+        return -price if self.side == Side.BUY else price
+
+    def best_level(self) -> typing.Optional[Level]:
+        """Return the best-priced level, or None if the side is empty."""
+        prices = self._prices
+        while prices:
+            key = prices[0]
+            level = self.levels.get(-key if self.side == Side.BUY else key)
+            if level is not None:
+                return level
+
+            heapq.heappop(prices)
+            self._heaped.discard(key)
+        return None
+
+    def best_price(self):
+        """Return the best price, or None if the side is empty."""
+        level = self.best_level()
+        return level.price if level is not None else None
+
+    def is_marketable(self, price) -> bool:
+        """Return True if 'price' is at or better than this side's best.
+
+        :param price: Limit price of an order on the opposite side, or
+                      None for a market order."""
+        best = self.best_price()
+        if best is None:
+            return False
+        if price is None:
+            return True
+        if self.side == Side.BUY:
+            return price <= best
+        return price >= best
+
+    def get_orders(self, level: Level) -> typing.Iterator[int]:
+        """Yield the handles of a level's orders, in priority order."""
+        handle = level.head
+        while handle != NO_ORDER:
+            yield handle
+            handle = self.store.next[handle]
         return
 
-    def add_order(self, order):
+    def add_order(self, handle: int):
+        """Add an order at the back of the queue for its price."""
+        store = self.store
+        price = store.price[handle]
+        level = self.levels.get(price)
+        if level is None:
+            level = Level(price)
+            self.levels[price] = level
+
+            key = self._key(price)
+            if key not in self._heaped:
+                heapq.heappush(self._prices, key)
+                self._heaped.add(key)
+                self._compact()
+
+        tail = level.tail
+        store.prev[handle] = tail
+        store.next[handle] = NO_ORDER
+        if tail == NO_ORDER:
+            level.head = handle
+        else:
+            store.next[tail] = handle
+        level.tail = handle
+        store.resting[handle] = 1
+
+        level.count += 1
+        level.quantity += store.remaining_quantity[handle]
+        if self.dirty is not None:
+            self.dirty.add(price)
         return
 
-    def modify_order(self, order):
+    def modify_order(self, handle: int, quantity):
+        """Reduce an order's remaining quantity, keeping its priority.
+
+        :param handle: Resting order.
+        :param quantity: New remaining quantity, no greater than current."""
+        store = self.store
+        price = store.price[handle]
+        level = self.levels[price]
+        level.quantity -= store.remaining_quantity[handle] - quantity
+        store.remaining_quantity[handle] = quantity
+        if self.dirty is not None:
+            self.dirty.add(price)
         return
 
-    def cancel_order(self, order):
+    def cancel_order(self, handle: int):
+        """Remove an order from this side."""
+        store = self.store
+        price = store.price[handle]
+        level = self.levels[price]
+
+        prev = store.prev[handle]
+        next = store.next[handle]
+        if prev == NO_ORDER:
+            level.head = next
+        else:
+            store.next[prev] = next
+        if next == NO_ORDER:
+            level.tail = prev
+        else:
+            store.prev[next] = prev
+        store.prev[handle] = NO_ORDER
+        store.next[handle] = NO_ORDER
+        store.resting[handle] = 0
+
+        level.count -= 1
+        level.quantity -= store.remaining_quantity[handle]
+        if level.count == 0:
+            del self.levels[price]
+        if self.dirty is not None:
+            self.dirty.add(price)
         return
 
-    def cancel_all_orders(self):
+    def depth(self, max_levels: int = 0) -> typing.List[typing.Tuple]:
+        """Return the side's aggregated price levels, best first.
+
+        :param max_levels: Maximum number of levels, or zero for all.
+        :returns: List of (price, quantity, order count) tuples."""
+        levels = sorted(self.levels.values(),
+                        key=lambda level: self._key(level.price))
+        if max_levels:
+            levels = levels[:max_levels]
+        return [(level.price, level.quantity, level.count)
+                for level in levels]
+
+    def cancel_all_orders(self) -> typing.List[int]:
+        """Remove all orders from this side.
+
+        :returns: List of handles of removed orders, which are not
+                  released."""
+        handles = []
+        for level in self.levels.values():
+            handles.extend(self.get_orders(level))
+        for handle in handles:
+            self.store.resting[handle] = 0
+        if self.dirty is not None:
+            self.dirty.update(self.levels)
+
+        self.levels = {}
+        self._prices = []
+        self._heaped = set()
+        return handles
+
+    def _compact(self):
+        """(Internal) Rebuild the price heap if mostly stale."""
+        if len(self._prices) <= 2 * len(self.levels) + 64:
+            return
+
+        self._prices = [self._key(p) for p in self.levels]
+        heapq.heapify(self._prices)
+        self._heaped = set(self._prices)
         return
@@ -0,0 +1,158 @@
+# -*- coding: utf-8 -*-
+########################################################################
+# exsim - Exchange Simulator
+# Copyright (C) 2016-2023, zeroXone.
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see http://www.gnu.org/licenses/
+#
+########################################################################
+
+import heapq
+import itertools
+import typing
+
+
+class Timeout:
+    """Handle for a scheduled callback.
+
+    Returned by TimerQueue.add(), and used to cancel the callback."""
+
+    __slots__ = ("expiry", "callback", "cancelled", "_queue")
+
+    def __init__(self, queue: "TimerQueue", expiry: float,
+                 callback: typing.Callable):
+        """Constructor.
+
+        :param queue: TimerQueue holding this timeout.
+        :param expiry: Time at which the callback should run.
+        :param callback: Callable, taking no parameters."""
+        self.expiry = expiry
+        self.callback = callback
+        self.cancelled = False
+        self._queue = queue
+        return
+
+    def cancel(self):
+        """Prevent this timeout's callback from running."""
+        if self._queue is not None:
+            self._queue.cancel(self)
+        else:
+            self.cancelled = True
+        return
+
+
+class TimerQueue:
+    """A collection of timeouts, ordered by expiry time.
+
+    Timeouts are kept in a binary heap, so adding one is O(log n).
+    Cancelling just marks the handle: cancelled entries are discarded
+    when they reach the top of the heap, or when they make up more than
+    half of it."""
+
+    def __init__(self):
+        """Constructor."""
+
+        # Heap of (expiry, sequence, timeout) tuples.  The sequence
+        # number keeps equal expiry times in insertion order, and means
+        # the Timeout instances are never compared.
+        self._heap: typing.List = []
+        self._sequence = itertools.count()
+        self._cancelled = 0
+        return
+
+    def __len__(self):
+        """Return the number of pending (uncancelled) timeouts."""
+        return len(self._heap) - self._cancelled
+
+    def add(self, expiry: float, callback: typing.Callable) -> Timeout:
+        """Schedule a callback.
+
+        :param expiry: Time at which the callback should run.
+        :param callback: Callable, taking no parameters.
+        :returns: Timeout handle, which can be used to cancel it."""
+        timeout = Timeout(self, expiry, callback)
+        heapq.heappush(self._heap, (expiry, next(self._sequence), timeout))
+        return timeout
+
+    def cancel(self, timeout: Timeout):
+        """Cancel a scheduled callback.
+
+        :param timeout: Handle returned from add()."""
+        if timeout.cancelled:
+            return
+
+        timeout.cancelled = True
+        if timeout._queue is not self:
+            # Already removed from the heap, and about to run.
+            return
+
+        timeout._queue = None
+        self._cancelled += 1
+
+        # Rebuild the heap if it's mostly dead entries.
+        if self._cancelled > len(self._heap) // 2:
+            self._heap = [t for t in self._heap if not t[2].cancelled]
+            heapq.heapify(self._heap)
+            self._cancelled = 0
+        return
+
+    def next_expiry(self) -> typing.Optional[float]:
+        """Return the expiry time of the next timeout, or None if empty."""
+        self._discard_cancelled()
+        if not self._heap:
+            return None
+        return self._heap[0][0]
+
+    def expire(self, now: float,
+               call: typing.Optional[typing.Callable] = None) -> int:
+        """Run the callbacks for all timeouts due at or before 'now'.
+
+        :param now: Current time.
+        :param call: If set, callable used to run each callback, passed
+            the callback as its only parameter.
+        :returns: Count of callbacks run.
+
+        Expired entries are collected before running any callbacks, so
+        a callback that schedules a new (already due) timeout doesn't
+        get run again in the same pass."""
+        due = []
+        heap = self._heap
+        while heap and heap[0][0] <= now:
+            _, _, timeout = heapq.heappop(heap)
+            if timeout.cancelled:
+                self._cancelled -= 1
+                continue
+            timeout._queue = None
+            due.append(timeout)
+
+        count = 0
+        for timeout in due:
+            # An earlier callback in this batch might have cancelled it.
+            if timeout.cancelled:
+                continue
+            timeout.cancelled = True
+            if call is None:
+                timeout.callback()
+            else:
+                call(timeout.callback)
+            count += 1
+        return count
+
+    def _discard_cancelled(self):
+        """(Internal) Pop cancelled entries from the top of the heap."""
+        heap = self._heap
+        while heap and heap[0][2].cancelled:
+            heapq.heappop(heap)
+            self._cancelled -= 1
+        return
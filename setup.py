@@ -34,6 +34,14 @@ setup(name="python-exsim",
       author_email="support@zeroxone.com",
       license="GPLv3",
       packages=["exsim"],
+      entry_points={
+          "exsim.engines": [
+              "default = exsim.default_engine:DefaultEngine",
+          ],
+          "exsim.protocols": [
+              "fix42 = exsim.fix_protocol:FixProtocol",
+          ],
+      },
       classifiers=[
         'Development Status :: 3 - Alpha',
         'Topic :: Software Development :: Libraries :: Python Modules',
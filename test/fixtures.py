@@ -0,0 +1,179 @@
+# -*- coding: utf-8 -*-
+########################################################################
+# exsim - Exchange Simulator
+# Copyright (C) 2022-2023, zeroXone.
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see http://www.gnu.org/licenses/
+#
+########################################################################
+
+# Message builders and fakes shared by the tests.
+
+import simplefix
+
+from exsim.bus import DEFAULT_POLICY, DEFAULT_QUEUE_SIZE
+from exsim.endpoint import ORDER_ENTRY
+from exsim.message import LIMIT_ORDER, NewOrderMessage
+from exsim.protocol import Protocol
+
+
+def new_order(client_order_id, price=b"10.5", side=1):
+    """Return an encoded FIX NewOrderSingle."""
+    msg = simplefix.FixMessage()
+    msg.append_pair(8, "FIX.4.2")
+    msg.append_pair(35, "D")
+    msg.append_pair(49, "CLIENT")
+    msg.append_pair(56, "EXSIM")
+    msg.append_pair(11, client_order_id)
+    msg.append_pair(55, "ABC")
+    msg.append_pair(54, side)
+    msg.append_pair(38, 100)
+    msg.append_pair(44, price)
+    return msg.encode()
+
+
+def order(session, client_order_id, side, quantity, price):
+    """Return a limit order message, as decoded for the engine."""
+    message = NewOrderMessage()
+    message.session = session
+    message.client_order_id = client_order_id
+    message.symbol = "ABC"
+    message.side = side
+    message.order_type = LIMIT_ORDER
+    message.quantity = quantity
+    message.price = price
+    return message
+
+
+class FakeEngine:
+    """Engine that records the batches of messages delivered to it."""
+
+    def __init__(self):
+        self.batches = []
+
+    def deliver_batch(self, messages):
+        self.batches.append(messages)
+
+
+class FakeEndpoint:
+    def __init__(self, protocol=Protocol, engine=None, role=ORDER_ENTRY,
+                 queue_size=DEFAULT_QUEUE_SIZE, policy=DEFAULT_POLICY):
+        self._protocol = protocol
+        self._engine = engine if engine is not None else FakeEngine()
+        self._role = role
+        self._queue_size = queue_size
+        self._policy = policy
+
+    def protocol(self):
+        return self._protocol
+
+    def engine(self):
+        return self._engine
+
+    def name(self):
+        return self._role
+
+    def role(self):
+        return self._role
+
+    def queue_size(self):
+        return self._queue_size
+
+    def policy(self):
+        return self._policy
+
+
+class FakeSession:
+    """Session that records what is sent to it, and is its own protocol.
+
+    Its endpoint is a FakeEndpoint with the given role and options, and
+    its output_size() is whatever the test sets as its backlog."""
+
+    def __init__(self, protocol=None, role=ORDER_ENTRY, **options):
+        self.messages = []
+        self.sent = []
+        self.backlog = 0
+        self._endpoint = FakeEndpoint(role=role, **options)
+        self._protocol = protocol(self) if protocol else self
+
+    def endpoint(self):
+        return self._endpoint
+
+    def protocol(self):
+        return self._protocol
+
+    def output_size(self):
+        return self.backlog
+
+    def send(self, data):
+        # Called with dictionaries as the protocol, or with bytes
+        # as the session of a real protocol.
+        if isinstance(data, dict):
+            self.messages.append(data)
+        else:
+            self.sent.append(data)
+
+    def close(self):
+        pass
+
+
+class FakeServer:
+    """Server that records the calls made to it.
+
+    Closed sessions are detached from the engine, if one is given."""
+
+    def __init__(self, engine=None):
+        self.engine = engine
+        self.flushes = []
+        self.watching = False
+        self.closing = []
+        self.closed = []
+        self.started = []
+        self.timeouts = []
+        self.expiry_times = []
+
+    def add_timeout(self, expiry_time, callback):
+        self.timeouts.append(callback)
+        self.expiry_times.append(expiry_time)
+        return callback
+
+    def delete_timeout(self, timeout):
+        self.timeouts.remove(timeout)
+
+    def has_subscribers(self, topic):
+        return False
+
+    def publish(self, topic, event):
+        pass
+
+    def start_engine(self, name):
+        self.started.append(name)
+
+    def flush_later(self, session):
+        self.flushes.append(session)
+
+    def watch_writable(self, session):
+        self.watching = True
+
+    def unwatch_writable(self, session):
+        self.watching = False
+
+    def close_later(self, session):
+        self.closing.append(session)
+
+    def session_closed(self, session):
+        self.closed.append(session)
+        if self.engine is not None:
+            self.engine.detach_session(session)
+        session.close()
@@ -18,11 +18,35 @@
 #
 ########################################################################
 
+import gc
+import os
+import socket
+import subprocess
+import sys
+import time
+import warnings
+
 import pytest
 
 import exsim
 import exsim.api
 
+from fixtures import new_order
+
+
+def test_api_import(tmp_path):
+    # Importing the client API mustn't import the server, or asyncio,
+    # or create a log file.
+    code = ("import sys, exsim.api; "
+            "assert 'exsim.server' not in sys.modules; "
+            "assert 'asyncio' not in sys.modules; "
+            "assert exsim.api.AsyncAPI and exsim.Server")
+    root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    env = dict(os.environ, PYTHONPATH=root)
+    subprocess.run([sys.executable, "-c", code], cwd=tmp_path, env=env,
+                   check=True)
+    assert os.listdir(tmp_path) == []
+
 
 def test_api_construct_destruct():
     api = exsim.api.API()
@@ -33,3 +57,100 @@ def test_api_server():
     api = exsim.api.API()
     api.create_server('s1')
     api.delete_server('s1')
+
+
+def test_api_pool():
+    api = exsim.api.API(pool_size=2)
+    s1 = api.create_server('s1')
+    s1.load_engine("default", "default_engine", "DefaultEngine")
+    s1.create_engine("e1", "default")
+    api.create_server('s2')
+    api.create_server('s3')
+    api.delete_server('s1')
+    assert len(api._pool) == 2
+    api.delete()
+    assert api._pool == []
+
+
+def test_server_proxy():
+    api = exsim.api.API()
+    server = api.create_server('s1')
+    server.load_engine("default", "default_engine", "DefaultEngine")
+    server.load_protocol("fix", "fix_protocol", "FixProtocol")
+    server.create_engine("e1", "default")
+    assert server.start_engine("e1")
+    assert not server.start_engine("e1")
+    port = server.create_endpoint("ep1", 0, "fix", "e1")
+
+    with pytest.raises(Exception, match="No such engine property"):
+        server.set_engine_property("e1", "colour", "red")
+    with pytest.raises(Exception, match="No such endpoint property"):
+        server.set_endpoint_property("ep1", "colour", "red")
+
+    client = socket.create_connection(("127.0.0.1", port))
+    client.sendall(new_order("1", price=b"10"))
+    for _ in range(100):
+        book = server.get_book("e1", "ABC")
+        if book["bids"]:
+            break
+        time.sleep(0.01)
+    assert book["bids"] == [[10.0, 100, 1]]
+    client.close()
+
+    server.delete_endpoint("ep1")
+    with pytest.raises(Exception):
+        server.delete_endpoint("ep1")
+    assert server.stop_engine("e1")
+    api.delete()
+
+
+def test_embedded_server():
+    api = exsim.api.API()
+    server = api.create_embedded_server('s1')
+    server.load_engine("default", "default_engine", "DefaultEngine")
+    server.load_protocol("fix", "fix_protocol", "FixProtocol")
+    server.create_engine("e1", "default")
+    port = server.create_endpoint("ep1", 0, "fix", "e1")
+
+    with pytest.raises(KeyError):
+        server.create_engine("e1", "default")
+
+    client = socket.create_connection(("127.0.0.1", port))
+    client.sendall(new_order("1", price=b"10"))
+    for _ in range(100):
+        book = server.get_book("e1", "ABC")
+        if book["bids"]:
+            break
+        time.sleep(0.01)
+    assert book["bids"] == [(10.0, 100, 1)]
+
+    client.close()
+    api.delete()
+
+
+def test_embedded_server_leaks():
+    with warnings.catch_warnings(record=True) as caught:
+        warnings.simplefilter("always", ResourceWarning)
+        api = exsim.api.API()
+        server = api.create_embedded_server("s1")
+        server.create_engine("e1", "default")
+        port = server.create_endpoint("ep1", 0, "fix42", "e1")
+        client = socket.create_connection(("127.0.0.1", port))
+        client.sendall(new_order("1"))
+        server.get_metrics()
+        api.delete()
+        client.close()
+        del api, server
+        gc.collect()
+    assert [str(w.message) for w in caught
+            if issubclass(w.category, ResourceWarning)] == []
+
+
+def test_embedded_server_died():
+    api = exsim.api.API()
+    server = api.create_embedded_server("s1")
+    server.call(server.server().stop)
+    server._thread.join()
+    with pytest.raises(ConnectionError):
+        server.get_metrics()
+    api.delete()
@@ -0,0 +1,76 @@
+# -*- coding: utf-8 -*-
+########################################################################
+# exsim - Exchange Simulator
+# Copyright (C) 2022-2023, zeroXone.
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see http://www.gnu.org/licenses/
+#
+########################################################################
+
+import asyncio
+
+from exsim.api import AsyncAPI
+from exsim.async_server import AsyncServer
+
+from fixtures import new_order
+
+
+def test_async_api():
+    async def scenario():
+        server = AsyncServer()
+        task = asyncio.create_task(server.serve())
+        await asyncio.sleep(0)
+
+        api = await AsyncAPI.connect("127.0.0.1", server.get_port())
+        await api.load_engine("default", "default_engine", "DefaultEngine")
+        await api.load_protocol("fix", "fix_protocol", "FixProtocol")
+
+        # Many requests in flight at once.
+        await asyncio.gather(*(api.create_engine(f"e{i}", "default")
+                               for i in range(50)))
+        assert len(server._engines) == 50
+
+        await api.subscribe(["session", "execution"])
+        await api.create_endpoint("ep", 0, "fix", "e0")
+        await asyncio.sleep(0.05)
+        port = server._endpoints["ep"].socket().getsockname()[1]
+
+        reader, writer = await asyncio.open_connection("127.0.0.1", port)
+        writer.write(new_order("1", price=b"10") + new_order("2", price=b"11"))
+
+        events = api.events()
+        event = await asyncio.wait_for(events.__anext__(), 1)
+        assert event["event"] == "session"
+        assert event["data"]["state"] == "opened"
+
+        book = await api.get_book("e0", "ABC")
+        assert book["bids"] == [[11.0, 100, 1], [10.0, 100, 1]]
+        assert book["offers"] == []
+
+        writer.write(new_order("3", price=b"11", side=2))
+        for client_order_id in ("2", "3"):
+            event = await asyncio.wait_for(events.__anext__(), 1)
+            assert event["event"] == "execution"
+            assert event["data"]["client_order_id"] == client_order_id
+            assert event["data"]["last_price"] == 11.0
+
+        writer.close()
+        event = await asyncio.wait_for(events.__anext__(), 1)
+        assert event["data"]["state"] == "closed"
+
+        await api.close()
+        server.stop()
+        await task
+
+    asyncio.run(scenario())
@@ -0,0 +1,100 @@
+# -*- coding: utf-8 -*-
+########################################################################
+# exsim - Exchange Simulator
+# Copyright (C) 2022-2023, zeroXone.
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see http://www.gnu.org/licenses/
+#
+########################################################################
+
+import asyncio
+import time
+
+from exsim.async_server import AsyncServer
+
+
+def test_async_server_sessions():
+    async def scenario():
+        server = AsyncServer()
+        server.load_engine("default", "default_engine", "DefaultEngine")
+        server.create_engine("e1", "default")
+        server.load_protocol("fix", "fix_protocol", "FixProtocol")
+        task = asyncio.create_task(server.serve())
+        await asyncio.sleep(0.05)
+
+        server.create_endpoint("ep1", 0, "fix", "e1")
+        await asyncio.sleep(0.05)
+        port = server._endpoints["ep1"].socket().getsockname()[1]
+
+        reader, writer = await asyncio.open_connection("127.0.0.1", port)
+        await asyncio.sleep(0.05)
+        assert len(server._sessions) == 1
+
+        writer.close()
+        await asyncio.sleep(0.05)
+        assert len(server._sessions) == 0
+
+        server.stop()
+        await task
+
+    asyncio.run(scenario())
+
+
+def test_async_server_slow_session():
+    async def scenario():
+        server = AsyncServer()
+        server.load_engine("default", "default_engine", "DefaultEngine")
+        server.create_engine("e1", "default")
+        task = asyncio.create_task(server.serve())
+        await asyncio.sleep(0)
+
+        port = server.create_endpoint("ep1", 0, "fix42", "e1")
+        reader, writer = await asyncio.open_connection("127.0.0.1", port)
+        await asyncio.sleep(0.05)
+        session = next(iter(server._sessions))
+        session.max_output_size = 1024 * 1024
+
+        # The client never reads, so output backs up until the
+        # session is closed, and later sends are discarded.
+        for _ in range(100):
+            session.send(b"x" * 65536)
+        assert session.bytes_out < 100 * 65536
+        await asyncio.sleep(0.05)
+        assert len(server._sessions) == 0
+
+        writer.close()
+        server.stop()
+        await task
+
+    asyncio.run(scenario())
+
+
+def test_async_server_timeout():
+    async def scenario():
+        server = AsyncServer()
+        task = asyncio.create_task(server.serve())
+        await asyncio.sleep(0)
+
+        fired = []
+        server.add_timeout(time.time() + 0.01, lambda: fired.append(1))
+        cancelled = server.add_timeout(time.time() + 0.01,
+                                       lambda: fired.append(2))
+        server.delete_timeout(cancelled)
+        await asyncio.sleep(0.05)
+        assert fired == [1]
+
+        server.stop()
+        await task
+
+    asyncio.run(scenario())
@@ -0,0 +1,191 @@
+# -*- coding: utf-8 -*-
+########################################################################
+# exsim - Exchange Simulator
+# Copyright (C) 2022-2023, zeroXone.
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see http://www.gnu.org/licenses/
+#
+########################################################################
+
+import pytest
+
+from exsim.book import Book
+from exsim.default_engine import DefaultEngine
+from exsim.message import (CancelOrderMessage, ModifyOrderMessage,
+                           MARKET_ORDER)
+from exsim.order import NO_ORDER, OrderStore
+from exsim.side import Side
+
+from fixtures import FakeSession, order
+
+
+def allocate(book, side, quantity, price):
+    return book.store.allocate("", None, book.symbol,
+                               side, "", 0, quantity, price)
+
+
+def test_book_rest_and_best():
+    book = Book("ABC")
+    book.add_order(allocate(book, Side.BUY, 10, 99))
+    book.add_order(allocate(book, Side.BUY, 10, 100))
+    book.add_order(allocate(book, Side.SELL, 10, 102))
+    book.add_order(allocate(book, Side.SELL, 10, 101))
+
+    assert book.bids.best_price() == 100
+    assert book.offers.best_price() == 101
+    assert len(book) == 4
+
+
+def test_book_price_time_priority():
+    book = Book("ABC")
+    first = allocate(book, Side.SELL, 5, 101)
+    second = allocate(book, Side.SELL, 5, 101)
+    better = allocate(book, Side.SELL, 5, 100)
+    for handle in (first, second, better):
+        book.add_order(handle)
+
+    fills = book.add_order(allocate(book, Side.BUY, 12, 101))
+    assert [(f.resting, f.quantity, f.price) for f in fills] == \
+        [(better, 5, 100), (first, 5, 101), (second, 2, 101)]
+    assert book.store.remaining_quantity[second] == 3
+    assert book.offers.levels[101].quantity == 3
+    assert book.bids.best_price() is None
+
+
+def test_book_cancel():
+    book = Book("ABC")
+    a = allocate(book, Side.BUY, 10, 100)
+    b = allocate(book, Side.BUY, 10, 100)
+    c = allocate(book, Side.BUY, 10, 100)
+    for handle in (a, b, c):
+        book.add_order(handle)
+
+    assert book.cancel_order(book.store.order_id[b]) == b
+    assert book.bids.levels[100].quantity == 20
+    assert list(book.bids.get_orders(book.bids.levels[100])) == [a, c]
+
+    book.cancel_order(book.store.order_id[a])
+    book.cancel_order(book.store.order_id[c])
+    assert book.bids.best_price() is None
+    with pytest.raises(KeyError):
+        book.cancel_order(book.store.order_id[c])
+
+
+def test_book_modify_priority():
+    book = Book("ABC")
+    a = allocate(book, Side.SELL, 10, 100)
+    b = allocate(book, Side.SELL, 10, 100)
+    book.add_order(a)
+    book.add_order(b)
+
+    # Reducing quantity keeps priority.
+    book.modify_order(book.store.order_id[a], 5)
+    fills = book.add_order(allocate(book, Side.BUY, 1, 100))
+    assert fills[0].resting is a
+
+    # Increasing it loses priority.
+    book.modify_order(book.store.order_id[a], 20)
+    fills = book.add_order(allocate(book, Side.BUY, 1, 100))
+    assert fills[0].resting is b
+
+
+def test_book_market_order():
+    book = Book("ABC")
+    book.add_order(allocate(book, Side.SELL, 5, 100))
+
+    market = allocate(book, Side.BUY, 8, None)
+    fills = book.add_order(market)
+
+    assert sum(f.quantity for f in fills) == 5
+    assert book.store.remaining_quantity[market] == 3
+    assert len(book) == 0
+
+
+def test_order_store_reuse():
+    store = OrderStore()
+    a = store.allocate("a", None, "ABC", Side.BUY, "", 0, 10, 100)
+    b = store.allocate("b", None, "ABC", Side.BUY, "", 0, 10, None)
+    assert store.get_price(b) is None
+    assert store.get_order(a).price == 100
+
+    old_id = store.order_id[a]
+    assert store.find(old_id) == a
+    store.release(a)
+    assert len(store) == 1
+    assert store.find(old_id) == NO_ORDER
+
+    # Reused handle gets a new identifier.
+    assert store.allocate("c", None, "ABC", Side.SELL, "", 0, 5, 99) == a
+    assert store.order_id[a] != old_id
+    assert store.find(old_id) == NO_ORDER
+
+
+def test_engine_match_and_cancel():
+    engine = DefaultEngine("e1")
+    maker = FakeSession()
+    taker = FakeSession()
+
+    engine.deliver(order(maker, "m1", Side.SELL, 10, 100))
+    engine.deliver(order(maker, "m2", Side.SELL, 10, 101))
+
+    aggressor = order(taker, "t1", Side.BUY, 15, None)
+    aggressor.order_type = MARKET_ORDER
+    engine.deliver(aggressor)
+
+    types = [m["type"] for m in taker.messages]
+    assert types == ["order_ack", "order_executed", "order_executed"]
+    assert [m["leaves_quantity"] for m in taker.messages[1:]] == [5, 0]
+    assert maker.messages[-1]["leaves_quantity"] == 5
+
+    cancel = CancelOrderMessage()
+    cancel.session = maker
+    cancel.client_order_id = "m3"
+    cancel.original_client_order_id = "m2"
+    cancel.symbol = "ABC"
+    engine.deliver(cancel)
+    assert maker.messages[-1]["type"] == "order_cancelled"
+    assert len(engine.get_book("ABC")) == 0
+
+    engine.deliver(cancel)
+    assert maker.messages[-1]["type"] == "cancel_reject"
+
+
+def test_engine_replace_duplicate_id():
+    engine = DefaultEngine("e1")
+    trader = FakeSession()
+    engine.deliver(order(trader, "a", Side.BUY, 10, 99))
+    engine.deliver(order(trader, "b", Side.BUY, 10, 98))
+
+    # Replacing "a" as "b", which is still live, is rejected.
+    replace = ModifyOrderMessage()
+    replace.session = trader
+    replace.client_order_id = "b"
+    replace.original_client_order_id = "a"
+    replace.symbol = "ABC"
+    replace.quantity = 5
+    replace.price = 99
+    engine.deliver(replace)
+    assert trader.messages[-1]["type"] == "cancel_reject"
+    assert trader.messages[-1]["reason"] == "Duplicate order identifier"
+
+    # Both orders can still be cancelled by their own identifiers.
+    for client_order_id in ("a", "b"):
+        cancel = CancelOrderMessage()
+        cancel.session = trader
+        cancel.client_order_id = "x" + client_order_id
+        cancel.original_client_order_id = client_order_id
+        cancel.symbol = "ABC"
+        engine.deliver(cancel)
+        assert trader.messages[-1]["type"] == "order_cancelled"
+    assert len(engine.get_book("ABC")) == 0
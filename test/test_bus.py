@@ -0,0 +1,172 @@
+# -*- coding: utf-8 -*-
+########################################################################
+# exsim - Exchange Simulator
+# Copyright (C) 2022-2023, zeroXone.
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see http://www.gnu.org/licenses/
+#
+########################################################################
+
+import re
+import time
+
+from exsim import bus
+from exsim.default_engine import DefaultEngine
+from exsim.endpoint import DROP_COPY, TRADE_FEED
+from exsim.fix_framer import FixFramer
+from exsim.fix_protocol import FixProtocol
+from exsim.side import Side
+
+from fixtures import FakeServer, FakeSession, order
+
+
+def make_engine():
+    engine = DefaultEngine("e1")
+    server = FakeServer(engine)
+    engine.set_server(server)
+    return engine, server
+
+
+def follow(engine, role, protocol=None, **options):
+    session = FakeSession(protocol, role, **options)
+    engine.attach_session(session)
+    return session
+
+
+def test_drop_copies_follow_order_entry():
+    engine, server = make_engine()
+    trader = FakeSession()
+    d1 = follow(engine, DROP_COPY)
+    d2 = follow(engine, DROP_COPY)
+    trades = follow(engine, TRADE_FEED)
+
+    engine.deliver_batch([order(trader, "1", Side.BUY, 100, 10.0),
+                          order(trader, "2", Side.SELL, 40, 10.0)])
+    types = [m["type"] for m in trader.messages]
+    assert types == ["order_ack", "order_ack", "order_executed",
+                     "order_executed"]
+
+    # Drop copies are the trader's reports, shared by all subscribers.
+    assert [m["report"] for m in d1.messages] == trader.messages
+    assert all(a is b for a, b in zip(d1.messages, d2.messages))
+
+    assert [(m["symbol"], m["price"], m["quantity"])
+            for m in trades.messages] == [("ABC", 10.0, 40)]
+
+
+def test_backpressure():
+    engine, server = make_engine()
+    trader = FakeSession()
+    follower = follow(engine, DROP_COPY)
+    follower.backlog = engine.bus.max_session_output
+
+    # A subscriber with too much unsent output is retried after a delay.
+    now = time.time()
+    engine.deliver(order(trader, "1", Side.BUY, 100, 10.0))
+    assert follower.messages == []
+    assert len(server.timeouts) == 1
+    assert server.expiry_times[0] >= now + engine.bus.retry_interval
+
+    # Nothing more is scheduled while a retry is pending.
+    engine.deliver(order(trader, "2", Side.BUY, 100, 10.0))
+    assert len(server.timeouts) == 1
+
+    follower.backlog = 0
+    server.timeouts.pop()()
+    assert len(follower.messages) == 2
+    assert server.timeouts == []
+
+
+def test_flush_budget():
+    engine, server = make_engine()
+    engine.bus.flush_budget = 1
+    trader = FakeSession()
+    follower = follow(engine, DROP_COPY)
+
+    # A subscriber that used its budget is retried on the next pass.
+    engine.deliver_batch([order(trader, "1", Side.BUY, 100, 10.0),
+                          order(trader, "2", Side.BUY, 100, 10.0)])
+    assert len(follower.messages) == 1
+    assert server.expiry_times[0] <= time.time()
+
+    server.timeouts.pop()()
+    assert len(follower.messages) == 2
+
+
+def test_drop_policy():
+    engine, server = make_engine()
+    trader = FakeSession()
+    follower = follow(engine, DROP_COPY, queue_size=2, policy=bus.DROP)
+    follower.backlog = engine.bus.max_session_output
+
+    for i in range(4):
+        engine.deliver(order(trader, str(i), Side.BUY, 100, 10.0))
+    follower.backlog = 0
+    engine.bus.flush()
+    assert [m["report"]["client_order_id"] for m in follower.messages] == \
+        ["0", "1"]
+    assert engine.bus._subscribers[follower][0].dropped == 2
+
+
+def test_conflate_policy():
+    engine, server = make_engine()
+    trader = FakeSession()
+    follower = follow(engine, DROP_COPY, queue_size=2, policy=bus.CONFLATE)
+    follower.backlog = engine.bus.max_session_output
+
+    engine.deliver_batch([order(trader, "1", Side.BUY, 100, 10.0),
+                          order(trader, "2", Side.SELL, 40, 10.0),
+                          order(trader, "3", Side.SELL, 30, 10.0)])
+    follower.backlog = 0
+    engine.bus.flush()
+
+    # The latest report for each order, with the oldest order dropped.
+    assert [(m["report"]["client_order_id"], m["report"]["type"])
+            for m in follower.messages] == [("1", "order_executed"),
+                                            ("3", "order_executed")]
+
+
+def test_disconnect_policy():
+    engine, server = make_engine()
+    trader = FakeSession()
+    follower = follow(engine, TRADE_FEED, queue_size=1,
+                      policy=bus.DISCONNECT)
+    follower.backlog = engine.bus.max_session_output
+
+    engine.deliver_batch([order(trader, "1", Side.BUY, 100, 10.0),
+                          order(trader, "2", Side.SELL, 10, 10.0),
+                          order(trader, "3", Side.SELL, 10, 10.0)])
+    assert server.closing == [follower]
+    assert not engine.bus.has_subscribers(bus.TRADES)
+
+
+def test_fix_drop_copy():
+    engine, server = make_engine()
+    trader = FakeSession()
+    d1 = follow(engine, DROP_COPY, FixProtocol)
+    d2 = follow(engine, DROP_COPY, FixProtocol)
+    engine.deliver(order(trader, "1", Side.BUY, 100, 10.0))
+
+    framer = FixFramer()
+    framer.append_buffer(b"".join(d1.sent))
+    ack = framer.get_frame()
+    assert ack.message_type == b"8"
+    assert ack.get(11) == b"1"
+    assert ack.get(150) == b"0"
+    assert ack.get(17) == b"D1"
+
+    # The same report, apart from each session's SendingTime.
+    def report(session):
+        return re.sub(rb"\x01(52|10)=[^\x01]*", b"", b"".join(session.sent))
+    assert report(d2) == report(d1)
@@ -0,0 +1,57 @@
+# -*- coding: utf-8 -*-
+########################################################################
+# exsim - Exchange Simulator
+# Copyright (C) 2022-2023, zeroXone.
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see http://www.gnu.org/licenses/
+#
+########################################################################
+
+import datetime
+
+from exsim.clock import FixClock, SimulatedClock
+from exsim.clock import MICROSECONDS, MILLISECONDS, NANOSECONDS
+
+
+# 2023-01-02 13:14:15.012345678 UTC
+NOW = int(datetime.datetime(2023, 1, 2, 13, 14, 15,
+                            tzinfo=datetime.timezone.utc).timestamp()) \
+      * 1000000000 + 12345678
+
+
+def test_precision():
+    clock = SimulatedClock(NOW)
+    assert FixClock(0, clock).now() == b"20230102-13:14:15"
+    assert FixClock(MILLISECONDS, clock).now() == b"20230102-13:14:15.012"
+    assert FixClock(MICROSECONDS, clock).now() == \
+        b"20230102-13:14:15.012345"
+    assert FixClock(NANOSECONDS, clock).now() == \
+        b"20230102-13:14:15.012345678"
+
+
+def test_second_rollover():
+    clock = SimulatedClock(NOW)
+    fix_clock = FixClock(MILLISECONDS, clock)
+    assert fix_clock.now() == b"20230102-13:14:15.012"
+    clock.advance(990000000)
+    assert fix_clock.now() == b"20230102-13:14:16.002"
+    clock.set(NOW + 86400 * 1000000000)
+    assert fix_clock.now() == b"20230103-13:14:15.012"
+
+
+def test_real_clock():
+    now = datetime.datetime.utcnow()
+    stamp = FixClock().now().decode()
+    parsed = datetime.datetime.strptime(stamp, "%Y%m%d-%H:%M:%S.%f")
+    assert abs((parsed - now).total_seconds()) < 2
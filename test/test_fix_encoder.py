@@ -0,0 +1,90 @@
+# -*- coding: utf-8 -*-
+########################################################################
+# exsim - Exchange Simulator
+# Copyright (C) 2022-2023, zeroXone.
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see http://www.gnu.org/licenses/
+#
+########################################################################
+
+import simplefix
+
+from exsim.fix_encoder import FixEncoder, format_price
+from exsim.fix_framer import FixFramer
+from exsim.fix_protocol import FixProtocol
+
+from fixtures import FakeSession
+
+
+def test_encode_matches_simplefix():
+    encoder = FixEncoder("EXSIM", "CLIENT")
+    for seq in (1, 99, 100000):
+        fix = simplefix.FixMessage()
+        fix.append_pair(8, "FIX.4.2")
+        fix.append_pair(35, "8")
+        fix.append_pair(49, "EXSIM")
+        fix.append_pair(56, "CLIENT")
+        fix.append_pair(34, seq)
+        fix.append_pair(52, "20230101-12:00:00.000")
+        fix.append_pair(11, "abc")
+        fix.append_pair(44, "10.5")
+
+        data = encoder.encode(b"8", seq, b"20230101-12:00:00.000",
+                              b"11=abc\x0144=10.5\x01")
+        assert data == fix.encode()
+
+        body = b"11=abc\x0144=10.5\x01"
+        assert encoder.encode(b"8", seq, b"20230101-12:00:00.000",
+                              body, sum(body)) == data
+
+
+def test_format_price():
+    assert format_price(10.0) == b"10"
+    assert format_price(10.25) == b"10.25"
+    assert format_price(0.1) == b"0.1"
+    assert format_price(1e-05) == b"0.00001"
+    assert format_price(1.5e-07) == b"0.00000015"
+    assert format_price(1e16) == b"10000000000000000"
+    assert format_price(-2.5e-05) == b"-0.000025"
+
+
+def test_execution_report():
+    session = FakeSession()
+    protocol = FixProtocol(session)
+    protocol.send({"type": "order_executed",
+                   "order_id": 7,
+                   "client_order_id": "c1",
+                   "symbol": "ABC",
+                   "side": 1,
+                   "order_type": "limit",
+                   "quantity": 100,
+                   "price": 10.5,
+                   "leaves_quantity": 60,
+                   "cum_quantity": 40,
+                   "execution_id": 3,
+                   "last_quantity": 40,
+                   "last_price": 10.0})
+
+    framer = FixFramer()
+    framer.append_buffer(session.sent[0])
+    frame = framer.get_frame()
+    assert frame.message_type == b"8"
+    assert frame.get(34) == b"1"
+    assert frame.get(37) == b"7"
+    assert frame.get(17) == b"3"
+    assert frame.get(39) == b"1"
+    assert frame.get(44) == b"10.5"
+    assert frame.get(31) == b"10"
+    assert frame.get(151) == b"60"
+    assert framer.errors == 0
@@ -0,0 +1,130 @@
+# -*- coding: utf-8 -*-
+########################################################################
+# exsim - Exchange Simulator
+# Copyright (C) 2022-2023, zeroXone.
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see http://www.gnu.org/licenses/
+#
+########################################################################
+
+import simplefix
+
+from exsim.fix_framer import MAX_BODY_LENGTH, FixFramer
+from exsim.fix_protocol import FixProtocol
+from exsim.side import Side
+
+from fixtures import FakeSession, new_order
+
+
+def test_fragmented():
+    data = new_order("1") + new_order("2") + new_order("3")
+    framer = FixFramer()
+    frames = []
+    for i in range(len(data)):
+        framer.append_buffer(data[i:i + 1])
+        frames.extend(framer.get_frames())
+
+    assert [f.get(11) for f in frames] == [b"1", b"2", b"3"]
+    assert frames[0].raw == new_order("1")
+    assert frames[0].message_type == b"D"
+    assert frames[0].get(8) == b"FIX.4.2"
+    assert frames[0].get(44) == b"10.5"
+    assert frames[0].get(58) is None
+    assert len(framer) == 0
+
+
+def test_resync():
+    good = new_order("2")
+    bad_checksum = new_order("1")[:-4] + b"000\x01"
+    framer = FixFramer()
+    framer.append_buffer(b"garbage" + bad_checksum +
+                         b"8=FIX.4.2\x01junk\x01" + good)
+
+    frames = framer.get_frames()
+    assert [f.get(11) for f in frames] == [b"2"]
+    assert framer.errors == 2
+
+
+def test_body_length_limit():
+    good = new_order("2")
+    framer = FixFramer()
+    framer.append_buffer(b"8=FIX.4.2\x019=%d\x0135=D\x01" %
+                         (MAX_BODY_LENGTH + 1) + good)
+
+    # The oversized message is discarded without waiting for its body.
+    frames = framer.get_frames()
+    assert [f.get(11) for f in frames] == [b"2"]
+    assert framer.errors == 1
+
+
+def test_no_checksum_validation():
+    bad_checksum = new_order("1")[:-4] + b"000\x01"
+    framer = FixFramer(validate_checksum=False)
+    framer.append_buffer(bad_checksum)
+    assert framer.get_frame().get(11) == b"1"
+
+
+def test_protocol_receive():
+    protocol = FixProtocol("session")
+    data = new_order("1") + new_order("2", price=b"11")
+    messages = protocol.receive(data[:-10])
+    messages.extend(protocol.receive(data[-10:]))
+
+    assert [m.client_order_id for m in messages] == ["1", "2"]
+    assert messages[0].session == "session"
+    assert messages[0].symbol == "ABC"
+    assert messages[0].side == Side.BUY
+    assert messages[0].quantity == 100
+    assert messages[1].price == 11.0
+
+
+def test_protocol_bad_field():
+    session = FakeSession()
+    protocol = FixProtocol(session)
+    bad = new_order("1").replace(b"\x0138=100\x01", b"\x0138=abc\x01")
+    bad = bad[:bad.rindex(b"10=")] + \
+        b"10=%03d\x01" % (sum(bad[:bad.rindex(b"10=")]) & 0xff)
+
+    messages = protocol.receive(bad + new_order("2"))
+    assert [m.client_order_id for m in messages] == ["2"]
+    assert protocol.parse_errors() == 1
+
+    framer = FixFramer()
+    framer.append_buffer(session.sent[0])
+    reject = framer.get_frame()
+    assert reject.message_type == b"3"
+    assert reject.get(372) == b"D"
+    assert reject.get(373) == b"6"
+
+
+def test_protocol_bad_price():
+    session = FakeSession()
+    protocol = FixProtocol(session)
+    replace = simplefix.FixMessage()
+    replace.append_pair(8, "FIX.4.2")
+    replace.append_pair(35, "G")
+    replace.append_pair(11, "4")
+    replace.append_pair(41, "3")
+    replace.append_pair(55, "ABC")
+    replace.append_pair(38, 100)
+    replace.append_pair(44, b"inf")
+
+    messages = protocol.receive(new_order("1", price=b"nan") +
+                                new_order("2", price=b"-Infinity") +
+                                replace.encode() +
+                                new_order("3", price=b"1e3"))
+    assert [(m.client_order_id, m.price) for m in messages] == \
+        [("3", 1000.0)]
+    assert protocol.parse_errors() == 3
+    assert len(session.sent) == 3
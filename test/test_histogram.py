@@ -0,0 +1,79 @@
+# -*- coding: utf-8 -*-
+########################################################################
+# exsim - Exchange Simulator
+# Copyright (C) 2022-2023, zeroXone.
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see http://www.gnu.org/licenses/
+#
+########################################################################
+
+import json
+import random
+
+import pytest
+
+from benchmarks import order_path
+from benchmarks.histogram import Histogram
+
+
+def test_precision():
+    histogram = Histogram(3)
+    values = [random.randint(0, 10 ** 9) for _ in range(10000)]
+    for value in values:
+        histogram.record(value)
+
+    values.sort()
+    for percentile in (50, 99, 99.9):
+        exact = values[int(len(values) * percentile / 100) - 1]
+        reported = histogram.percentile(percentile)
+        assert exact <= reported <= exact * 1.001
+    assert histogram.percentile(100) == values[-1]
+    assert histogram.min() == values[0]
+
+
+def test_small_values_exact():
+    histogram = Histogram(3)
+    for value in range(2000):
+        histogram.record(value)
+    assert histogram.percentile(50) == 999
+    assert histogram.mean() == 999.5
+
+    with pytest.raises(ValueError):
+        histogram.record(-1)
+
+
+def test_merge_and_serialise():
+    a, b = Histogram(), Histogram()
+    a.record(100, 3)
+    b.record(10 ** 6)
+    a.merge(Histogram.from_dict(b.to_dict()))
+    assert a.count() == 4
+    assert a.max() == 10 ** 6
+    assert a.percentile(75) == 100
+
+    with pytest.raises(ValueError):
+        a.merge(Histogram(2))
+
+
+def test_order_path(tmp_path):
+    output = str(tmp_path / "results.json")
+    order_path.main(["--sessions", "2", "--processes", "1",
+                     "--rate", "1000", "--duration", "0.5",
+                     "--warmup", "0", "--output", output])
+
+    with open(output) as f:
+        results = json.load(f)
+    assert results["errors"] == 0
+    assert results["unacknowledged"] == 0
+    assert results["latency_us"]["all"]["count"] > 0
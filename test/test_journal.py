@@ -0,0 +1,109 @@
+# -*- coding: utf-8 -*-
+########################################################################
+# exsim - Exchange Simulator
+# Copyright (C) 2022-2023, zeroXone.
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see http://www.gnu.org/licenses/
+#
+########################################################################
+
+import socket
+
+import simplefix
+
+from exsim.default_engine import DefaultEngine
+from exsim.endpoint import DROP_COPY, ORDER_ENTRY
+from exsim.fix_protocol import FixProtocol
+from exsim.journal import (CLOSE, INBOUND, OPEN, OUTBOUND, Journal,
+                           JournalReader)
+from exsim.replay import replay
+from exsim.session import Session
+
+from fixtures import FakeEndpoint, FakeServer
+
+
+def limit_order(client_order_id, side, price):
+    msg = simplefix.FixMessage()
+    msg.append_pair(8, "FIX.4.2")
+    msg.append_pair(35, "D")
+    msg.append_pair(49, "CLIENT")
+    msg.append_pair(56, "EXSIM")
+    msg.append_pair(11, client_order_id)
+    msg.append_pair(55, "ABC")
+    msg.append_pair(54, side)
+    msg.append_pair(40, 2)
+    msg.append_pair(38, 100)
+    msg.append_pair(44, price)
+    return msg.encode()
+
+
+def test_reader_roundtrip(tmp_path):
+    path = str(tmp_path / "j")
+    journal = Journal(path)
+    journal.record(OPEN, 1, b"{}")
+    journal.record(INBOUND, 1, b"abc")
+    journal.record(CLOSE, 1, b"")
+    journal.close()
+    journal.record(INBOUND, 1, b"ignored")
+
+    records = list(JournalReader(path))
+    assert [(r[0], r[1], r[3]) for r in records] == \
+        [(OPEN, 1, b"{}"), (INBOUND, 1, b"abc"), (CLOSE, 1, b"")]
+
+    # A truncated final record is skipped.
+    with open(path, "ab") as f:
+        f.write(b"\x02\x01\x00")
+    assert len(list(JournalReader(path))) == 3
+
+
+def test_record_and_replay(tmp_path):
+    path = str(tmp_path / "j")
+    journal = Journal(path)
+
+    engine = DefaultEngine("e1")
+    sessions = []
+    for role in (DROP_COPY, ORDER_ENTRY):
+        ours, theirs = socket.socketpair()
+        ours.setblocking(False)
+        endpoint = FakeEndpoint(FixProtocol, engine, role, queue_size=100)
+        session = Session(ours, "peer", endpoint)
+        session.set_server(FakeServer())
+        session.set_journal(journal)
+        engine.attach_session(session)
+        sessions.append((session, theirs))
+    session = sessions[1][0]
+
+    data = [limit_order("1", 1, 10), limit_order("2", 2, 10)]
+    session.received(data[0][:20])
+    session.received(data[0][20:] + data[1])
+
+    # Several orders in one record, each with a drop copy.
+    session.received(b"".join(limit_order(str(i), 1, 9)
+                              for i in range(3, 8)))
+    for session, theirs in sessions:
+        session.close()
+        theirs.close()
+    journal.close()
+
+    types = [r[0] for r in JournalReader(path)]
+    assert types[:4] == [OPEN, OPEN, INBOUND, INBOUND]
+    assert types[-1] == CLOSE
+    recorded = types.count(OUTBOUND)
+    assert recorded > 0
+
+    engine = DefaultEngine("replay")
+    stats = replay(path, engine, FixProtocol)
+    assert stats["sessions"] == 2
+    assert stats["messages"] == 7
+    assert stats["replies"] == stats["recorded_replies"] == recorded
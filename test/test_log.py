@@ -0,0 +1,116 @@
+# -*- coding: utf-8 -*-
+########################################################################
+# exsim - Exchange Simulator
+# Copyright (C) 2022-2023, zeroXone.
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see http://www.gnu.org/licenses/
+#
+########################################################################
+
+import logging
+import os
+
+import pytest
+
+import exsim.api
+from exsim import log
+
+
+@pytest.fixture(autouse=True)
+def reset_levels():
+    yield
+    log.stop()
+    for name in (log.ROOT,) + log.SUBSYSTEMS:
+        logging.getLogger(name).setLevel(logging.NOTSET)
+
+
+def test_text_log(tmp_path):
+    path = str(tmp_path / "xs.log")
+    log.start(path, "INFO")
+    logger = logging.getLogger("exsim.protocol")
+    logger.info("Order %s for %d", "A1", 100)
+    logger.debug("Not written")
+
+    log.set_level("exsim.protocol", "DEBUG")
+    logger.debug("Now written")
+    logging.getLogger("exsim.server").debug("Still not written")
+    log.stop()
+
+    with open(path) as f:
+        lines = f.read().splitlines()
+    assert len(lines) == 2
+    assert lines[0].endswith("INFO exsim.protocol: Order A1 for 100")
+    assert lines[1].endswith("DEBUG exsim.protocol: Now written")
+
+
+def test_binary_log(tmp_path, capsys):
+    path = str(tmp_path / "xs.log")
+    log.start(path, logging.DEBUG, binary=True)
+    logging.getLogger("exsim.session").warning("Slow session %s", "a")
+    try:
+        raise ValueError("oops")
+    except ValueError:
+        logging.getLogger("exsim.engine").exception("Failed")
+    logging.getLogger("exsim.session").info("Closed")
+    log.stop()
+
+    records = list(log.read_binary(path))
+    assert [(r[1], r[2]) for r in records] == \
+        [(logging.WARNING, "exsim.session"),
+         (logging.ERROR, "exsim.engine"),
+         (logging.INFO, "exsim.session")]
+    assert records[0][3] == "Slow session a"
+    assert "ValueError: oops" in records[1][3]
+
+    log.main([path])
+    assert "WARNING exsim.session: Slow session a" in capsys.readouterr().out
+
+
+def test_binary_log_fork(tmp_path):
+    path = str(tmp_path / "xs.log")
+    log.start(path, logging.INFO, binary=True)
+    logging.getLogger("exsim.session").info("Before")
+
+    pid = os.fork()
+    if pid == 0:
+        logging.getLogger("exsim.engine").info("Child")
+        log.stop()
+        os._exit(0)
+    os.waitpid(pid, 0)
+    logging.getLogger("exsim.server").info("Parent")
+    log.stop()
+
+    # Each process numbers the names in its own file.
+    assert [(r[2], r[3]) for r in log.read_binary(path)] == \
+        [("exsim.session", "Before"), ("exsim.server", "Parent")]
+    assert [(r[2], r[3]) for r in log.read_binary(f"{path}.{pid}")] == \
+        [("exsim.engine", "Child")]
+
+
+def test_set_level_errors():
+    with pytest.raises(KeyError):
+        log.set_level("exsim.nonesuch", "DEBUG")
+    with pytest.raises(ValueError):
+        log.set_level("exsim.server", "LOUD")
+
+
+def test_runtime_levels():
+    api = exsim.api.API()
+    server = api.create_embedded_server("s1")
+    server.set_log_level("exsim", "WARNING")
+    server.set_log_level("exsim.manager", "DEBUG")
+    levels = server.get_log_levels()
+    assert levels["exsim.server"] == "WARNING"
+    assert levels["exsim.manager"] == "DEBUG"
+    api.delete()
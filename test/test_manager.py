@@ -0,0 +1,184 @@
+# -*- coding: utf-8 -*-
+########################################################################
+# exsim - Exchange Simulator
+# Copyright (C) 2022-2023, zeroXone.
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see http://www.gnu.org/licenses/
+#
+########################################################################
+
+import socket
+import threading
+
+import pytest
+
+from exsim.api import Server as ServerProxy
+from exsim.manager import Manager
+from exsim.server import Server
+from exsim.mgmt_codec import MessageReader, ProtocolError, encode_message
+
+from fixtures import FakeServer
+
+
+def test_pipelined_requests():
+    ours, theirs = socket.socketpair()
+    manager = Manager(ours, "peer")
+    server = FakeServer()
+    manager.set_server(server)
+
+    data = b"".join(encode_message({"type": "start_engine",
+                                    "name": name,
+                                    "id": i})
+                    for i, name in enumerate(("a", "b", "c")))
+    manager.received(data[:-5])
+    assert server.started == ["a", "b"]
+    manager.received(data[-5:])
+    assert server.started == ["a", "b", "c"]
+
+    reader = MessageReader()
+    replies = []
+    while len(replies) < 3:
+        reader.append_buffer(theirs.recv(65536))
+        replies.extend(reader.get_messages())
+    assert [r["id"] for r in replies] == [0, 1, 2]
+    assert all(r["result"] for r in replies)
+
+
+def test_bad_request():
+    ours, theirs = socket.socketpair()
+    manager = Manager(ours, "peer")
+    manager.set_server(FakeServer())
+    manager.received(encode_message({"type": "start_engine", "name": 1}) +
+                     encode_message({"type": "explode", "id": 7}) +
+                     encode_message({"type": ["start_engine"], "id": 8}) +
+                     encode_message({"type": "batch", "id": 9, "requests": [
+                         {"type": {"start_engine": 1}, "name": "a"}]}))
+
+    reader = MessageReader()
+    replies = []
+    while len(replies) < 4:
+        reader.append_buffer(theirs.recv(65536))
+        replies.extend(reader.get_messages())
+    assert not replies[0]["result"]
+    assert replies[1] == {"id": 7, "result": False,
+                          "message": "Unknown request type: 'explode'"}
+    assert replies[2] == {"id": 8, "result": False,
+                          "message": "Request type must be str: "
+                                     "['start_engine']"}
+    assert replies[3]["id"] == 9
+    assert not replies[3]["result"]
+
+
+def test_bad_subscribe():
+    ours, theirs = socket.socketpair()
+    manager = Manager(ours, "peer")
+    manager.set_server(Server(management=False))
+    manager.received(encode_message({"type": "subscribe",
+                                     "topics": [{"a": 1}]}) +
+                     encode_message({"type": "subscribe",
+                                     "topics": ["session", "weather"]}))
+
+    reader = MessageReader()
+    replies = []
+    while len(replies) < 2:
+        reader.append_buffer(theirs.recv(65536))
+        replies.extend(reader.get_messages())
+    assert not replies[0]["result"]
+    assert "weather" in replies[1]["message"]
+    assert not manager._server._subscribers
+    manager._server.close()
+
+
+def test_slow_subscriber():
+    server = Server(management=False)
+    ours, theirs = socket.socketpair()
+    server.add_manager(ours, "peer")
+    manager = server._manager_socks[ours]
+    manager.max_output_size = 1024 * 1024
+    server.subscribe(manager, ["execution"])
+
+    # The client never reads: publishing must neither block nor grow
+    # the output without limit.
+    event = {"data": "x" * 65536}
+    for _ in range(64):
+        server.publish("execution", event)
+    assert ours not in server._manager_socks
+    assert not server.has_subscribers("execution")
+    server.close()
+
+
+def test_large_message():
+    name = "x" * 200000
+    reader = MessageReader()
+    data = encode_message({"type": "start_engine", "name": name})
+    reader.append_buffer(data[:70000])
+    assert reader.get_messages() == []
+    reader.append_buffer(data[70000:])
+    assert reader.get_messages()[0]["name"] == name
+
+    reader.append_buffer(b"\x09" + data[1:])
+    with pytest.raises(ProtocolError):
+        reader.get_messages()
+
+
+def test_batch():
+    server = Server()
+    thread = threading.Thread(target=server.run)
+    thread.start()
+    try:
+        sock = socket.create_connection(("127.0.0.1", server.get_port()))
+        proxy = ServerProxy(None, "test", sock, 0)
+
+        with proxy.batch() as batch:
+            batch.load_engine("default", "default_engine", "DefaultEngine")
+            batch.load_protocol("fix", "fix_protocol", "FixProtocol")
+            for i in range(10):
+                batch.create_engine(f"e{i}", "default")
+                batch.start_engine(f"e{i}")
+                batch.create_endpoint(f"ep{i}", 0, "fix", f"e{i}")
+        assert len(batch.results) == 32
+        assert len(server._endpoints) == 10
+
+        batch = proxy.batch()
+        batch.create_engine("new", "default")
+        batch.create_endpoint("ep_new", 0, "fix", "new")
+        batch.create_engine("e1", "default")
+        batch.create_engine("never", "default")
+        with pytest.raises(Exception):
+            batch.commit()
+        assert [r["message"] for r in batch.results] == \
+            ["Rolled back", "Rolled back", batch.results[2]["message"],
+             "Not attempted"]
+        assert "new" not in server._engines
+        assert "ep_new" not in server._endpoints
+        assert server._engines["e1"].is_running()
+
+        # Starting a running engine changes nothing, so isn't undone.
+        batch = proxy.batch()
+        batch.start_engine("e2")
+        batch.create_engine("e2", "default")
+        with pytest.raises(Exception):
+            batch.commit()
+        assert server._engines["e2"].is_running()
+
+        server._engines["e3"].stop()
+        batch = proxy.batch()
+        batch.stop_engine("e3")
+        batch.create_engine("e3", "default")
+        with pytest.raises(Exception):
+            batch.commit()
+        assert not server._engines["e3"].is_running()
+    finally:
+        server.stop()
+        thread.join()
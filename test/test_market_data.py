@@ -0,0 +1,179 @@
+# -*- coding: utf-8 -*-
+########################################################################
+# exsim - Exchange Simulator
+# Copyright (C) 2022-2023, zeroXone.
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see http://www.gnu.org/licenses/
+#
+########################################################################
+
+import simplefix
+
+from exsim.default_engine import DefaultEngine
+from exsim.fix_framer import FixFramer
+from exsim.fix_protocol import FixProtocol
+from exsim.market_data import LEVEL_CHANGE, LEVEL_DELETE, LEVEL_NEW
+from exsim.side import Side
+
+from fixtures import FakeServer, FakeSession, order
+
+
+def subscribe(engine, session, request_id, interval=0):
+    message = simplefix.FixMessage()
+    message.append_pair(8, "FIX.4.2")
+    message.append_pair(35, "V")
+    message.append_pair(262, request_id)
+    message.append_pair(263, 1)
+    message.append_pair(264, 0)
+    message.append_pair(146, 1)
+    message.append_pair(55, "ABC")
+    if interval:
+        message.append_pair(5000, interval)
+
+    framer = FixFramer()
+    framer.append_buffer(message.encode())
+    request = FixProtocol(session).get_message(framer.get_frame())
+    request.session = session
+    engine.deliver(request)
+
+
+def body(raw):
+    return raw[raw.find(b"\x01268=") + 1:raw.rfind(b"10=")]
+
+
+def market_data(session):
+    return [m for m in session.messages if m["type"].startswith("market")]
+
+
+def test_snapshot_and_deltas():
+    engine = DefaultEngine("e1")
+    trader = FakeSession()
+    engine.deliver(order(trader, "1", Side.BUY, 100, 10.0))
+
+    s1, s2 = FakeSession(), FakeSession()
+    subscribe(engine, s1, "md1")
+    subscribe(engine, s2, "md2")
+    snapshot = market_data(s1)[0]
+    assert snapshot["type"] == "market_data_snapshot"
+    assert snapshot["request_id"] == "md1"
+    assert snapshot["bids"] == [(10.0, 100, 1)]
+
+    engine.deliver_batch([order(trader, "2", Side.BUY, 50, 10.0),
+                          order(trader, "3", Side.SELL, 10, 11.0)])
+    update = market_data(s1)[1]
+    assert update["entries"] == [(LEVEL_CHANGE, Side.BUY, 10.0, 150, 2),
+                                 (LEVEL_NEW, Side.SELL, 11.0, 10, 1)]
+
+    # All subscribers get the same message.
+    assert market_data(s2)[1] is update
+
+    # A level that changes and changes back isn't reported.
+    engine.deliver_batch([order(trader, "4", Side.BUY, 10, 11.0),
+                          order(trader, "5", Side.SELL, 10, 12.0),
+                          order(trader, "6", Side.BUY, 10, 12.0)])
+    assert market_data(s1)[2]["entries"] == [
+        (LEVEL_DELETE, Side.SELL, 11.0, 0, 0)]
+    assert len(market_data(s1)) == 3
+
+    engine.detach_session(s1)
+    engine.deliver(order(trader, "7", Side.BUY, 10, 9.0))
+    assert len(market_data(s1)) == 3
+    assert len(market_data(s2)) == 4
+
+
+def test_conflation():
+    engine = DefaultEngine("e1")
+    server = FakeServer()
+    engine.set_server(server)
+    trader = FakeSession()
+    fast, slow = FakeSession(), FakeSession()
+    subscribe(engine, fast, "md1")
+    subscribe(engine, slow, "md1", interval=100)
+
+    for i in range(5):
+        engine.deliver(order(trader, str(i), Side.BUY, 10, 10.0 + i % 2))
+    assert len(market_data(fast)) == 6
+    assert len(market_data(slow)) == 1
+    assert len(server.timeouts) == 1
+
+    server.timeouts.pop()()
+    assert market_data(slow)[1]["entries"] == [
+        (LEVEL_NEW, Side.BUY, 10.0, 30, 3),
+        (LEVEL_NEW, Side.BUY, 11.0, 20, 2)]
+
+    # Unsubscribing cancels a scheduled update.
+    engine.deliver(order(trader, "x", Side.BUY, 10, 10.0))
+    assert len(server.timeouts) == 1
+    engine.market_data.unsubscribe(slow, "md1")
+    assert server.timeouts == []
+
+
+def test_fix_encoding():
+    engine = DefaultEngine("e1")
+    trader = FakeSession()
+    s1 = FakeSession(FixProtocol)
+    s2 = FakeSession(FixProtocol)
+    subscribe(engine, s1, "md1")
+    subscribe(engine, s2, "md2")
+    engine.deliver(order(trader, "1", Side.SELL, 100, 10.5))
+
+    framer = FixFramer()
+    framer.append_buffer(b"".join(s1.sent))
+    snapshot, update = framer.get_frames()
+    assert snapshot.message_type == b"W"
+    assert snapshot.get(262) == b"md1"
+    assert snapshot.get(268) == b"0"
+
+    assert update.message_type == b"X"
+    assert update.get(262) is None
+    assert update.pairs()[-8:-1] == [(268, b"1"), (279, b"0"), (269, b"1"),
+                                     (55, b"ABC"), (270, b"10.5"),
+                                     (271, b"100"), (346, b"1")]
+
+    # The body is shared by both subscribers.
+    assert body(s2.sent[1]) == body(update.raw)
+
+
+def test_reject_duplicate():
+    engine = DefaultEngine("e1")
+    s1 = FakeSession(FixProtocol)
+    subscribe(engine, s1, "md1")
+    subscribe(engine, s1, "md1")
+
+    framer = FixFramer()
+    framer.append_buffer(b"".join(s1.sent))
+    frames = framer.get_frames()
+    assert [f.message_type for f in frames] == [b"W", b"Y"]
+    assert frames[1].get(58) == b"Duplicate request identifier"
+
+
+def test_reject_malformed():
+    session = FakeSession(FixProtocol)
+    protocol = session.protocol()
+    for field in ((146, "x"), (5000, "-1")):
+        message = simplefix.FixMessage()
+        message.append_pair(8, "FIX.4.2")
+        message.append_pair(35, "V")
+        message.append_pair(262, "md1")
+        message.append_pair(263, 1)
+        message.append_pair(*field)
+        message.append_pair(55, "ABC")
+        assert protocol.receive(message.encode()) == []
+
+    framer = FixFramer()
+    framer.append_buffer(b"".join(session.sent))
+    frames = framer.get_frames()
+    assert [f.message_type for f in frames] == [b"Y", b"Y"]
+    assert frames[0].get(262) == b"md1"
+    assert protocol.parse_errors() == 2
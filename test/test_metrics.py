@@ -0,0 +1,115 @@
+# -*- coding: utf-8 -*-
+########################################################################
+# exsim - Exchange Simulator
+# Copyright (C) 2022-2023, zeroXone.
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see http://www.gnu.org/licenses/
+#
+########################################################################
+
+import socket
+import time
+import urllib.request
+
+import exsim.api
+from exsim.metrics import Histogram, format_prometheus
+
+from fixtures import new_order
+
+
+def test_histogram():
+    histogram = Histogram([1, 10])
+    for value in (0.5, 1, 5, 50):
+        histogram.observe(value)
+    assert histogram.to_dict() == {"buckets": [[1, 2], [10, 3], ["+Inf", 4]],
+                                   "sum": 56.5,
+                                   "count": 4}
+
+
+def wait_for_metrics(server, condition):
+    for _ in range(200):
+        metrics = server.get_metrics()
+        if condition(metrics):
+            break
+        time.sleep(0.01)
+    return metrics
+
+
+def test_session_metrics():
+    api = exsim.api.API()
+    server = api.create_embedded_server("s1")
+    server.create_engine("e1", "default")
+    port = server.create_endpoint("ep1", 0, "fix42", "e1")
+
+    client = socket.create_connection(("127.0.0.1", port))
+    data = new_order("1", price=b"10") + new_order("2", price=b"10") + \
+        b"8=FIX.4.2\x019=5\x0135=D\x0110=000\x01"
+    client.sendall(data)
+
+    metrics = wait_for_metrics(
+        server, lambda m: m["sessions"] and m["sessions"][0]["parse_errors"])
+    session = metrics["sessions"][0]
+    assert session["endpoint"] == "ep1"
+    assert session["messages_in"] == 2
+    assert session["bytes_in"] == len(data)
+    assert session["parse_errors"] == 1
+    assert session["messages_out"] == 2
+    assert metrics["engines"]["e1"]["orders_resting"] == 2
+    assert metrics["endpoints"]["ep1"]["sessions_open"] == 1
+
+    # Closed sessions' traffic stays in the endpoint's totals.
+    client.close()
+    metrics = wait_for_metrics(server, lambda m: not m["sessions"])
+    endpoint = metrics["endpoints"]["ep1"]
+    assert endpoint["messages_in"] == 2
+    assert endpoint["sessions_accepted"] == 1
+    assert endpoint["sessions_open"] == 0
+    assert metrics["server"]["loop_iteration_seconds"]["count"] > 0
+    api.delete()
+
+
+def test_prometheus_listener():
+    api = exsim.api.API()
+    server = api.create_embedded_server("s1")
+    server.create_engine("e1", "default")
+    server.create_endpoint("ep1", 0, "fix42", "e1")
+
+    port = server.start_metrics()
+    url = f"http://127.0.0.1:{port}/metrics"
+    with urllib.request.urlopen(url) as response:
+        assert response.headers["Content-Type"].startswith("text/plain")
+        text = response.read().decode()
+    assert "# TYPE exsim_engine_orders_resting gauge" in text
+    assert 'exsim_endpoint_sessions_accepted_total{endpoint="ep1"} 0' in text
+    assert 'exsim_loop_iteration_seconds_bucket{le="+Inf"}' in text
+
+    server.stop_metrics()
+    api.delete()
+
+
+def test_format_labels():
+    metrics = {"server": {"loop_iteration_seconds": Histogram().to_dict(),
+                          "sessions_open": 1},
+               "engines": {},
+               "endpoints": {},
+               "sessions": [{"endpoint": "ep1",
+                             "address": "('10.0.0.1', 5000)",
+                             "bytes_in": 10}],
+               "shards": {"0": {"loop_iteration_seconds":
+                                Histogram().to_dict(),
+                                "sessions_open": 1}}}
+    text = format_prometheus(metrics)
+    assert 'exsim_session_bytes_in_total{endpoint="ep1",' \
+           'address="(\'10.0.0.1\', 5000)"} 10' in text
+    assert 'exsim_sessions_open{shard="0"} 1' in text
@@ -0,0 +1,63 @@
+# -*- coding: utf-8 -*-
+########################################################################
+# exsim - Exchange Simulator
+# Copyright (C) 2022-2023, zeroXone.
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see http://www.gnu.org/licenses/
+#
+########################################################################
+
+import json
+import random
+
+from benchmarks import micro
+
+
+def test_run_all():
+    results = micro.run(list(micro.BENCHMARKS), warmup=0, repeat=2,
+                        min_time=0.001)
+    assert set(results["results"]) == set(micro.BENCHMARKS)
+    for result in results["results"].values():
+        assert result["median"] > 0
+        assert len(result["samples"]) == 2
+    json.dumps(results)
+
+
+def test_seeded_setup():
+    a = micro._new_order(random.Random(5), 1)
+    b = micro._new_order(random.Random(5), 1)
+    assert a == b
+
+
+def result(median, stdev=0.0):
+    return {"median": median, "stdev": stdev}
+
+
+def test_compare(tmp_path):
+    base = {"results": {"a": result(100), "b": result(100),
+                        "c": result(100, 20), "d": result(100)}}
+    new = {"results": {"a": result(150), "b": result(80),
+                       "c": result(110, 20)}}
+    rows = {row[0]: row for row in micro.compare(base, new, 5.0)}
+    assert rows["a"][3] == 50.0
+    assert rows["a"][4] == "slower"
+    assert rows["b"][4] == "faster"
+    assert rows["c"][4] == "same"
+    assert "d" not in rows
+
+    base_file, new_file = tmp_path / "base.json", tmp_path / "new.json"
+    base_file.write_text(json.dumps(base))
+    new_file.write_text(json.dumps(new))
+    assert micro.main(["--compare", str(base_file), str(new_file)]) == 1
+    assert micro.main(["--compare", str(base_file), str(base_file)]) == 0
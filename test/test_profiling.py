@@ -0,0 +1,122 @@
+# -*- coding: utf-8 -*-
+########################################################################
+# exsim - Exchange Simulator
+# Copyright (C) 2022-2023, zeroXone.
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see http://www.gnu.org/licenses/
+#
+########################################################################
+
+import functools
+import time
+
+import pytest
+
+import exsim.api
+from exsim.profiling import Profiler, Watchdog, describe_handler
+from exsim.timer import TimerQueue
+
+
+def slow_handler():
+    time.sleep(0.1)
+    return
+
+
+def test_watchdog():
+    watchdog = Watchdog(0.02)
+    watchdog.call(lambda: None)
+    watchdog.call(slow_handler)
+    watchdog.stop()
+
+    report = watchdog.get_report()
+    assert report["threshold"] == 0.02
+    assert report["count"] == 1
+    stall = report["stalls"][0]
+    assert stall["handler"] == "slow_handler"
+    assert stall["seconds"] >= 0.1
+    assert stall["stack"][0].startswith("slow_handler (")
+
+    with pytest.raises(ValueError):
+        Watchdog(0)
+
+
+def test_describe_handler():
+    queue = TimerQueue()
+    assert describe_handler(queue.expire) == "TimerQueue.expire"
+    assert describe_handler(functools.partial(slow_handler)) == \
+        "slow_handler"
+
+
+def test_timer_call():
+    calls = []
+    queue = TimerQueue()
+    queue.add(1.0, slow_handler)
+    assert queue.expire(2.0, calls.append) == 1
+    assert calls == [slow_handler]
+
+
+@pytest.mark.parametrize("mode", ["cprofile", "sampling"])
+def test_profiler(mode):
+    profiler = Profiler(mode)
+    slow_handler()
+    profiler.stop()
+
+    report = profiler.get_report()
+    assert report["mode"] == mode
+    assert report["seconds"] >= 0.1
+    if mode == "cprofile":
+        assert any(f["function"].startswith("slow_handler (")
+                   for f in report["functions"])
+    else:
+        assert report["samples"] > 0
+        assert "slow_handler" in report["stacks"][0]["stack"]
+
+    with pytest.raises(ValueError):
+        Profiler("guess")
+
+
+def test_server_stalls():
+    api = exsim.api.API()
+    server = api.create_embedded_server("s1")
+    server.start_watchdog(0.02)
+    with pytest.raises(KeyError):
+        server.start_watchdog()
+
+    server.call(time.sleep, 0.1)
+    stalls = server.get_stalls()
+    assert stalls["count"] == 1
+    assert stalls["stalls"][0]["handler"] == "Server._run_calls"
+    # Without the class, before Python 3.11.
+    assert stalls["stalls"][0]["stack"][0].split(" (")[0].endswith("run")
+
+    assert server.stop_watchdog()["count"] == 1
+    with pytest.raises(KeyError):
+        server.get_stalls()
+    api.delete()
+
+
+def test_managed_profile():
+    api = exsim.api.API()
+    server = api.create_server("s1")
+    server.start_profile("sampling", 0.001)
+    server.create_engine("e1", "default")
+    profile = server.stop_profile()
+    assert profile["mode"] == "sampling"
+    assert "stacks" in profile
+
+    with pytest.raises(Exception):
+        server.stop_profile()
+    with pytest.raises(Exception):
+        server.start_profile("guess")
+    api.delete()
@@ -0,0 +1,90 @@
+# -*- coding: utf-8 -*-
+########################################################################
+# exsim - Exchange Simulator
+# Copyright (C) 2022-2023, zeroXone.
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see http://www.gnu.org/licenses/
+#
+########################################################################
+
+import collections
+
+import pytest
+
+from exsim import registry
+from exsim.default_engine import DefaultEngine
+from exsim.engine import Engine
+from exsim.fix_protocol import FixProtocol
+from exsim.server import Server
+
+
+EntryPoint = collections.namedtuple("EntryPoint", ["name", "value"])
+
+
+def test_load_class_cached():
+    cls = registry.load_class("default_engine", "DefaultEngine", Engine)
+    assert cls is DefaultEngine
+    assert registry.load_class("exsim.default_engine", "DefaultEngine",
+                               Engine) is DefaultEngine
+    assert ("default_engine", "DefaultEngine", Engine) in registry._classes
+
+
+def test_load_class_bad_names():
+    with pytest.raises(ValueError):
+        registry.load_class("os; import sys", "Engine", Engine)
+    with pytest.raises(ValueError):
+        registry.load_class("default_engine", "DefaultEngine()", Engine)
+    with pytest.raises(ModuleNotFoundError):
+        registry.load_class("no_such_module", "Engine", Engine)
+
+
+def test_load_class_wrong_type():
+    with pytest.raises(TypeError):
+        registry.load_class("fix_protocol", "FixProtocol", Engine)
+    with pytest.raises(TypeError):
+        registry.load_class("default_engine", "logging", Engine)
+
+
+def test_builtin_plugins():
+    assert registry.engines.get("default") is DefaultEngine
+    assert registry.protocols.get("fix42") is FixProtocol
+    assert registry.engines.get("nonesuch") is None
+
+
+def test_entry_points(monkeypatch):
+    entry_points = [
+        EntryPoint("other", "exsim.default_engine:DefaultEngine"),
+        EntryPoint("default", "exsim.engine:Engine"),
+    ]
+    monkeypatch.setattr(registry, "_entry_points",
+                        lambda group: entry_points)
+
+    engines = registry.Registry(registry.ENGINE_GROUP, Engine)
+    assert engines.names() == ["default", "other"]
+    assert engines.get("other") is DefaultEngine
+
+    # Built-in plugins can't be replaced.
+    assert engines.get("default") is DefaultEngine
+
+
+def test_server_uses_plugins_by_name():
+    server = Server(management=False)
+    engine = server.create_engine("e1", "default")
+    assert isinstance(engine, DefaultEngine)
+
+    server.create_endpoint("ep1", 0, "fix42", "e1")
+    server.delete_endpoint("ep1")
+
+    with pytest.raises(KeyError):
+        server.create_engine("e2", "nonesuch")
@@ -0,0 +1,163 @@
+# -*- coding: utf-8 -*-
+########################################################################
+# exsim - Exchange Simulator
+# Copyright (C) 2022-2023, zeroXone.
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see http://www.gnu.org/licenses/
+#
+########################################################################
+
+import select
+import socket
+
+from exsim.fix_protocol import FixProtocol
+from exsim.protocol import Protocol
+from exsim.server import Server
+from exsim.session import Session
+
+from fixtures import FakeEndpoint, FakeServer, new_order
+
+
+def make_session(protocol=Protocol):
+    ours, theirs = socket.socketpair()
+    ours.setblocking(False)
+    session = Session(ours, "peer", FakeEndpoint(protocol))
+    server = FakeServer()
+    session.set_server(server)
+    return session, server, theirs
+
+
+def test_coalesced_send():
+    session, server, peer = make_session()
+    session.send(b"one")
+    session.send(b"two")
+    session.send(b"three")
+    assert server.flushes == [session]
+    assert select.select([peer], [], [], 0)[0] == []
+
+    session.flush()
+    assert peer.recv(100) == b"onetwothree"
+    assert not server.watching
+
+
+def test_backpressure():
+    session, server, peer = make_session()
+    chunk = b"x" * 65536
+    for _ in range(64):
+        session.send(chunk)
+    session.flush()
+    assert server.watching
+
+    # Further sends are buffered until the socket is writable.
+    session.send(b"end")
+    assert len(server.flushes) == 1
+
+    received = b""
+    while server.watching:
+        received += peer.recv(1 << 20)
+        session.writable()
+    while len(received) < 64 * 65536 + 3:
+        received += peer.recv(1 << 20)
+    assert received.endswith(b"xend")
+
+
+def test_slow_consumer():
+    session, server, peer = make_session()
+    session.max_output_size = 1024 * 1024
+    for _ in range(64):
+        session.send(b"x" * 65536)
+    session.flush()
+    assert server.closing == [session]
+    assert session.output_size() == 0
+
+
+def test_slow_consumer_blocked():
+    session, server, peer = make_session()
+    session.max_output_size = 1024 * 1024
+    while not server.watching:
+        session.send(b"x" * 65536)
+        session.flush()
+
+    # Write-blocked: send() alone must enforce the limit.
+    for _ in range(32):
+        session.send(b"x" * 65536)
+    assert server.closing == [session]
+
+
+def test_slow_consumer_closed_mid_pass(monkeypatch):
+    # A session closed while another's events are dispatched must not
+    # have its own events, later in the same ready list, dispatched.
+    server = Server(management=False)
+    server.create_engine("e1", "default")
+    server.create_endpoint("ep1", 0, "fix42", "e1")
+    listener = server._endpoints["ep1"].socket()
+    port = listener.getsockname()[1]
+    peers = [socket.create_connection(("127.0.0.1", port)) for _ in "ab"]
+    for _ in peers:
+        server.create_session(listener)
+    slow, fast = server.sessions()
+
+    # Small, fixed buffers, so the slow session stays write-blocked.
+    peers[0].setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, 4096)
+    slow.socket().setsockopt(socket.SOL_SOCKET, socket.SO_SNDBUF, 4096)
+    slow.max_output_size = 1024 * 1024
+    while slow.output_size() < 65536:
+        slow.send(b"x" * 65536)
+        slow.flush()
+
+    def deliver_batch(messages):
+        slow.send(b"x" * slow.max_output_size)
+        server.stop()
+    monkeypatch.setattr(fast.engine(), "deliver_batch", deliver_batch)
+
+    select = server._selector.select
+    monkeypatch.setattr(
+        server._selector, "select",
+        lambda timeout: sorted(select(timeout),
+                               key=lambda r: r[0].fileobj is slow.socket()))
+
+    peers[0].sendall(b"8=FIX.4.2\x01")
+    peers[1].sendall(new_order("1"))
+    server.run()
+    assert server.sessions() == []
+    for peer in peers:
+        peer.close()
+
+
+def test_read_batch():
+    session, server, peer = make_session(FixProtocol)
+    peer.sendall(b"".join(new_order(str(i)) for i in range(100)))
+    session.readable()
+
+    batches = session.engine().batches
+    assert len(batches) == 1
+    assert [m.client_order_id for m in batches[0]] == \
+        [str(i) for i in range(100)]
+
+
+def test_read_budget():
+    session, server, peer = make_session(FixProtocol)
+    session.read_budget = 1000
+    peer.sendall(b"".join(new_order(str(i)) for i in range(100)))
+
+    session.readable()
+    assert 0 < len(session.engine().batches[0]) < 100
+
+    while not server.closed and sum(map(len, session.engine().batches)) < 100:
+        session.readable()
+    assert sum(map(len, session.engine().batches)) == 100
+
+    peer.close()
+    session.readable()
+    assert server.closed
@@ -0,0 +1,153 @@
+# -*- coding: utf-8 -*-
+########################################################################
+# exsim - Exchange Simulator
+# Copyright (C) 2022-2023, zeroXone.
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see http://www.gnu.org/licenses/
+#
+########################################################################
+
+import logging
+import os
+import socket
+import threading
+import time
+
+import pytest
+
+from exsim.shard import Shard, ShardedServer, _run_shard
+
+
+def test_shard_engines():
+    server = ShardedServer(2)
+    try:
+        assert server.get_shard_count() == 2
+
+        server.load_engine("default", "default_engine", "DefaultEngine")
+        server.load_protocol("fix", "fix_protocol", "FixProtocol")
+        server.create_engine("e1", "default")
+        server.create_engine("e2", "default")
+
+        # Engines are spread across the workers.
+        assert server._engine_shards["e1"] is not server._engine_shards["e2"]
+
+        with pytest.raises(KeyError):
+            server.create_engine("e1", "default")
+
+        # Endpoint listens in the worker that owns its engine.
+        probe = socket.socket()
+        probe.bind(("127.0.0.1", 0))
+        port = probe.getsockname()[1]
+        probe.close()
+
+        server.create_endpoint("ep1", port, "fix", "e2")
+        client = socket.create_connection(("127.0.0.1", port))
+        client.close()
+
+        server.delete_engine("e1")
+        with pytest.raises(KeyError):
+            server.start_engine("e1")
+    finally:
+        server.stop_shards()
+
+
+def test_shard_failure_status():
+    # A worker that can't start exits with a failure status.
+    ours, theirs = socket.socketpair()
+    theirs.close()
+    pid = os.fork()
+    if pid == 0:
+        _run_shard(theirs)
+    ours.close()
+    _, status = os.waitpid(pid, 0)
+    assert os.WIFEXITED(status)
+    assert os.WEXITSTATUS(status) == 1
+
+
+def test_shard_forwarding():
+    server = ShardedServer(2)
+    try:
+        server.load_engine("default", "default_engine", "DefaultEngine")
+        server.load_protocol("fix", "fix_protocol", "FixProtocol")
+        server.create_engine("e1", "default")
+        server.create_endpoint("ep1", 0, "fix", "e1")
+
+        book = server.get_book_snapshot("e1", "ABC")
+        assert book == {"symbol": "ABC", "bids": [], "offers": []}
+
+        # Properties are set in the owning worker, which rejects them.
+        with pytest.raises(Exception, match="No such engine property"):
+            server.set_engine_property("e1", "colour", "red")
+        with pytest.raises(Exception, match="No such endpoint property"):
+            server.set_endpoint_property("ep1", "colour", "red")
+        with pytest.raises(KeyError):
+            server.get_book_snapshot("e2", "ABC")
+    finally:
+        server.stop_shards()
+
+
+class FakeManager:
+    def __init__(self):
+        self.messages = []
+
+    def send(self, message):
+        self.messages.append(message)
+
+
+def test_shard_events():
+    server = ShardedServer(1)
+    thread = threading.Thread(target=server.run)
+    try:
+        server.load_engine("default", "default_engine", "DefaultEngine")
+        server.load_protocol("fix", "fix_protocol", "FixProtocol")
+        server.create_engine("e1", "default")
+        probe = socket.socket()
+        probe.bind(("127.0.0.1", 0))
+        port = probe.getsockname()[1]
+        probe.close()
+        server.create_endpoint("ep1", port, "fix", "e1")
+
+        manager = FakeManager()
+        server.subscribe(manager, ["session"])
+        thread.start()
+
+        # Worker's session event is republished by the supervisor.
+        client = socket.create_connection(("127.0.0.1", port))
+        deadline = time.time() + 5.0
+        while not manager.messages and time.time() < deadline:
+            time.sleep(0.01)
+        client.close()
+
+        assert manager.messages[0]["event"] == "session"
+        assert manager.messages[0]["data"]["state"] == "opened"
+        assert manager.messages[0]["data"]["endpoint"] == "ep1"
+    finally:
+        if thread.is_alive():
+            server.call_soon_threadsafe(server.stop)
+            thread.join()
+        else:
+            server.stop_shards()
+
+
+def test_shard_close_status(caplog):
+    # A failed worker is reported when it's stopped.
+    ours, theirs = socket.socketpair()
+    pid = os.fork()
+    if pid == 0:
+        os._exit(1)
+    theirs.close()
+
+    with caplog.at_level(logging.ERROR, logger="exsim.server"):
+        Shard(0, ours, pid).close()
+    assert "Shard 0 failed, exit status 1" in caplog.text
@@ -0,0 +1,77 @@
+# -*- coding: utf-8 -*-
+########################################################################
+# exsim - Exchange Simulator
+# Copyright (C) 2022-2023, zeroXone.
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see http://www.gnu.org/licenses/
+#
+########################################################################
+
+from exsim.timer import TimerQueue
+
+
+def test_timer_order():
+    fired = []
+    q = TimerQueue()
+    q.add(3.0, lambda: fired.append(3))
+    q.add(1.0, lambda: fired.append(1))
+    q.add(2.0, lambda: fired.append(2))
+
+    assert q.next_expiry() == 1.0
+    assert q.expire(2.5) == 2
+    assert fired == [1, 2]
+    assert len(q) == 1
+    assert q.next_expiry() == 3.0
+
+
+def test_timer_cancel():
+    fired = []
+    q = TimerQueue()
+    t1 = q.add(1.0, lambda: fired.append(1))
+    q.add(2.0, lambda: fired.append(2))
+
+    q.cancel(t1)
+    assert len(q) == 1
+    assert q.next_expiry() == 2.0
+
+    q.expire(5.0)
+    assert fired == [2]
+    assert q.next_expiry() is None
+
+
+def test_timer_cancel_from_callback():
+    fired = []
+    q = TimerQueue()
+    t2 = None
+
+    def first():
+        fired.append(1)
+        t2.cancel()
+
+    q.add(1.0, first)
+    t2 = q.add(1.0, lambda: fired.append(2))
+
+    q.expire(1.0)
+    assert fired == [1]
+    assert len(q) == 0
+
+
+def test_timer_rebuild():
+    q = TimerQueue()
+    handles = [q.add(float(i), lambda: None) for i in range(100)]
+    for t in handles[:90]:
+        t.cancel()
+
+    assert len(q) == 10
+    assert q.next_expiry() == 90.0
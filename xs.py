@@ -1,9 +1,24 @@
 #! /usr/bin/env python
 
+import argparse
+
 import exsim
+from exsim import log
 
 
 def main():
+    parser = argparse.ArgumentParser(description="Exchange simulator.")
+    parser.add_argument("--log", default="xs.log",
+                        help="log file name (default: xs.log)")
+    parser.add_argument("--log-level", default="INFO",
+                        help="initial level for all subsystems "
+                             "(default: INFO)")
+    parser.add_argument("--binary-log", action="store_true",
+                        help="write the log in the compact binary format; "
+                             "read it with 'python -m exsim.log'")
+    args = parser.parse_args()
+
+    log.start(args.log, args.log_level, args.binary_log)
 
     # Server
     server = exsim.Server()
@@ -14,7 +29,10 @@ def main():
     server.create_engine("default", "default")
     server.load_protocol("fix42", "fix_protocol", "FixProtocol")
     server.create_endpoint("fix", 10101, "fix42", "default")
-    server.run()
+    try:
+        server.run()
+    finally:
+        log.stop()
     return
 
 